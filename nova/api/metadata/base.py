@@ -307,20 +307,8 @@ class InstanceMetadata():
         return VERSIONS.index(requested) >= VERSIONS.index(required)
 
     def lookup(self, path):
-        if path == "" or path[0] != "/":
-            path = os.path.normpath("/" + path)
-        else:
-            path = os.path.normpath(path)
-
-        # fix up requests, prepending /ec2 to anything that does not match
+        path = normalize_path(path)
         path_tokens = path.split('/')[1:]
-        if path_tokens[0] not in ("ec2", "openstack"):
-            if path_tokens[0] == "":
-                # request for /
-                path_tokens = ["ec2"]
-            else:
-                path_tokens = ["ec2"] + path_tokens
-            path = "/" + "/".join(path_tokens)
 
         # all values of 'path' input starts with '/' and have no trailing /
 
@@ -342,6 +330,36 @@ class InstanceMetadata():
 
         return data
 
+    def get_rendered_paths(self):
+        """Returns the response body of every path lookup() finds, as a
+        dict keyed by the path as normalize_path() returns it."""
+        paths = {}
+
+        def add_tree(path, data):
+            paths[path] = ec2_md_print(data)
+            if isinstance(data, dict):
+                for key, value in data.iteritems():
+                    add_tree('%s/%s' % (path, key), value)
+
+        paths['/ec2'] = ec2_md_print(VERSIONS + ["latest"])
+        for version in VERSIONS + ["latest"]:
+            add_tree('/ec2/%s' % version, self.get_ec2_metadata(version))
+
+        paths['/openstack'] = ec2_md_print(OPENSTACK_VERSIONS + ["latest"])
+        for version in OPENSTACK_VERSIONS + ["latest"]:
+            path = '/openstack/%s' % version
+            listing = self.lookup(path)
+            paths[path] = ec2_md_print(listing)
+            for name in listing:
+                item_path = '%s/%s' % (path, name)
+                paths[item_path] = ec2_md_print(self.lookup(item_path))
+
+        for (cid, content) in self.content.iteritems():
+            path = '/%s/%s/%s' % ("openstack", CONTENT_DIR, cid)
+            paths[path] = ec2_md_print(content)
+
+        return paths
+
     def metadata_for_config_drive(self):
         """Yields (path, value) tuples for metadata elements."""
         # EC2 style metadata
@@ -383,6 +401,26 @@ def get_metadata_by_address(address):
     return InstanceMetadata(instance, address)
 
 
+def normalize_path(path):
+    """Returns a metadata path as lookup() resolves it: absolute, without
+    trailing /, and prefixed with /ec2 unless under /openstack."""
+    if path == "" or path[0] != "/":
+        path = os.path.normpath("/" + path)
+    else:
+        path = os.path.normpath(path)
+
+    # fix up requests, prepending /ec2 to anything that does not match
+    path_tokens = path.split('/')[1:]
+    if path_tokens[0] not in ("ec2", "openstack"):
+        if path_tokens[0] == "":
+            # request for /
+            path_tokens = ["ec2"]
+        else:
+            path_tokens = ["ec2"] + path_tokens
+        path = "/" + "/".join(path_tokens)
+    return path
+
+
 def _format_instance_mapping(ctxt, instance):
     bdms = db.block_device_mapping_get_all_by_instance(ctxt, instance['uuid'])
     return block_device.instance_block_mapping(instance, bdms)
@@ -17,20 +17,46 @@
 #    under the License.
 
 """Metadata request handler."""
+import atexit
+import hashlib
 import os
+import shutil
+import tempfile
+import uuid
 
+import webob
 import webob.dec
 import webob.exc
 
 from nova.api.metadata import base
+from nova.common import filecache
 from nova import exception
 from nova import flags
+from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova import wsgi
 
+metadata_handler_opts = [
+    cfg.IntOpt('metadata_cache_expiration',
+               default=15,
+               help='Time in seconds to cache the metadata responses of an '
+                    'instance. With memcached_servers set and the '
+                    'nova.api.metadata.notifier notification driver, the '
+                    'responses are dropped as soon as the instance changes, '
+                    'so this can be raised.'),
+    cfg.StrOpt('metadata_cache_dir',
+               default=None,
+               help='Directory where the metadata_workers processes share '
+                    'their cached responses when memcached_servers is not '
+                    'set. Defaults to a temporary directory, on /dev/shm if '
+                    'there is one, removed when the service stops.'),
+    ]
+
 LOG = logging.getLogger(__name__)
 FLAGS = flags.FLAGS
+FLAGS.register_opts(metadata_handler_opts)
 flags.DECLARE('use_forwarded_for', 'nova.api.auth')
+flags.DECLARE('metadata_workers', 'nova.service')
 
 if FLAGS.memcached_servers:
     import memcache
@@ -38,29 +64,139 @@ else:
     from nova.common import memorycache as memcache
 
 
+def responses_cache_key(address):
+    """Returns the cache key of the responses for a fixed address."""
+    return 'metadata-%s' % address
+
+
+def body_cache_key(etag):
+    """Returns the cache key of a response body."""
+    return 'metadata-body-%s' % etag
+
+
+def instance_cache_key(instance_uuid):
+    """Returns the cache key of the token of an instance, which its cached
+    responses are only valid with."""
+    return 'metadata-instance-%s' % instance_uuid
+
+
+def _get_cache():
+    """Returns the cache of the metadata responses.
+
+    Without memcached_servers, the processes of the metadata_workers share
+    a file cache, so that a response rendered by one of them is served by
+    all the others.  The handler is loaded before the workers are forked,
+    so they all get the same directory.
+    """
+    if FLAGS.memcached_servers or (FLAGS.metadata_workers or 0) <= 1:
+        return memcache.Client(FLAGS.memcached_servers, debug=0)
+
+    directory = FLAGS.metadata_cache_dir
+    if not directory:
+        shm = '/dev/shm'
+        directory = tempfile.mkdtemp(prefix='nova-metadata-',
+                                     dir=shm if os.path.isdir(shm) else None)
+        # The workers leave through os._exit(), so only the parent process
+        # removes it.
+        atexit.register(shutil.rmtree, directory, True)
+    LOG.info(_('Sharing the metadata cache of the workers in %s'), directory)
+    return filecache.Client(directory)
+
+
 class MetadataRequestHandler(wsgi.Application):
     """Serve metadata."""
 
     def __init__(self):
-        self._cache = memcache.Client(FLAGS.memcached_servers, debug=0)
+        self._cache = _get_cache()
 
     def get_metadata(self, address):
         if not address:
             raise exception.FixedIpNotFoundForAddress(address=address)
 
-        cache_key = 'metadata-%s' % address
-        data = self._cache.get(cache_key)
-        if data:
-            return data
-
         try:
-            data = base.get_metadata_by_address(address)
+            return base.get_metadata_by_address(address)
         except exception.NotFound:
             return None
 
-        self._cache.set(cache_key, data, 15)
-
-        return data
+    def _get_token(self, instance_uuid):
+        """Returns the token of an instance, which is dropped to invalidate
+        its cached responses, creating it if needed.
+
+        The token is only ever added, never read, modified and set again,
+        so the workers sharing the cache can't overwrite each other's.
+        """
+        cache_key = instance_cache_key(instance_uuid)
+        token = self._cache.get(cache_key)
+        if token is None:
+            token = str(uuid.uuid4())
+            if not self._cache.add(cache_key, token,
+                                   FLAGS.metadata_cache_expiration):
+                token = self._cache.get(cache_key) or token
+        return token
+
+    def _render_responses(self, address):
+        """Renders and caches the responses of the instance with a fixed
+        address, and returns their etags by normalized path and their
+        bodies by etag, or (None, None) if there is no such instance.
+
+        The bodies are cached on their own, keyed by their etag, so that
+        the user data served under several paths is only stored once, and
+        no cached value grows with the number of paths.
+        """
+        meta_data = self.get_metadata(address)
+        if meta_data is None:
+            return None, None
+        token = self._get_token(meta_data.uuid)
+
+        responses = {}
+        bodies = {}
+        for path, body in meta_data.get_rendered_paths().iteritems():
+            if isinstance(body, unicode):
+                body = body.encode('utf-8')
+            etag = hashlib.sha256(body).hexdigest()
+            responses[path] = etag
+            bodies[etag] = body
+
+        expiration = FLAGS.metadata_cache_expiration
+        self._cache.set_multi(dict((body_cache_key(etag), body)
+                                   for etag, body in bodies.iteritems()),
+                              expiration)
+        self._cache.set(responses_cache_key(address),
+                        (meta_data.uuid, token, responses), expiration)
+
+        return responses, bodies
+
+    def get_responses(self, address):
+        """Returns the etag of the response to every metadata path of the
+        instance with a fixed address, by normalized path, or None if there
+        is no such instance.
+
+        All the responses are rendered on the first request, and cached,
+        so that the following requests don't have to look up the instance
+        or render anything.
+        """
+        cached = self._cache.get(responses_cache_key(address))
+        if cached:
+            instance_uuid, token, responses = cached
+            if self._cache.get(instance_cache_key(instance_uuid)) == token:
+                return responses
+        return self._render_responses(address)[0]
+
+    def get_body(self, address, path, etag):
+        """Returns the etag and the body of the response to a normalized
+        path with an etag, or (None, None) if there is no such response.
+
+        If the body was dropped from the cache, the responses of the
+        instance with a fixed address are rendered again, and the new
+        response to the path is returned, as the instance may have changed
+        since the etag was cached.
+        """
+        body = self._cache.get(body_cache_key(etag))
+        if body is None:
+            responses, bodies = self._render_responses(address)
+            etag = responses and responses.get(path)
+            body = etag and bodies[etag]
+        return etag, body
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
@@ -71,8 +207,14 @@ class MetadataRequestHandler(wsgi.Application):
         if os.path.normpath("/" + req.path_info) == "/":
             return(base.ec2_md_print(base.VERSIONS + ["latest"]))
 
+        path = base.normalize_path(req.path_info)
         try:
-            meta_data = self.get_metadata(remote_address)
+            responses = self.get_responses(remote_address)
+            etag = responses and responses.get(path)
+            if etag:
+                etag, body = self.get_body(remote_address, path, etag)
+            else:
+                body = None
         except Exception:
             LOG.exception(_('Failed to get metadata for ip: %s'),
                           remote_address)
@@ -80,13 +222,11 @@ class MetadataRequestHandler(wsgi.Application):
                     'Please try your request again.')
             exc = webob.exc.HTTPInternalServerError(explanation=unicode(msg))
             return exc
-        if meta_data is None:
+        if responses is None:
             LOG.error(_('Failed to get metadata for ip: %s'), remote_address)
             raise webob.exc.HTTPNotFound()
 
-        try:
-            data = meta_data.lookup(req.path_info)
-        except base.InvalidMetadataPath:
+        if body is None:
             raise webob.exc.HTTPNotFound()
 
-        return base.ec2_md_print(data)
+        return webob.Response(body=body, etag=etag, conditional_response=True)
@@ -0,0 +1,63 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Notification driver dropping the cached metadata responses of instances.
+
+Add it to the notification_driver flag of the services which update the
+instances, with memcached_servers set to the memcached servers of the
+metadata service.  Each compute.instance notification, which includes the
+compute.instance.metadata.update ones sent when the metadata of an instance
+changes, then drops the cached responses of the instance, so that its next
+metadata request sees the change.
+"""
+
+from nova.api.metadata import handler
+from nova import flags
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+FLAGS = flags.FLAGS
+
+_CACHE = None
+
+
+def _get_cache():
+    global _CACHE
+    if _CACHE is None:
+        import memcache
+        _CACHE = memcache.Client(FLAGS.memcached_servers, debug=0)
+    return _CACHE
+
+
+def invalidate_instance(cache, instance_uuid):
+    """Drops the cached metadata responses of an instance, by dropping
+    the token they are only valid with."""
+    if cache.delete(handler.instance_cache_key(instance_uuid)):
+        LOG.debug(_("Dropped the cached metadata of %s"), instance_uuid)
+
+
+def notify(context, message):
+    """Drops the cached metadata responses of the instance the message is
+    about, if any."""
+    if not FLAGS.memcached_servers:
+        # The cache of the metadata service is in its own process.
+        return
+    if not message['event_type'].startswith('compute.instance.'):
+        return
+    instance_uuid = message['payload'].get('instance_id')
+    if instance_uuid:
+        invalidate_instance(_get_cache(), instance_uuid)
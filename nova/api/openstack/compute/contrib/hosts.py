@@ -239,7 +239,8 @@ class HostController(object):
         except exception.ComputeHostNotFound:
             raise webob.exc.HTTPNotFound(explanation=_("Host not found"))
         instance_refs = db.instance_get_all_by_host(context,
-                                                    compute_ref['host'])
+                                                    compute_ref['host'],
+                                                    columns_to_join=[])
 
         # Getting total available/used resource
         compute_ref = compute_ref['compute_node'][0]
@@ -529,19 +529,33 @@ class Controller(wsgi.Controller):
             else:
                 search_opts['user_id'] = context.user_id
 
+        # The index view only shows ids, names and links, so don't load
+        # any related tables for it.  The detail view needs the metadata
+        # too, but joining it in multiplies the rows returned for each
+        # instance, so it is loaded separately.
+        if is_detail:
+            columns_to_join = ['info_cache', 'security_groups',
+                               'instance_type']
+        else:
+            columns_to_join = []
+
         limit, marker = common.get_limit_and_marker(req)
         try:
             instance_list = self.compute_api.get_all(context,
-                                                     search_opts=search_opts,
-                                                     limit=limit,
-                                                     marker=marker)
+                    search_opts=search_opts, limit=limit, marker=marker,
+                    columns_to_join=columns_to_join)
         except exception.MarkerNotFound as e:
             msg = _('marker [%s] not found') % marker
             raise webob.exc.HTTPBadRequest(explanation=msg)
 
         if is_detail:
             self._add_instance_faults(context, instance_list)
-            response = self._view_builder.detail(req, instance_list)
+            # NOTE: The metadata is handed to the view as it is, as the
+            # instances may be models whose metadata can't be set.
+            metadata = self.compute_api.get_instances_metadata(context,
+                                                               instance_list)
+            response = self._view_builder.detail(req, instance_list,
+                                                 metadata=metadata)
         else:
             response = self._view_builder.index(req, instance_list)
         req.cache_db_instances(instance_list)
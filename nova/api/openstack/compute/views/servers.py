@@ -54,11 +54,11 @@ class ViewBuilder(common.ViewBuilder):
         self._image_builder = views_images.ViewBuilder()
 
     def _skip_precooked(func):
-        def wrapped(self, request, instance):
+        def wrapped(self, request, instance, *args, **kwargs):
             if instance.get("_is_precooked"):
                 return dict(server=instance)
             else:
-                return func(self, request, instance)
+                return func(self, request, instance, *args, **kwargs)
         return wrapped
 
     def create(self, request, instance):
@@ -86,8 +86,14 @@ class ViewBuilder(common.ViewBuilder):
         }
 
     @_skip_precooked
-    def show(self, request, instance):
-        """Detailed view of a single instance."""
+    def show(self, request, instance, metadata=None):
+        """Detailed view of a single instance.
+
+        metadata is the metadata of the instance as a dict, when it was
+        loaded apart from the instance.
+        """
+        if metadata is None:
+            metadata = self._get_metadata(instance)
         server = {
             "server": {
                 "id": instance["uuid"],
@@ -95,7 +101,7 @@ class ViewBuilder(common.ViewBuilder):
                 "status": self._get_vm_state(instance),
                 "tenant_id": instance.get("project_id") or "",
                 "user_id": instance.get("user_id") or "",
-                "metadata": self._get_metadata(instance),
+                "metadata": metadata,
                 "hostId": self._get_host_id(instance) or "",
                 "image": self._get_image(request, instance),
                 "flavor": self._get_flavor(request, instance),
@@ -122,9 +128,19 @@ class ViewBuilder(common.ViewBuilder):
         """Show a list of servers without many details."""
         return self._list_view(self.basic, request, instances)
 
-    def detail(self, request, instances):
-        """Detailed view of a list of instance."""
-        return self._list_view(self.show, request, instances)
+    def detail(self, request, instances, metadata=None):
+        """Detailed view of a list of instance.
+
+        metadata is the metadata of the instances as dicts keyed by uuid,
+        when it was loaded apart from the instances.
+        """
+        if metadata is None:
+            return self._list_view(self.show, request, instances)
+
+        def show(request, instance):
+            return self.show(request, instance,
+                             metadata.get(instance['uuid'], {}))
+        return self._list_view(show, request, instances)
 
     def _list_view(self, func, request, servers):
         """Provide a view for a list of servers."""
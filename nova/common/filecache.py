@@ -0,0 +1,176 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Fake memcache client sharing its keys between processes through files.
+
+Each key is a file of a directory, named after the hash of the key, so that
+the processes forked by a service with several workers see the keys set by
+the others.  Pointing the directory at a tmpfs such as /dev/shm keeps the
+keys in memory.  Values are replaced by renaming a new file over the old
+one, so readers never see a partial value.  The modification time of each
+file is set to the time its key expires, or to 0 if it never does, so that
+expired files are purged without reading them.
+"""
+
+import cPickle as pickle
+import errno
+import fcntl
+import hashlib
+import os
+import tempfile
+
+from nova.openstack.common import timeutils
+
+# Number of sets of a process between two scans for expired files.
+PURGE_INTERVAL = 100
+
+_LOCK_FILE = '.lock'
+
+
+class Client(object):
+    """Replicates a tiny subset of memcached client interface."""
+
+    def __init__(self, directory, *args, **kwargs):
+        """Shares the keys in directory, which is created if needed, and
+        ignores the other passed in args."""
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._sets = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest())
+
+    def _read(self, path):
+        """Returns the (timeout, value) stored in path, or None if there
+        is no such key or it has expired."""
+        try:
+            with open(path, 'rb') as f:
+                timeout, value = pickle.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        except (EOFError, pickle.UnpicklingError):
+            return None
+        if timeout and timeout <= timeutils.utcnow_ts():
+            return None
+        return timeout, value
+
+    def _timeout(self, time):
+        if time == 0:
+            return 0
+        return timeutils.utcnow_ts() + time
+
+    def _write(self, value, timeout):
+        """Writes a new value to a temporary file, and returns its path."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((timeout, value), f, pickle.HIGHEST_PROTOCOL)
+        os.utime(tmp_path, (timeout, timeout))
+        return tmp_path
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+        return True
+
+    def _locked(self):
+        """Returns the open lock file of the directory, locked exclusively
+        until it is closed."""
+        f = open(os.path.join(self.directory, _LOCK_FILE), 'a')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _purge(self):
+        """Drops the files of the keys which have expired, as told by
+        their modification time, every PURGE_INTERVAL sets."""
+        self._sets += 1
+        if self._sets % PURGE_INTERVAL:
+            return
+        now = timeutils.utcnow_ts()
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                timeout = os.stat(path).st_mtime
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+            if timeout and timeout <= now:
+                self._unlink(path)
+
+    def get(self, key):
+        """Retrieves the value for a key or None."""
+        entry = self._read(self._path(key))
+        if entry is None:
+            return None
+        return entry[1]
+
+    def get_multi(self, keys, key_prefix=''):
+        """Retrieves the values of several keys, as a dict of the keys
+        found without their key_prefix."""
+        values = {}
+        for key in keys:
+            value = self.get(key_prefix + key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key."""
+        os.rename(self._write(value, self._timeout(time)), self._path(key))
+        self._purge()
+        return True
+
+    def set_multi(self, mapping, time=0, key_prefix='', min_compress_len=0):
+        """Sets the values of several keys, returns the keys that were not
+        stored, which is none of them."""
+        for key, value in mapping.iteritems():
+            self.set(key_prefix + key, value, time)
+        return []
+
+    def add(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key if it doesn't exist."""
+        path = self._path(key)
+        with self._locked():
+            if self._read(path) is not None:
+                return False
+            os.rename(self._write(value, self._timeout(time)), path)
+        return True
+
+    def delete(self, key, time=0):
+        """Deletes the value for a key."""
+        return self._unlink(self._path(key))
+
+    def incr(self, key, delta=1):
+        """Increments the value for a key."""
+        path = self._path(key)
+        with self._locked():
+            entry = self._read(path)
+            if entry is None:
+                return None
+            timeout, value = entry
+            new_value = int(value) + delta
+            os.rename(self._write(str(new_value), timeout), path)
+        return new_value
@@ -16,49 +16,240 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-"""Super simple fake memcache client."""
+"""Super simple fake memcache client.
 
+The cache is bounded: once it holds memorycache_max_entries keys, or its
+values add up to more than memorycache_max_bytes, the least recently used
+keys are evicted.  Expired keys are dropped as their time comes, whether
+they are read again or not.
+"""
+
+import cPickle
+import heapq
+import sys
+import threading
+
+from nova import flags
+from nova.openstack.common import cfg
 from nova.openstack.common import timeutils
 
+memorycache_opts = [
+    cfg.IntOpt('memorycache_max_entries',
+               default=10000,
+               help='Maximum number of keys in the in process cache used '
+                    'when memcached_servers is not set, 0 for no limit'),
+    cfg.IntOpt('memorycache_max_bytes',
+               default=0,
+               help='Maximum size in bytes of the values in the in process '
+                    'cache used when memcached_servers is not set, 0 for '
+                    'no limit'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(memorycache_opts)
+
+# The fields of the entries of the cache, which are also the nodes of its
+# doubly linked list from the least to the most recently used key.
+PREV, NEXT, KEY, VALUE, TIMEOUT, SIZE = range(6)
+
+# The timeouts heap is rebuilt from the live entries once it holds more
+# than twice as many entries as the cache, and at least this many.
+MIN_TIMEOUTS_REBUILD = 64
+
+
+def _value_size(value):
+    """Return the size in bytes of a value, as memcached would store it.
+
+    Values other than strings are measured pickled, the way memcache
+    clients send them, rather than by the shallow size of the object.
+    Values which can't be pickled fall back to the latter.
+    """
+    if isinstance(value, basestring):
+        return len(value)
+    try:
+        return len(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+    except (cPickle.PicklingError, TypeError):
+        return sys.getsizeof(value)
+
 
 class Client(object):
     """Replicates a tiny subset of memcached client interface."""
 
     def __init__(self, *args, **kwargs):
-        """Ignores the passed in args."""
+        """Ignores the passed in args, but for the max_entries and
+        max_bytes bounds, which default to the flags."""
+        self.max_entries = kwargs.get('max_entries',
+                                      FLAGS.memorycache_max_entries)
+        self.max_bytes = kwargs.get('max_bytes', FLAGS.memorycache_max_bytes)
         self.cache = {}
+        self._lock = threading.Lock()
+        # The head of the linked list, its NEXT is the least recently used
+        # entry and its PREV the most recently used one.
+        self._root = root = [None] * 6
+        root[PREV] = root[NEXT] = root
+        # (timeout, key) of the keys which expire, including stale ones of
+        # keys which were set again or removed since
+        self._timeouts = []
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
-    def get(self, key):
-        """Retrieves the value for a key or None.
+    def _unlink(self, entry):
+        entry[PREV][NEXT] = entry[NEXT]
+        entry[NEXT][PREV] = entry[PREV]
 
-        this expunges expired keys during each get"""
+    def _link_last(self, entry):
+        root = self._root
+        entry[PREV] = root[PREV]
+        entry[NEXT] = root
+        root[PREV][NEXT] = entry
+        root[PREV] = entry
 
-        for k in self.cache.keys():
-            (timeout, _value) = self.cache[k]
-            if timeout and timeutils.utcnow_ts() >= timeout:
-                del self.cache[k]
+    def _remove(self, entry):
+        self._unlink(entry)
+        del self.cache[entry[KEY]]
+        self._bytes -= entry[SIZE]
 
-        return self.cache.get(key, (0, None))[1]
+    def _expire(self):
+        """Drop the keys which have expired."""
+        now = timeutils.utcnow_ts()
+        timeouts = self._timeouts
+        while timeouts and timeouts[0][0] <= now:
+            timeout, key = heapq.heappop(timeouts)
+            entry = self.cache.get(key)
+            # The key may have been set again since.
+            if entry is not None and entry[TIMEOUT] == timeout:
+                self._remove(entry)
+                self.expirations += 1
 
-    def set(self, key, value, time=0, min_compress_len=0):
-        """Sets the value for a key."""
+    def _rebuild_timeouts(self):
+        """Drop the stale entries of the timeouts heap once they
+        outnumber the live ones."""
+        if len(self._timeouts) <= max(2 * len(self.cache),
+                                      MIN_TIMEOUTS_REBUILD):
+            return
+        self._timeouts = [(entry[TIMEOUT], key)
+                          for key, entry in self.cache.iteritems()
+                          if entry[TIMEOUT]]
+        heapq.heapify(self._timeouts)
+
+    def _evict(self):
+        """Drop the least recently used keys until the cache is in
+        bounds again."""
+        root = self._root
+        while root[NEXT] is not root and (
+                (self.max_entries and len(self.cache) > self.max_entries) or
+                (self.max_bytes and self._bytes > self.max_bytes)):
+            self._remove(root[NEXT])
+            self.evictions += 1
+
+    def _get(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._unlink(entry)
+        self._link_last(entry)
+        return entry[VALUE]
+
+    def _set(self, key, value, time):
         timeout = 0
         if time != 0:
             timeout = timeutils.utcnow_ts() + time
-        self.cache[key] = (timeout, value)
+        entry = self.cache.get(key)
+        if entry is not None:
+            self._remove(entry)
+        if timeout and (entry is None or entry[TIMEOUT] != timeout):
+            heapq.heappush(self._timeouts, (timeout, key))
+        entry = [None, None, key, value, timeout, _value_size(value)]
+        self.cache[key] = entry
+        self._bytes += entry[SIZE]
+        self._link_last(entry)
+        self._rebuild_timeouts()
+
+    def get(self, key):
+        """Retrieves the value for a key or None."""
+        with self._lock:
+            self._expire()
+            return self._get(key)
+
+    def get_multi(self, keys, key_prefix=''):
+        """Retrieves the values of several keys, as a dict of the keys
+        found without their key_prefix."""
+        with self._lock:
+            self._expire()
+            values = {}
+            for key in keys:
+                value = self._get(key_prefix + key)
+                if value is not None:
+                    values[key] = value
+            return values
+
+    def set(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key."""
+        with self._lock:
+            self._expire()
+            self._set(key, value, time)
+            self._evict()
         return True
 
+    def set_multi(self, mapping, time=0, key_prefix='', min_compress_len=0):
+        """Sets the values of several keys, returns the keys that were not
+        stored, which is none of them."""
+        with self._lock:
+            self._expire()
+            for key, value in mapping.iteritems():
+                self._set(key_prefix + key, value, time)
+            self._evict()
+        return []
+
     def add(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key if it doesn't exist."""
-        if not self.get(key) is None:
-            return False
-        return self.set(key, value, time, min_compress_len)
+        with self._lock:
+            self._expire()
+            if key in self.cache:
+                return False
+            self._set(key, value, time)
+            self._evict()
+        return True
+
+    def delete(self, key, time=0):
+        """Deletes the value for a key."""
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return False
+            self._remove(entry)
+        return True
 
     def incr(self, key, delta=1):
         """Increments the value for a key."""
-        value = self.get(key)
-        if value is None:
-            return None
-        new_value = int(value) + delta
-        self.cache[key] = (self.cache[key][0], str(new_value))
+        with self._lock:
+            self._expire()
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+            new_value = int(entry[VALUE]) + delta
+            self._bytes -= entry[SIZE]
+            entry[VALUE] = str(new_value)
+            entry[SIZE] = _value_size(entry[VALUE])
+            self._bytes += entry[SIZE]
         return new_value
+
+    def get_stats(self):
+        """Returns the statistics of the cache, in the same form as
+        memcache clients do for each server."""
+        with self._lock:
+            self._expire()
+            stats = {'curr_items': len(self.cache),
+                     'bytes': self._bytes,
+                     'limit_items': self.max_entries,
+                     'limit_maxbytes': self.max_bytes,
+                     'get_hits': self.hits,
+                     'get_misses': self.misses,
+                     'evictions': self.evictions,
+                     'expirations': self.expirations}
+        return [('memorycache', stats)]
@@ -47,7 +47,11 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
 
     Typically, the id of the last row is used as the client-facing pagination
     marker, then the actual marker object must be fetched from the db and
-    passed in to us as marker.
+    passed in to us as marker.  Only the sort_keys attributes of the marker
+    are used, so a row holding just those columns will do.
+
+    The criteria above are also bounded by k1 >= X1 (or k1 <= X1), which an
+    index on the sort keys can use to seek straight to the marker.
 
     :param query: the query object to which we should add paging/sorting
     :param model: the ORM model class
@@ -120,6 +124,12 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
             criteria_list.append(criteria)
 
         f = sqlalchemy.sql.or_(*criteria_list)
+        if marker_values[0] is not None:
+            model_attr = getattr(model, sort_keys[0])
+            if sort_dirs[0] == 'desc':
+                f = sqlalchemy.sql.and_(model_attr <= marker_values[0], f)
+            else:
+                f = sqlalchemy.sql.and_(model_attr >= marker_values[0], f)
         query = query.filter(f)
 
     if limit is not None:
@@ -1033,7 +1033,8 @@ class API(base.Base):
         return inst
 
     def get_all(self, context, search_opts=None, sort_key='created_at',
-                sort_dir='desc', limit=None, marker=None):
+                sort_dir='desc', limit=None, marker=None,
+                columns_to_join=None):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retrieve
@@ -1045,6 +1046,9 @@ class API(base.Base):
         The results will be returned sorted in the order specified by the
         'sort_dir' parameter using the key specified in the 'sort_key'
         parameter.
+
+        Only the related tables in 'columns_to_join' are loaded with the
+        instances, or all of them if it is None.
         """
 
         #TODO(bcwaldon): determine the best argument for target here
@@ -1110,9 +1114,8 @@ class API(base.Base):
                         return []
 
         inst_models = self._get_instances_by_filters(context, filters,
-                                                     sort_key, sort_dir,
-                                                     limit=limit,
-                                                     marker=marker)
+                sort_key, sort_dir, limit=limit, marker=marker,
+                columns_to_join=columns_to_join)
 
         # Convert the models to dictionaries
         instances = []
@@ -1127,7 +1130,8 @@ class API(base.Base):
     def _get_instances_by_filters(self, context, filters,
                                   sort_key, sort_dir,
                                   limit=None,
-                                  marker=None):
+                                  marker=None,
+                                  columns_to_join=None):
         if 'ip6' in filters or 'ip' in filters:
             res = self.network_api.get_instance_uuids_by_ip_filter(context,
                                                                    filters)
@@ -1137,8 +1141,8 @@ class API(base.Base):
             filters['uuid'] = uuids
 
         return self.db.instance_get_all_by_filters(context, filters,
-                                                   sort_key, sort_dir,
-                                                   limit=limit, marker=marker)
+                sort_key, sort_dir, limit=limit, marker=marker,
+                columns_to_join=columns_to_join)
 
     @wrap_check_policy
     @check_instance_state(vm_state=[vm_states.ACTIVE, vm_states.STOPPED])
@@ -1897,6 +1901,18 @@ class API(base.Base):
         rv = self.db.instance_metadata_get(context, instance['uuid'])
         return dict(rv.iteritems())
 
+    def get_instances_metadata(self, context, instances):
+        """Get all metadata of a list of instances, keyed by uuid."""
+
+        if not instances:
+            return {}
+
+        for instance in instances:
+            check_policy(context, 'get_instance_metadata', instance)
+
+        uuids = [instance['uuid'] for instance in instances]
+        return self.db.instance_metadata_get_by_instance_uuids(context, uuids)
+
     @wrap_check_policy
     @check_instance_lock
     def delete_instance_metadata(self, context, instance, key):
@@ -35,6 +35,7 @@ terminating it.
 """
 
 import contextlib
+import copy
 import functools
 import socket
 import sys
@@ -42,6 +43,7 @@ import time
 import traceback
 
 from eventlet import greenthread
+from eventlet import queue
 
 from nova import block_device
 from nova import compute
@@ -72,6 +74,7 @@ from nova import quota
 from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova import utils
 from nova.virt import driver
+from nova.virt import event as virtevent
 from nova import volume
 
 
@@ -141,6 +144,16 @@ compute_opts = [
     cfg.BoolOpt('instance_usage_audit',
                default=False,
                help="Generate periodic compute.instance.exists notifications"),
+    cfg.IntOpt('sync_power_state_interval',
+               default=600,
+               help="Number of seconds between syncs of the power states "
+                    "with the hypervisor"),
+    cfg.IntOpt('lifecycle_event_sync_interval',
+               default=3600,
+               help="Number of seconds between syncs of the power states "
+                    "with the hypervisor when the compute driver emits "
+                    "lifecycle events, which keep them in sync in the "
+                    "meantime"),
     ]
 
 FLAGS = flags.FLAGS
@@ -210,7 +223,7 @@ def _get_image_meta(context, image_ref):
 class ComputeManager(manager.SchedulerDependentManager):
     """Manages the running instances from creation to destruction."""
 
-    RPC_API_VERSION = '2.2'
+    RPC_API_VERSION = '2.4'
 
     def __init__(self, compute_driver=None, *args, **kwargs):
         """Load configuration options and connect to the hypervisor."""
@@ -233,8 +246,8 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.network_manager = importutils.import_object(
             FLAGS.network_manager, host=kwargs.get('host', None))
         self._last_host_check = 0
-        self._last_bw_usage_poll = 0
-        self._last_info_cache_heal = 0
+        self._last_power_state_sync = 0
+        self._lifecycle_events = queue.LightQueue()
         self.compute_api = compute.API()
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
@@ -287,8 +300,57 @@ class ComputeManager(manager.SchedulerDependentManager):
                         'trying to set it to ERROR'),
                       instance_uuid=instance_uuid)
 
+    def handle_events(self, event):
+        """Queue an event of the virt driver for handling."""
+        if isinstance(event, virtevent.LifecycleEvent):
+            self._lifecycle_events.put(event)
+        else:
+            LOG.debug(_("Ignoring event %s"), event)
+
+    def _handle_lifecycle_events(self):
+        """Handle the queued lifecycle events, one at a time so that the
+        events of an instance are applied in order."""
+        while True:
+            event = self._lifecycle_events.get()
+            try:
+                self.handle_lifecycle_event(event)
+            except Exception:
+                LOG.exception(_("Error handling lifecycle event %s"), event)
+
+    def handle_lifecycle_event(self, event):
+        """Sync the power state of an instance right away when the virt
+        driver tells about it starting, stopping, pausing or resuming."""
+        LOG.info(_("Lifecycle event %(transition)s on VM %(uuid)s") %
+                 {'transition': virtevent.NAMES.get(event.transition),
+                  'uuid': event.uuid})
+        if event.transition == virtevent.EVENT_LIFECYCLE_STOPPED:
+            vm_power_state = power_state.SHUTDOWN
+        elif event.transition == virtevent.EVENT_LIFECYCLE_STARTED:
+            vm_power_state = power_state.RUNNING
+        elif event.transition == virtevent.EVENT_LIFECYCLE_PAUSED:
+            vm_power_state = power_state.PAUSED
+        elif event.transition == virtevent.EVENT_LIFECYCLE_RESUMED:
+            vm_power_state = power_state.RUNNING
+        else:
+            LOG.warning(_("Unexpected lifecycle event %s") % event)
+            return
+
+        context = nova.context.get_admin_context()
+        try:
+            db_instance = self.db.instance_get_by_uuid(context, event.uuid)
+        except exception.InstanceNotFound:
+            # Deleted since, or not an instance at all.
+            return
+        if db_instance['host'] != self.host:
+            # Hypervisors shared by several hosts tell about all their VMs.
+            return
+        self._sync_instance_power_state(context, db_instance,
+                                        vm_power_state)
+
     def init_host(self):
         """Initialization for a standalone compute service."""
+        self.driver.register_event_listener(self.handle_events)
+        greenthread.spawn_n(self._handle_lifecycle_events)
         self.driver.init_host(host=self.host)
         context = nova.context.get_admin_context()
         instances = self.db.instance_get_all_by_host(context, self.host)
@@ -860,6 +922,33 @@ class ComputeManager(manager.SchedulerDependentManager):
                     admin_password, is_first_time, instance)
         do_run_instance()
 
+    def run_instances(self, context, instances, request_spec=None,
+                      filter_properties=None, requested_networks=None,
+                      injected_files=None, admin_password=None,
+                      is_first_time=False):
+        """Run a group of instances scheduled to this host together.
+
+        Each instance is built in its own greenthread, as if it had been
+        sent with its own run_instance cast, with its launch index from the
+        launch_indexes of the request_spec.
+        """
+        launch_indexes = (request_spec or {}).get('launch_indexes') or {}
+        for instance in instances:
+            # NOTE: _run_instance() may modify these on reschedule.
+            instance_spec = copy.deepcopy(request_spec)
+            if instance_spec:
+                instance_spec.pop('launch_indexes', None)
+                if instance['uuid'] in launch_indexes:
+                    instance_spec['instance_properties']['launch_index'] = (
+                            launch_indexes[instance['uuid']])
+            greenthread.spawn_n(self.run_instance, context, instance,
+                    request_spec=instance_spec,
+                    filter_properties=copy.deepcopy(filter_properties),
+                    requested_networks=requested_networks,
+                    injected_files=injected_files,
+                    admin_password=admin_password,
+                    is_first_time=is_first_time)
+
     def _shutdown_instance(self, context, instance):
         """Shutdown an instance on this host."""
         context = context.elevated()
@@ -1420,6 +1509,8 @@ class ComputeManager(manager.SchedulerDependentManager):
         LOG.debug(_("Changing instance metadata according to %(diff)r") %
                   locals(), instance=instance)
         self.driver.change_instance_metadata(context, instance, diff)
+        self._notify_about_instance_usage(context, instance,
+                                          "metadata.update")
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @wrap_instance_fault
@@ -2429,7 +2520,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.driver.destroy(instance, self._legacy_nw_info(network_info),
                             block_device_info)
 
-    @manager.periodic_task
+    @manager.periodic_task(spacing='heal_instance_info_cache_interval')
     def _heal_instance_info_cache(self, context):
         """Called periodically.  On every call, try to update the
         info_cache's network information for another instance by
@@ -2441,13 +2532,8 @@ class ComputeManager(manager.SchedulerDependentManager):
         If anything errors, we don't care.  It's possible the instance
         has been deleted, etc.
         """
-        heal_interval = FLAGS.heal_instance_info_cache_interval
-        if not heal_interval:
+        if not FLAGS.heal_instance_info_cache_interval:
             return
-        curr_time = time.time()
-        if self._last_info_cache_heal + heal_interval > curr_time:
-            return
-        self._last_info_cache_heal = curr_time
 
         instance_uuids = getattr(self, '_instance_uuids_to_heal', None)
         instance = None
@@ -2461,13 +2547,14 @@ class ComputeManager(manager.SchedulerDependentManager):
                     # Instance is gone.  Try to grab another.
                     continue
             else:
-                # No more in our copy of uuids.  Pull from the DB.
+                # No more in our copy of uuids.  Pull from the DB, without
+                # the related tables: only the uuids are needed, and each
+                # instance is fetched in full when its turn comes.
                 db_instances = self.db.instance_get_all_by_host(
-                        context, self.host)
+                        context, self.host, columns_to_join=[])
                 if not db_instances:
                     # None.. just return.
                     return
-                instance = db_instances.pop(0)
                 instance_uuids = [inst['uuid'] for inst in db_instances]
                 self._instance_uuids_to_heal = instance_uuids
 
@@ -2552,10 +2639,8 @@ class ComputeManager(manager.SchedulerDependentManager):
             if not compute_utils.has_audit_been_run(context, self.host):
                 begin, end = utils.last_completed_audit_period()
                 instances = self.db.instance_get_active_by_window_joined(
-                                                            context,
-                                                            begin,
-                                                            end,
-                                                            host=self.host)
+                        context, begin, end, host=self.host,
+                        columns_to_join=['info_cache', 'instance_type'])
                 num_instances = len(instances)
                 errors = 0
                 successes = 0
@@ -2592,73 +2677,82 @@ class ComputeManager(manager.SchedulerDependentManager):
                                               num_instances,
                                               time.time() - start_time))
 
-    @manager.periodic_task
+    @manager.periodic_task(spacing='bandwidth_poll_interval')
     def _poll_bandwidth_usage(self, context):
         prev_time, start_time = utils.last_completed_audit_period()
 
         curr_time = time.time()
-        if (curr_time - self._last_bw_usage_poll >
-                FLAGS.bandwidth_poll_interval):
-            self._last_bw_usage_poll = curr_time
-            LOG.info(_("Updating bandwidth usage cache"))
+        LOG.info(_("Updating bandwidth usage cache"))
 
-            instances = self.db.instance_get_all_by_host(context, self.host)
-            try:
-                bw_counters = self.driver.get_all_bw_counters(instances)
-            except NotImplementedError:
-                # NOTE(mdragon): Not all hypervisors have bandwidth polling
-                # implemented yet.  If they don't it doesn't break anything,
-                # they just don't get the info in the usage events.
-                return
+        instances = self.db.instance_get_all_by_host(context, self.host,
+                                                     columns_to_join=[])
+        try:
+            bw_counters = self.driver.get_all_bw_counters(instances)
+        except NotImplementedError:
+            # NOTE(mdragon): Not all hypervisors have bandwidth polling
+            # implemented yet.  If they don't it doesn't break anything,
+            # they just don't get the info in the usage events.
+            return
+        driver_time = time.time() - curr_time
+
+        # Fetch the usages of both audit periods for all the instances
+        # up front rather than querying for each counter.
+        uuids = list(set(bw_ctr['uuid'] for bw_ctr in bw_counters))
+        usages = {}
+        prev_usages = {}
+        for period, by_mac in ((start_time, usages),
+                               (prev_time, prev_usages)):
+            for usage in self.db.bw_usage_get_by_uuids(context, uuids,
+                                                       period):
+                by_mac[(usage['uuid'], usage['mac'])] = usage
+
+        updates = []
+        for bw_ctr in bw_counters:
+            bw_in = 0
+            bw_out = 0
+            last_ctr_in = None
+            last_ctr_out = None
+            key = (bw_ctr['uuid'], bw_ctr['mac_address'])
+            usage = usages.get(key)
+            if usage:
+                bw_in = usage['bw_in']
+                bw_out = usage['bw_out']
+                last_ctr_in = usage['last_ctr_in']
+                last_ctr_out = usage['last_ctr_out']
+            elif key in prev_usages:
+                usage = prev_usages[key]
+                last_ctr_in = usage['last_ctr_in']
+                last_ctr_out = usage['last_ctr_out']
+
+            if last_ctr_in is not None:
+                if bw_ctr['bw_in'] < last_ctr_in:
+                    # counter rollover
+                    bw_in += bw_ctr['bw_in']
+                else:
+                    bw_in += (bw_ctr['bw_in'] - last_ctr_in)
 
-            refreshed = timeutils.utcnow()
-            for bw_ctr in bw_counters:
-                # Allow switching of greenthreads between queries.
-                greenthread.sleep(0)
-                bw_in = 0
-                bw_out = 0
-                last_ctr_in = None
-                last_ctr_out = None
-                usage = self.db.bw_usage_get(context,
-                                             bw_ctr['uuid'],
-                                             start_time,
-                                             bw_ctr['mac_address'])
-                if usage:
-                    bw_in = usage['bw_in']
-                    bw_out = usage['bw_out']
-                    last_ctr_in = usage['last_ctr_in']
-                    last_ctr_out = usage['last_ctr_out']
+            if last_ctr_out is not None:
+                if bw_ctr['bw_out'] < last_ctr_out:
+                    # counter rollover
+                    bw_out += bw_ctr['bw_out']
                 else:
-                    usage = self.db.bw_usage_get(context,
-                                             bw_ctr['uuid'],
-                                             prev_time,
-                                             bw_ctr['mac_address'])
-                    last_ctr_in = usage['last_ctr_in']
-                    last_ctr_out = usage['last_ctr_out']
-
-                if last_ctr_in is not None:
-                    if bw_ctr['bw_in'] < last_ctr_in:
-                        # counter rollover
-                        bw_in += bw_ctr['bw_in']
-                    else:
-                        bw_in += (bw_ctr['bw_in'] - last_ctr_in)
-
-                if last_ctr_out is not None:
-                    if bw_ctr['bw_out'] < last_ctr_out:
-                        # counter rollover
-                        bw_out += bw_ctr['bw_out']
-                    else:
-                        bw_out += (bw_ctr['bw_out'] - last_ctr_out)
-
-                self.db.bw_usage_update(context,
-                                        bw_ctr['uuid'],
-                                        bw_ctr['mac_address'],
-                                        start_time,
-                                        bw_in,
-                                        bw_out,
-                                        bw_ctr['bw_in'],
-                                        bw_ctr['bw_out'],
-                                        last_refreshed=refreshed)
+                    bw_out += (bw_ctr['bw_out'] - last_ctr_out)
+
+            updates.append(dict(uuid=bw_ctr['uuid'],
+                                mac=bw_ctr['mac_address'],
+                                bw_in=bw_in,
+                                bw_out=bw_out,
+                                last_ctr_in=bw_ctr['bw_in'],
+                                last_ctr_out=bw_ctr['bw_out']))
+
+        self.db.bw_usage_bulk_update(context, start_time, updates,
+                                     last_refreshed=timeutils.utcnow())
+        LOG.info(_("Updated the bandwidth usage of %(count)d interfaces "
+                   "in %(total).2f seconds, %(driver).2f of them "
+                   "polling the hypervisor") %
+                 {'count': len(updates),
+                  'total': time.time() - curr_time,
+                  'driver': driver_time})
 
     @manager.periodic_task
     def _report_driver_status(self, context):
@@ -2675,22 +2769,42 @@ class ComputeManager(manager.SchedulerDependentManager):
                 capability['host_ip'] = FLAGS.my_ip
             self.update_service_capabilities(capabilities)
 
-    @manager.periodic_task(ticks_between_runs=10)
+    @manager.periodic_task(spacing='sync_power_state_interval')
     def _sync_power_states(self, context):
         """Align power states between the database and the hypervisor.
 
-        To sync power state data we make a DB call to get the number of
-        virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        To sync power state data we get the power states of all the virtual
+        machines known by the hypervisor in one call, when the driver supports
+        it, and compare them with the database records in memory.  Only the
+        instances whose power state differs from the database, or doesn't
+        match their vm_state, are looked at any further.  Drivers that can't
+        list the power states are asked for each instance in turn.
 
         If the instance is not found on the hypervisor, but is in the database,
         then a stop() API will be called on the instance.
+
+        When the driver emits lifecycle events, they keep the power states
+        in sync as they change, and this only runs every
+        lifecycle_event_sync_interval seconds to catch any event that was
+        missed.
         """
-        db_instances = self.db.instance_get_all_by_host(context, self.host)
+        if self.driver.lifecycle_events_enabled():
+            curr_time = time.time()
+            if (curr_time - self._last_power_state_sync <
+                    FLAGS.lifecycle_event_sync_interval):
+                return
+            self._last_power_state_sync = curr_time
 
-        num_vm_instances = self.driver.get_num_instances()
+        db_instances = self.db.instance_get_all_by_host(context, self.host,
+                                                        columns_to_join=[])
+
+        try:
+            vm_power_states = self.driver.list_instance_power_states()
+            num_vm_instances = len(vm_power_states)
+        except NotImplementedError:
+            # Fall back to a get_info() call per instance.
+            vm_power_states = None
+            num_vm_instances = self.driver.get_num_instances()
         num_db_instances = len(db_instances)
 
         if num_vm_instances != num_db_instances:
@@ -2704,112 +2818,149 @@ class ComputeManager(manager.SchedulerDependentManager):
                            "pending task. Skip."), instance=db_instance)
                 continue
             # No pending tasks. Now try to figure out the real vm_power_state.
-            try:
-                vm_instance = self.driver.get_info(db_instance)
-                vm_power_state = vm_instance['state']
-            except exception.InstanceNotFound:
-                vm_power_state = power_state.NOSTATE
-            # Note(maoy): the above get_info call might take a long time,
-            # for example, because of a broken libvirt driver.
-            # We re-query the DB to get the latest instance info to minimize
-            # (not eliminate) race condition.
-            u = self.db.instance_get_by_uuid(context,
-                                             db_instance['uuid'])
-            db_power_state = u["power_state"]
-            vm_state = u['vm_state']
-            if self.host != u['host']:
-                # on the sending end of nova-compute _sync_power_state
-                # may have yielded to the greenthread performing a live
-                # migration; this in turn has changed the resident-host
-                # for the VM; However, the instance is still active, it
-                # is just in the process of migrating to another host.
-                # This implies that the compute source must relinquish
-                # control to the compute destination.
-                LOG.info(_("During the sync_power process the "
-                           "instance has moved from "
-                           "host %(src)s to host %(dst)s") %
-                           {'src': self.host,
-                            'dst': u['host']},
-                         instance=db_instance)
-                continue
-            elif u['task_state'] is not None:
-                # on the receiving end of nova-compute, it could happen
-                # that the DB instance already report the new resident
-                # but the actual VM has not showed up on the hypervisor
-                # yet. In this case, let's allow the loop to continue
-                # and run the state sync in a later round
-                LOG.info(_("During sync_power_state the instance has a "
-                           "pending task. Skip."), instance=db_instance)
+            if vm_power_states is not None:
+                vm_power_state = vm_power_states.get(db_instance['name'],
+                                                     power_state.NOSTATE)
+            else:
+                try:
+                    vm_instance = self.driver.get_info(db_instance)
+                    vm_power_state = vm_instance['state']
+                except exception.InstanceNotFound:
+                    vm_power_state = power_state.NOSTATE
+            # Most of the time the hypervisor agrees with the database and
+            # there is nothing more to look at.
+            if (vm_power_state == db_power_state and
+                    self._power_state_in_sync(db_instance['vm_state'],
+                                              vm_power_state)):
                 continue
-            if vm_power_state != db_power_state:
-                # power_state is always updated from hypervisor to db
-                self._instance_update(context,
-                                      db_instance['uuid'],
-                                      power_state=vm_power_state)
-                db_power_state = vm_power_state
-            # Note(maoy): Now resolve the discrepancy between vm_state and
-            # vm_power_state. We go through all possible vm_states.
-            if vm_state in (vm_states.BUILDING,
-                            vm_states.RESCUED,
-                            vm_states.RESIZED,
-                            vm_states.SUSPENDED,
-                            vm_states.PAUSED,
-                            vm_states.ERROR):
-                # TODO(maoy): we ignore these vm_state for now.
-                pass
-            elif vm_state == vm_states.ACTIVE:
-                # The only rational power state should be RUNNING
-                if vm_power_state in (power_state.NOSTATE,
-                                       power_state.SHUTDOWN,
-                                       power_state.CRASHED):
-                    LOG.warn(_("Instance shutdown by itself. Calling "
-                               "the stop API."), instance=db_instance)
-                    try:
-                        # Note(maoy): here we call the API instead of
-                        # brutally updating the vm_state in the database
-                        # to allow all the hooks and checks to be performed.
-                        self.compute_api.stop(context, db_instance)
-                    except Exception:
-                        # Note(maoy): there is no need to propagate the error
-                        # because the same power_state will be retrieved next
-                        # time and retried.
-                        # For example, there might be another task scheduled.
-                        LOG.exception(_("error during stop() in "
-                                        "sync_power_state."),
-                                      instance=db_instance)
-                elif vm_power_state in (power_state.PAUSED,
-                                        power_state.SUSPENDED):
-                    LOG.warn(_("Instance is paused or suspended "
-                               "unexpectedly. Calling "
-                               "the stop API."), instance=db_instance)
-                    try:
-                        self.compute_api.stop(context, db_instance)
-                    except Exception:
-                        LOG.exception(_("error during stop() in "
-                                        "sync_power_state."),
-                                      instance=db_instance)
-            elif vm_state == vm_states.STOPPED:
-                if vm_power_state not in (power_state.NOSTATE,
+            self._sync_instance_power_state(context, db_instance,
+                                            vm_power_state)
+
+    def _sync_instance_power_state(self, context, db_instance, vm_power_state):
+        """Align the power state of an instance in the database with
+        vm_power_state, the power state the hypervisor reports for it, and
+        resolve any discrepancy with its vm_state.
+        """
+        # Note(maoy): getting the power state from the hypervisor might
+        # take a long time, for example, because of a broken libvirt driver.
+        # We re-query the DB to get the latest instance info to minimize
+        # (not eliminate) race condition.
+        u = self.db.instance_get_by_uuid(context,
+                                         db_instance['uuid'])
+        db_power_state = u["power_state"]
+        vm_state = u['vm_state']
+        if self.host != u['host']:
+            # on the sending end of nova-compute _sync_power_state
+            # may have yielded to the greenthread performing a live
+            # migration; this in turn has changed the resident-host
+            # for the VM; However, the instance is still active, it
+            # is just in the process of migrating to another host.
+            # This implies that the compute source must relinquish
+            # control to the compute destination.
+            LOG.info(_("During the sync_power process the "
+                       "instance has moved from "
+                       "host %(src)s to host %(dst)s") %
+                       {'src': self.host,
+                        'dst': u['host']},
+                     instance=db_instance)
+            return
+        elif u['task_state'] is not None:
+            # on the receiving end of nova-compute, it could happen
+            # that the DB instance already report the new resident
+            # but the actual VM has not showed up on the hypervisor
+            # yet. In this case, let's allow the loop to continue
+            # and run the state sync in a later round
+            LOG.info(_("During sync_power_state the instance has a "
+                       "pending task. Skip."), instance=db_instance)
+            return
+        if vm_power_state != db_power_state:
+            # power_state is always updated from hypervisor to db
+            self._instance_update(context,
+                                  db_instance['uuid'],
+                                  power_state=vm_power_state)
+            db_power_state = vm_power_state
+        # Note(maoy): Now resolve the discrepancy between vm_state and
+        # vm_power_state. We go through all possible vm_states.
+        if vm_state in (vm_states.BUILDING,
+                        vm_states.RESCUED,
+                        vm_states.RESIZED,
+                        vm_states.SUSPENDED,
+                        vm_states.PAUSED,
+                        vm_states.ERROR):
+            # TODO(maoy): we ignore these vm_state for now.
+            pass
+        elif vm_state == vm_states.ACTIVE:
+            # The only rational power state should be RUNNING
+            if vm_power_state in (power_state.NOSTATE,
+                                   power_state.SHUTDOWN,
+                                   power_state.CRASHED):
+                LOG.warn(_("Instance shutdown by itself. Calling "
+                           "the stop API."), instance=db_instance)
+                try:
+                    # Note(maoy): here we call the API instead of
+                    # brutally updating the vm_state in the database
+                    # to allow all the hooks and checks to be performed.
+                    self.compute_api.stop(context, u)
+                except Exception:
+                    # Note(maoy): there is no need to propagate the error
+                    # because the same power_state will be retrieved next
+                    # time and retried.
+                    # For example, there might be another task scheduled.
+                    LOG.exception(_("error during stop() in "
+                                    "sync_power_state."),
+                                  instance=db_instance)
+            elif vm_power_state in (power_state.PAUSED,
+                                    power_state.SUSPENDED):
+                LOG.warn(_("Instance is paused or suspended "
+                           "unexpectedly. Calling "
+                           "the stop API."), instance=db_instance)
+                try:
+                    self.compute_api.stop(context, u)
+                except Exception:
+                    LOG.exception(_("error during stop() in "
+                                    "sync_power_state."),
+                                  instance=db_instance)
+        elif vm_state == vm_states.STOPPED:
+            if vm_power_state not in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN,
+                                      power_state.CRASHED):
+                LOG.warn(_("Instance is not stopped. Calling "
+                           "the stop API."), instance=db_instance)
+                try:
+                    # Note(maoy): this assumes that the stop API is
+                    # idempotent.
+                    self.compute_api.stop(context, u)
+                except Exception:
+                    LOG.exception(_("error during stop() in "
+                                    "sync_power_state."),
+                                  instance=db_instance)
+        elif vm_state in (vm_states.SOFT_DELETED,
+                          vm_states.DELETED):
+            if vm_power_state not in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN):
+                # Note(maoy): this should be taken care of periodically in
+                # _cleanup_running_deleted_instances().
+                LOG.warn(_("Instance is not (soft-)deleted."),
+                         instance=db_instance)
+
+    def _power_state_in_sync(self, vm_state, vm_power_state):
+        """Return whether _sync_power_states has nothing to resolve
+        between the vm_state and the vm_power_state of an instance.
+        """
+        if vm_state == vm_states.ACTIVE:
+            return vm_power_state not in (power_state.NOSTATE,
                                           power_state.SHUTDOWN,
-                                          power_state.CRASHED):
-                    LOG.warn(_("Instance is not stopped. Calling "
-                               "the stop API."), instance=db_instance)
-                    try:
-                        # Note(maoy): this assumes that the stop API is
-                        # idempotent.
-                        self.compute_api.stop(context, db_instance)
-                    except Exception:
-                        LOG.exception(_("error during stop() in "
-                                        "sync_power_state."),
-                                      instance=db_instance)
-            elif vm_state in (vm_states.SOFT_DELETED,
-                              vm_states.DELETED):
-                if vm_power_state not in (power_state.NOSTATE,
-                                          power_state.SHUTDOWN):
-                    # Note(maoy): this should be taken care of periodically in
-                    # _cleanup_running_deleted_instances().
-                    LOG.warn(_("Instance is not (soft-)deleted."),
-                             instance=db_instance)
+                                          power_state.CRASHED,
+                                          power_state.PAUSED,
+                                          power_state.SUSPENDED)
+        elif vm_state == vm_states.STOPPED:
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN,
+                                      power_state.CRASHED)
+        elif vm_state in (vm_states.SOFT_DELETED, vm_states.DELETED):
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN)
+        return True
 
     @manager.periodic_task
     def _reclaim_queued_deletes(self, context):
@@ -2819,7 +2970,8 @@ class ComputeManager(manager.SchedulerDependentManager):
             LOG.debug(_("FLAGS.reclaim_instance_interval <= 0, skipping..."))
             return
 
-        instances = self.db.instance_get_all_by_host(context, self.host)
+        instances = self.db.instance_get_all_by_host(context, self.host,
+                                                     columns_to_join=[])
         for instance in instances:
             old_enough = (not instance.deleted_at or
                           timeutils.is_older_than(instance.deleted_at,
@@ -2828,6 +2980,8 @@ class ComputeManager(manager.SchedulerDependentManager):
 
             if soft_deleted and old_enough:
                 LOG.info(_('Reclaiming deleted instance'), instance=instance)
+                instance = self.db.instance_get_by_uuid(context,
+                                                        instance['uuid'])
                 self._delete_instance(context, instance)
 
     @manager.periodic_task
@@ -2895,6 +3049,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                                "'%(name)s' which is marked as "
                                "DELETED but still present on host."),
                              locals(), instance=instance)
+                    instance = self.db.instance_get_by_uuid(context,
+                                                            instance['uuid'])
                     self._shutdown_instance(context, instance)
                     self._cleanup_volumes(context, instance['uuid'])
                 else:
@@ -2919,7 +3075,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                 return True
             return False
         present_name_labels = set(self.driver.list_instances())
-        instances = self.db.instance_get_all_by_host(context, self.host)
+        instances = self.db.instance_get_all_by_host(context, self.host,
+                                                     columns_to_join=[])
         return [i for i in instances if deleted_instance(i)]
 
     @contextlib.contextmanager
@@ -385,17 +385,17 @@ class ResourceTracker(object):
 
         self._purge_expired_claims()
 
-        # Grab all instances assigned to this host:
-        instances = db.instance_get_all_by_host(context, self.host)
+        # Grab all instances assigned to this host, without the related
+        # tables, which the usage calculation doesn't look at:
+        instances = db.instance_get_all_by_host(context, self.host,
+                                                columns_to_join=[])
         if self.nodename is not None:
             # Collect instances belong to the node
-            node_instances = []
-            for instance in instances:
-                smd = db.instance_system_metadata_get(context,
-                                                      instance['uuid'])
-                if smd.get('node') == self.nodename:
-                    node_instances.append(instance)
-            instances = node_instances
+            smds = db.instance_system_metadata_get_by_instance_uuids(
+                    context, [instance['uuid'] for instance in instances])
+            instances = [instance for instance in instances
+                         if smds[instance['uuid']].get('node') ==
+                         self.nodename]
 
         # Now calculate usage based on instance utilization:
         self._update_usage_from_instances(resources, instances)
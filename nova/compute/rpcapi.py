@@ -130,6 +130,8 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         2.1 - Adds orig_sys_metadata to rebuild_instance()
         2.2 - Adds slave_info parameter to add_aggregate_host() and
               remove_aggregate_host()
+        2.3 - Adds run_instances()
+        2.4 - Adds publish_service_capabilities()
     '''
 
     #
@@ -357,6 +359,14 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, None, instance),
                 version='2.1')
 
+    def publish_service_capabilities(self, ctxt, host=None):
+        msg = self.make_msg('publish_service_capabilities')
+        if host is None:
+            self.fanout_cast(ctxt, msg, version='2.4')
+        else:
+            self.cast(ctxt, msg, _compute_topic(self.topic, ctxt, host, None),
+                      version='2.4')
+
     def refresh_provider_fw_rules(self, ctxt, host):
         self.cast(ctxt, self.make_msg('refresh_provider_fw_rules'),
                 _compute_topic(self.topic, ctxt, host, None))
@@ -443,6 +453,20 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 is_first_time=is_first_time),
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
+    def run_instances(self, ctxt, instances, host, request_spec,
+                      filter_properties, requested_networks,
+                      injected_files, admin_password,
+                      is_first_time):
+        instances_p = [jsonutils.to_primitive(instance)
+                       for instance in instances]
+        self.cast(ctxt, self.make_msg('run_instances', instances=instances_p,
+                request_spec=request_spec, filter_properties=filter_properties,
+                requested_networks=requested_networks,
+                injected_files=injected_files, admin_password=admin_password,
+                is_first_time=is_first_time),
+                topic=_compute_topic(self.topic, ctxt, host, None),
+                version='2.3')
+
     def set_admin_password(self, ctxt, instance, new_pass):
         instance_p = jsonutils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('set_admin_password',
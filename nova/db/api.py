@@ -193,9 +193,13 @@ def compute_node_get(context, compute_id):
     return IMPL.compute_node_get(context, compute_id)
 
 
-def compute_node_get_all(context):
-    """Get all computeNodes."""
-    return IMPL.compute_node_get_all(context)
+def compute_node_get_all(context, updated_since=None):
+    """Get all computeNodes.
+
+    If updated_since is given, only computeNodes created, updated or
+    deleted since that time are returned, including deleted ones.
+    """
+    return IMPL.compute_node_get_all(context, updated_since=updated_since)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -216,6 +220,18 @@ def compute_node_update(context, compute_id, values, prune_stats=False):
     return IMPL.compute_node_update(context, compute_id, values, prune_stats)
 
 
+def compute_node_consume(context, compute_id, generation, memory_mb=0,
+                         disk_gb=0, vcpus=0):
+    """Take resources from a computeNode if it is still at generation.
+
+    Raises ComputeNodeGenerationConflict if the computeNode changed.
+    Returns the new generation.
+    """
+    return IMPL.compute_node_consume(context, compute_id, generation,
+                                     memory_mb=memory_mb, disk_gb=disk_gb,
+                                     vcpus=vcpus)
+
+
 def compute_node_get_by_host(context, host):
     return IMPL.compute_node_get_by_host(context, host)
 
@@ -587,11 +603,13 @@ def instance_get_all(context, columns_to_join=None):
 
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
-                                sort_dir='desc', limit=None, marker=None):
+                                sort_dir='desc', limit=None, marker=None,
+                                columns_to_join=None):
     """Get all instances that match all filters."""
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
-                                            marker=marker)
+                                            marker=marker,
+                                            columns_to_join=columns_to_join)
 
 
 def instance_get_active_by_window(context, begin, end=None, project_id=None,
@@ -606,34 +624,53 @@ def instance_get_active_by_window(context, begin, end=None, project_id=None,
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         columns_to_join=None):
     """Get instances and joins active during a certain time window.
 
     Specifying a project_id will filter for a certain project.
     Specifying a host will filter for instances on a given compute host.
+    Only the related tables in columns_to_join are loaded, or all of them
+    if it is None.
     """
     return IMPL.instance_get_active_by_window_joined(context, begin, end,
-                                              project_id, host)
+                                              project_id, host,
+                                              columns_to_join=columns_to_join)
 
 
-def instance_get_all_by_project(context, project_id):
+def instance_get_all_by_project(context, project_id, columns_to_join=None):
     """Get all instances belonging to a project."""
-    return IMPL.instance_get_all_by_project(context, project_id)
+    return IMPL.instance_get_all_by_project(context, project_id,
+                                            columns_to_join=columns_to_join)
+
 
+def instance_get_all_by_host(context, host, columns_to_join=None):
+    """Get all instances belonging to a host.
 
-def instance_get_all_by_host(context, host):
-    """Get all instances belonging to a host."""
-    return IMPL.instance_get_all_by_host(context, host)
+    Only the related tables in columns_to_join are loaded, or all of them
+    if it is None.
+    """
+    return IMPL.instance_get_all_by_host(context, host,
+                                         columns_to_join=columns_to_join)
 
 
-def instance_get_all_by_host_and_not_type(context, host, type_id=None):
+def instance_get_all_by_host_and_not_type(context, host, type_id=None,
+                                          columns_to_join=None):
     """Get all instances belonging to a host with a different type_id."""
-    return IMPL.instance_get_all_by_host_and_not_type(context, host, type_id)
+    return IMPL.instance_get_all_by_host_and_not_type(context, host, type_id,
+            columns_to_join=columns_to_join)
 
 
-def instance_get_all_by_reservation(context, reservation_id):
+def instance_get_hosts_by_not_type(context, type_id=None):
+    """Get the set of hosts running instances with a different type_id."""
+    return IMPL.instance_get_hosts_by_not_type(context, type_id)
+
+
+def instance_get_all_by_reservation(context, reservation_id,
+                                    columns_to_join=None):
     """Get all instances belonging to a reservation."""
-    return IMPL.instance_get_all_by_reservation(context, reservation_id)
+    return IMPL.instance_get_all_by_reservation(context, reservation_id,
+            columns_to_join=columns_to_join)
 
 
 def instance_get_floating_address(context, instance_id):
@@ -713,6 +750,15 @@ def instance_info_cache_get(context, instance_uuid):
     return IMPL.instance_info_cache_get(context, instance_uuid)
 
 
+def instance_info_cache_get_by_instance_uuids(context, instance_uuids):
+    """Gets the info caches of several instances, keyed by instance uuid.
+
+    :param instance_uuids: = uuids of the info caches' instances
+    """
+    return IMPL.instance_info_cache_get_by_instance_uuids(context,
+                                                          instance_uuids)
+
+
 def instance_info_cache_update(context, instance_uuid, values):
     """Update an instance info cache record in the table.
 
@@ -1051,9 +1097,52 @@ def quota_destroy_all_by_project(context, project_id):
     return IMPL.quota_destroy_all_by_project(context, project_id)
 
 
-def reservation_expire(context):
-    """Roll back any expired reservations."""
-    return IMPL.reservation_expire(context)
+def reservation_expire(context, batch_size=0):
+    """Roll back any expired reservations, in batches of at most
+    batch_size, and return how many were rolled back.
+    """
+    return IMPL.reservation_expire(context, batch_size)
+
+
+def reservation_expire_backlog(context):
+    """Return the number of expired reservations not rolled back yet."""
+    return IMPL.reservation_expire_backlog(context)
+
+
+###################
+
+
+def quota_counter_reserve(context, quotas, deltas, expire, shards):
+    """Check quotas and create reservations, using the usage counters
+    spread over the given number of shards.
+    """
+    return IMPL.quota_counter_reserve(context, quotas, deltas, expire,
+                                      shards)
+
+
+def quota_counter_commit(context, reservations):
+    """Commit quota counter reservations."""
+    return IMPL.quota_counter_commit(context, reservations)
+
+
+def quota_counter_rollback(context, reservations):
+    """Roll back quota counter reservations."""
+    return IMPL.quota_counter_rollback(context, reservations)
+
+
+def quota_counter_expire(context, batch_size=0):
+    """Roll back any expired quota counter reservations, in batches of
+    at most batch_size, and return how many were rolled back.
+    """
+    return IMPL.quota_counter_expire(context, batch_size)
+
+
+def quota_counter_reconcile(context, resources):
+    """Correct the usage counters of all projects against the counts
+    returned by the resources' sync functions, and their reserved counts
+    against the outstanding reservations.
+    """
+    return IMPL.quota_counter_reconcile(context, resources)
 
 
 ###################
@@ -1481,6 +1570,12 @@ def instance_metadata_get(context, instance_uuid):
     return IMPL.instance_metadata_get(context, instance_uuid)
 
 
+def instance_metadata_get_by_instance_uuids(context, instance_uuids):
+    """Get all metadata for several instances, keyed by instance uuid."""
+    return IMPL.instance_metadata_get_by_instance_uuids(context,
+                                                        instance_uuids)
+
+
 def instance_metadata_delete(context, instance_uuid, key):
     """Delete the given metadata item."""
     IMPL.instance_metadata_delete(context, instance_uuid, key)
@@ -1500,6 +1595,12 @@ def instance_system_metadata_get(context, instance_uuid):
     return IMPL.instance_system_metadata_get(context, instance_uuid)
 
 
+def instance_system_metadata_get_by_instance_uuids(context, instance_uuids):
+    """Get all system metadata for several instances, keyed by uuid."""
+    return IMPL.instance_system_metadata_get_by_instance_uuids(
+            context, instance_uuids)
+
+
 def instance_system_metadata_delete(context, instance_uuid, key):
     """Delete the given system metadata item."""
     IMPL.instance_system_metadata_delete(context, instance_uuid, key)
@@ -1562,6 +1663,16 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
             bw_out, last_ctr_in, last_ctr_out, last_refreshed=last_refreshed)
 
 
+def bw_usage_bulk_update(context, start_period, usages, last_refreshed=None):
+    """Update or create the bw usages of the period, in one transaction.
+
+    :param usages: list of dicts with the uuid, mac, bw_in, bw_out,
+                   last_ctr_in and last_ctr_out of each usage
+    """
+    return IMPL.bw_usage_bulk_update(context, start_period, usages,
+                                     last_refreshed=last_refreshed)
+
+
 ####################
 
 
@@ -1796,6 +1907,15 @@ def aggregate_metadata_get_by_host(context, host, key=None):
     return IMPL.aggregate_metadata_get_by_host(context, host, key)
 
 
+def aggregate_metadata_get_all_by_host(context, key=None):
+    """Get aggregate metadata for every host that belongs to an aggregate.
+
+    Returns a dictionary of host to the same dictionary of sets returned
+    by aggregate_metadata_get_by_host, using a single query.
+    """
+    return IMPL.aggregate_metadata_get_all_by_host(context, key=key)
+
+
 def aggregate_update(context, aggregate_id, values):
     """Update the attributes of an aggregates. If values contains a metadata
     key, it updates the aggregate metadata too."""
@@ -23,14 +23,19 @@ import collections
 import copy
 import datetime
 import functools
+import random
+import re
 import warnings
 
+from eventlet import corolocal
+from eventlet import greenthread
+
 from nova import block_device
 from nova.common.sqlalchemyutils import paginate_query
 from nova.compute import vm_states
 from nova import db
 from nova.db.sqlalchemy import models
-from nova.db.sqlalchemy.session import get_session
+from nova.db.sqlalchemy import session as db_session
 from nova import exception
 from nova import flags
 from nova.openstack.common import log as logging
@@ -41,9 +46,10 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy import or_
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
-from sqlalchemy.sql.expression import asc
+from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql.expression import literal_column
+from sqlalchemy.sql.expression import select
 from sqlalchemy.sql import func
 
 FLAGS = flags.FLAGS
@@ -130,6 +136,40 @@ def require_context(f):
     return wrapper
 
 
+# Whether the db api call running in the current greenthread is read_only.
+_LOCAL = corolocal.local()
+
+
+def read_only(f):
+    """Decorator to run a db api call against the sql_slave_connection
+    database, when one is configured.
+
+    Only use it for calls that do not write and can live with data that
+    lags a little behind the main database, such as listings and usage
+    reports.
+
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        was_read_only = getattr(_LOCAL, 'read_only', False)
+        _LOCAL.read_only = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            _LOCAL.read_only = was_read_only
+    return wrapper
+
+
+def get_session(autocommit=True, expire_on_commit=False):
+    """Return a SQLAlchemy session, using the slave database inside
+    read_only calls.
+    """
+    return db_session.get_session(autocommit=autocommit,
+            expire_on_commit=expire_on_commit,
+            slave_session=getattr(_LOCAL, 'read_only', False))
+
+
 def require_instance_exists(f):
     """Decorator to require the specified instance to exist.
 
@@ -500,10 +540,21 @@ def compute_node_get(context, compute_id, session=None):
 
 
 @require_admin_context
-def compute_node_get_all(context, session=None):
-    return model_query(context, models.ComputeNode, session=session).\
+@read_only
+def compute_node_get_all(context, session=None, updated_since=None):
+    if updated_since is None:
+        return model_query(context, models.ComputeNode, session=session).\
+                options(joinedload('service')).\
+                options(joinedload('stats')).\
+                all()
+
+    return model_query(context, models.ComputeNode, session=session,
+                       read_deleted="yes").\
             options(joinedload('service')).\
             options(joinedload('stats')).\
+            filter(or_(models.ComputeNode.created_at >= updated_since,
+                       models.ComputeNode.updated_at >= updated_since,
+                       models.ComputeNode.deleted_at >= updated_since)).\
             all()
 
 
@@ -583,15 +634,56 @@ def _update_stats(context, new_stats, compute_id, session, prune_stats=False):
 def compute_node_update(context, compute_id, values, prune_stats=False):
     """Updates the ComputeNode record with the most recent data"""
     stats = values.pop('stats', {})
+    # NOTE: Always touch updated_at, even if only the stats changed, so
+    # that compute_node_get_all(updated_since=...) picks the node up.
+    values['updated_at'] = timeutils.utcnow()
 
     session = get_session()
     with session.begin(subtransactions=True):
         _update_stats(context, stats, compute_id, session, prune_stats)
         compute_ref = compute_node_get(context, compute_id, session=session)
+        # NOTE: Bump the generation in SQL rather than from the value read
+        # above, so that a compute_node_consume committed in between is not
+        # overwritten with a stale generation.
+        values['generation'] = models.ComputeNode.generation + 1
         compute_ref.update(values)
+        compute_ref.save(session=session)
+        session.refresh(compute_ref)
     return compute_ref
 
 
+@require_admin_context
+def compute_node_consume(context, compute_id, generation, memory_mb=0,
+                         disk_gb=0, vcpus=0):
+    """Atomically take resources from a ComputeNode.
+
+    The update only applies if the node is still at the given generation;
+    otherwise ComputeNodeGenerationConflict is raised.  Returns the new
+    generation of the node.
+    """
+    node = models.ComputeNode
+    values = {'free_ram_mb': node.free_ram_mb - memory_mb,
+              'free_disk_gb': node.free_disk_gb - disk_gb,
+              'disk_available_least': node.disk_available_least - disk_gb,
+              'memory_mb_used': node.memory_mb_used + memory_mb,
+              'local_gb_used': node.local_gb_used + disk_gb,
+              'vcpus_used': node.vcpus_used + vcpus,
+              'generation': generation + 1,
+              'updated_at': timeutils.utcnow()}
+
+    session = get_session()
+    with session.begin():
+        count = model_query(context, models.ComputeNode, session=session,
+                            read_deleted="no").\
+                filter_by(id=compute_id).\
+                filter_by(generation=generation).\
+                update(values, synchronize_session=False)
+    if not count:
+        raise exception.ComputeNodeGenerationConflict(
+                compute_id=compute_id, generation=generation)
+    return generation + 1
+
+
 def compute_node_get_by_host(context, host):
     """Get all capacity entries for the given host."""
     session = get_session()
@@ -1525,33 +1617,35 @@ def _build_instance_get(context, session=None):
             options(joinedload('instance_type'))
 
 
-@require_admin_context
-def instance_get_all(context, columns_to_join=None):
+def _instance_joins(query, columns_to_join=None):
+    """Eagerly load the related tables of the instances in query that are
+    named in columns_to_join, or all of them if it is None.
+    """
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups',
                            'metadata', 'instance_type']
-    query = model_query(context, models.Instance)
     for column in columns_to_join:
         query = query.options(joinedload(column))
-    return query.all()
+    return query
+
+
+@require_admin_context
+def instance_get_all(context, columns_to_join=None):
+    query = model_query(context, models.Instance)
+    return _instance_joins(query, columns_to_join).all()
 
 
 @require_context
+@read_only
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
-                                limit=None, marker=None):
+                                limit=None, marker=None, columns_to_join=None):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise"""
 
-    sort_fn = {'desc': desc, 'asc': asc}
-
     session = get_session()
-    query_prefix = session.query(models.Instance).\
-            options(joinedload('info_cache')).\
-            options(joinedload('security_groups')).\
-            options(joinedload('metadata')).\
-            options(joinedload('instance_type')).\
-            order_by(sort_fn[sort_dir](getattr(models.Instance, sort_key)))
+    query_prefix = _instance_joins(session.query(models.Instance),
+                                   columns_to_join)
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
@@ -1594,13 +1688,14 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     query_prefix = regex_filter(query_prefix, models.Instance, filters)
 
     # paginate query
+    sort_keys = [sort_key]
+    for key in ('created_at', 'id'):
+        if key not in sort_keys:
+            sort_keys.append(key)
     if marker is not None:
-        try:
-            marker = instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound as e:
-            raise exception.MarkerNotFound(marker)
+        marker = _instance_get_marker(context, marker, sort_keys, session)
     query_prefix = paginate_query(query_prefix, models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
+                           sort_keys,
                            marker=marker,
                            sort_dir=sort_dir)
 
@@ -1608,6 +1703,26 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     return instances
 
 
+def _instance_get_marker(context, marker, sort_keys, session):
+    """Return the sort key values of the marker instance, which is all
+    paginate_query() needs of it.
+    """
+    columns = [getattr(models.Instance, key) for key in sort_keys]
+    result = model_query(context, *columns, session=session,
+                         project_only=True).\
+                filter_by(uuid=marker).\
+                first()
+    if not result:
+        raise exception.MarkerNotFound(marker)
+    return result
+
+
+# Regular expressions that only match a literal string, e.g. the exact
+# names searched for by the API, and so can be turned into equality tests
+# that an index can satisfy.
+_REGEX_LITERAL = re.compile(r'^\^((?:[^\\.^$*+?{}\[\]|()]|\\[.])*)\$$')
+
+
 def regex_filter(query, model, filters):
     """Applies regular expression filtering to a query.
 
@@ -1633,12 +1748,20 @@ def regex_filter(query, model, filters):
             continue
         if 'property' == type(column_attr).__name__:
             continue
-        query = query.filter(column_attr.op(db_regexp_op)(
-                                    str(filters[filter_name])))
+        value = str(filters[filter_name])
+        literal = None
+        if db_string in regexp_op_map:
+            literal = _REGEX_LITERAL.match(value)
+        if literal:
+            query = query.filter(column_attr ==
+                                 literal.group(1).replace('\\.', '.'))
+        else:
+            query = query.filter(column_attr.op(db_regexp_op)(value))
     return query
 
 
 @require_context
+@read_only
 def instance_get_active_by_window(context, begin, end=None,
                                   project_id=None, host=None):
     """Return instances that were active during window."""
@@ -1658,17 +1781,15 @@ def instance_get_active_by_window(context, begin, end=None,
 
 
 @require_admin_context
+@read_only
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         columns_to_join=None):
     """Return instances and joins that were active during window."""
     session = get_session()
-    query = session.query(models.Instance)
+    query = _instance_joins(session.query(models.Instance), columns_to_join)
 
-    query = query.options(joinedload('info_cache')).\
-                  options(joinedload('security_groups')).\
-                  options(joinedload('metadata')).\
-                  options(joinedload('instance_type')).\
-                  filter(or_(models.Instance.terminated_at == None,
+    query = query.filter(or_(models.Instance.terminated_at == None,
                              models.Instance.terminated_at > begin))
     if end:
         query = query.filter(models.Instance.launched_at < end)
@@ -1681,36 +1802,53 @@ def instance_get_active_by_window_joined(context, begin, end=None,
 
 
 @require_admin_context
-def _instance_get_all_query(context, project_only=False):
-    return model_query(context, models.Instance, project_only=project_only).\
-                   options(joinedload('info_cache')).\
-                   options(joinedload('security_groups')).\
-                   options(joinedload('metadata')).\
-                   options(joinedload('instance_type'))
+def _instance_get_all_query(context, project_only=False,
+                            columns_to_join=None):
+    query = model_query(context, models.Instance, project_only=project_only)
+    return _instance_joins(query, columns_to_join)
 
 
 @require_admin_context
-def instance_get_all_by_host(context, host):
-    return _instance_get_all_query(context).filter_by(host=host).all()
+def instance_get_all_by_host(context, host, columns_to_join=None):
+    return _instance_get_all_query(context,
+                                   columns_to_join=columns_to_join).\
+                   filter_by(host=host).\
+                   all()
 
 
 @require_admin_context
-def instance_get_all_by_host_and_not_type(context, host, type_id=None):
-    return _instance_get_all_query(context).filter_by(host=host).\
+def instance_get_all_by_host_and_not_type(context, host, type_id=None,
+                                          columns_to_join=None):
+    return _instance_get_all_query(context,
+                                   columns_to_join=columns_to_join).\
+                   filter_by(host=host).\
                    filter(models.Instance.instance_type_id != type_id).all()
 
 
+@require_admin_context
+def instance_get_hosts_by_not_type(context, type_id=None):
+    rows = model_query(context, models.Instance.host).\
+                   filter(models.Instance.host != None).\
+                   filter(models.Instance.instance_type_id != type_id).\
+                   distinct().\
+                   all()
+    return set(row[0] for row in rows)
+
+
 @require_context
-def instance_get_all_by_project(context, project_id):
+def instance_get_all_by_project(context, project_id, columns_to_join=None):
     authorize_project_context(context, project_id)
-    return _instance_get_all_query(context).\
+    return _instance_get_all_query(context,
+                                   columns_to_join=columns_to_join).\
                     filter_by(project_id=project_id).\
                     all()
 
 
 @require_context
-def instance_get_all_by_reservation(context, reservation_id):
-    return _instance_get_all_query(context, project_only=True).\
+def instance_get_all_by_reservation(context, reservation_id,
+                                    columns_to_join=None):
+    return _instance_get_all_query(context, project_only=True,
+                                   columns_to_join=columns_to_join).\
                     filter_by(reservation_id=reservation_id).\
                     all()
 
@@ -1918,6 +2056,24 @@ def instance_info_cache_get(context, instance_uuid, session=None):
     return info_cache
 
 
+@require_context
+def instance_info_cache_get_by_instance_uuids(context, instance_uuids):
+    """Gets the info caches of several instances in one query.
+
+    :param instance_uuids: = uuids of the info caches' instances
+    :returns: dict of info caches keyed by instance uuid, instances
+              without an info cache are left out
+    """
+    if not instance_uuids:
+        return {}
+    rows = model_query(context, models.InstanceInfoCache,
+                       read_deleted="no").\
+                    filter(models.InstanceInfoCache.instance_uuid.in_(
+                        instance_uuids)).\
+                    all()
+    return dict((row['instance_uuid'], row) for row in rows)
+
+
 @require_context
 def instance_info_cache_update(context, instance_uuid, values,
                                session=None):
@@ -2530,9 +2686,13 @@ def quota_usage_get_all_by_project(context, project_id):
                    filter_by(project_id=project_id).\
                    all()
 
+    # NOTE: The usage of a resource may be sharded over several rows by
+    #       the CounterQuotaDriver, so add them up.
     result = {'project_id': project_id}
     for row in rows:
-        result[row.resource] = dict(in_use=row.in_use, reserved=row.reserved)
+        usage = result.setdefault(row.resource, dict(in_use=0, reserved=0))
+        usage['in_use'] += row.in_use
+        usage['reserved'] += row.reserved
 
     return result
 
@@ -2861,23 +3021,313 @@ def quota_destroy_all_by_project(context, project_id):
             reservation_ref.delete(session=session)
 
 
+def _expired_reservations_query(context, current_time, session=None):
+    return model_query(context, models.Reservation, session=session,
+                       read_deleted="no").\
+                   filter(models.Reservation.expire < current_time)
+
+
 @require_admin_context
-def reservation_expire(context):
-    session = get_session()
-    with session.begin():
-        current_time = timeutils.utcnow()
-        results = model_query(context, models.Reservation, session=session,
-                              read_deleted="no").\
-                          filter(models.Reservation.expire < current_time).\
-                          all()
+def reservation_expire_backlog(context):
+    return _expired_reservations_query(context, timeutils.utcnow()).count()
+
 
-        if results:
-            for reservation in results:
+def _reservation_expire_batches(context, expire_batch, batch_size):
+    """Call expire_batch with batches of at most batch_size expired
+    reservations, oldest first, until there are none left.  A
+    batch_size of 0 expires them all in one batch.  expire_batch returns
+    how many of its reservations it expired, as some of them may have
+    been committed or rolled back meanwhile.
+
+    Returns the number of reservations expired.
+    """
+    current_time = timeutils.utcnow()
+    backlog = _expired_reservations_query(context, current_time).count()
+    if not backlog:
+        return 0
+    LOG.info(_("Expiring %(backlog)d reservations") % locals())
+
+    expired = 0
+    while True:
+        query = _expired_reservations_query(context, current_time).\
+                        order_by(models.Reservation.expire).\
+                        order_by(models.Reservation.id)
+        if batch_size:
+            query = query.limit(batch_size)
+        reservations = query.all()
+        if reservations:
+            expired += expire_batch(reservations)
+        if not batch_size or len(reservations) < batch_size:
+            break
+        LOG.debug(_("Expired %(expired)d of %(backlog)d reservations") %
+                  locals())
+        # Let live reservations get at the database between batches.
+        greenthread.sleep(0)
+
+    return expired
+
+
+@require_admin_context
+def reservation_expire(context, batch_size=0):
+    def expire_batch(reservations):
+        # Release what the reservations hold with one update per usage,
+        # in a short transaction per batch.
+        session = get_session()
+        with session.begin():
+            # NOTE: Lock the usages first, as reservation_commit() and
+            #       reservation_rollback() do, and then only release the
+            #       reservations which they did not finish meanwhile.
+            usage_ids = set(reservation.usage_id
+                            for reservation in reservations)
+            model_query(context, models.QuotaUsage.id, session=session,
+                        read_deleted="no").\
+                    filter(models.QuotaUsage.id.in_(usage_ids)).\
+                    order_by(models.QuotaUsage.id).\
+                    with_lockmode('update').\
+                    all()
+            reservations = model_query(context, models.Reservation,
+                                       session=session, read_deleted="no").\
+                    filter(models.Reservation.id.in_(
+                        [reservation.id for reservation in reservations])).\
+                    with_lockmode('update').\
+                    all()
+            if not reservations:
+                return 0
+
+            released = collections.defaultdict(int)
+            for reservation in reservations:
                 if reservation.delta >= 0:
-                    reservation.usage.reserved -= reservation.delta
-                    reservation.usage.save(session=session)
+                    released[reservation.usage_id] += reservation.delta
+
+            for usage_id in sorted(released):
+                model_query(context, models.QuotaUsage, session=session,
+                            read_deleted="no").\
+                        filter_by(id=usage_id).\
+                        update({'reserved': models.QuotaUsage.reserved -
+                                            released[usage_id],
+                                'updated_at': timeutils.utcnow()},
+                               synchronize_session=False)
 
-                reservation.delete(session=session)
+            model_query(context, models.Reservation, session=session,
+                        read_deleted="no").\
+                    filter(models.Reservation.id.in_(
+                        [reservation.id for reservation in reservations])).\
+                    update({'deleted': True,
+                            'deleted_at': timeutils.utcnow()},
+                           synchronize_session=False)
+        return len(reservations)
+
+    return _reservation_expire_batches(context, expire_batch, batch_size)
+
+
+###################
+
+
+# NOTE: The quota counter functions below keep the usage of a resource in
+# one or more shard rows of quota_usages, which are only ever changed by
+# atomic increments.  Unlike quota_reserve() and friends they take no
+# locks, so reservations for different resources or shards never wait on
+# each other.
+
+def _quota_counter_get_or_create(context, project_id, resource, shard):
+    """Return the id of the usage row of a shard, creating it if needed."""
+    row = model_query(context, models.QuotaUsage.id, read_deleted="no").\
+                  filter_by(project_id=project_id).\
+                  filter_by(resource=resource).\
+                  filter_by(shard=shard).\
+                  first()
+    if row:
+        return row.id
+
+    # NOTE: Two racing callers may both create the row.  That does no
+    #       harm, the usage is the sum of all the rows of the resource.
+    usage_ref = models.QuotaUsage()
+    usage_ref.update(dict(project_id=project_id, resource=resource,
+                          shard=shard, in_use=0, reserved=0))
+    usage_ref.save()
+    return usage_ref.id
+
+
+def _quota_counter_add(context, usage_id, in_use=0, reserved=0,
+                       session=None):
+    """Atomically add to the counts of a usage row."""
+    model_query(context, models.QuotaUsage, session=session,
+                read_deleted="no").\
+            filter_by(id=usage_id).\
+            update({'in_use': models.QuotaUsage.in_use + in_use,
+                    'reserved': models.QuotaUsage.reserved + reserved,
+                    'updated_at': timeutils.utcnow()},
+                   synchronize_session=False)
+
+
+def _quota_counter_usages(context, project_id, resources=None):
+    """Return the summed in_use and reserved counts of a project's
+    resources.
+    """
+    usage = models.QuotaUsage
+    query = model_query(context, usage.resource, func.sum(usage.in_use),
+                        func.sum(usage.reserved), read_deleted="no").\
+                    filter_by(project_id=project_id)
+    if resources is not None:
+        query = query.filter(usage.resource.in_(resources))
+    rows = query.group_by(usage.resource).all()
+    return dict((resource, dict(in_use=in_use or 0, reserved=reserved or 0))
+                for resource, in_use, reserved in rows)
+
+
+@require_context
+def quota_counter_reserve(context, quotas, deltas, expire, shards):
+    elevated = context.elevated()
+    project_id = context.project_id
+    reservations = []
+    overs = []
+    for resource, delta in sorted(deltas.items()):
+        usage_id = _quota_counter_get_or_create(elevated, project_id,
+                                                resource,
+                                                random.randrange(shards))
+        # NOTE: Take the reservation first and check the quota after,
+        #       backing out if it went over.  Racing reservations may
+        #       then both back out, but the quota is never exceeded.
+        #       As in quota_reserve(), only positive deltas count.  The
+        #       reservation and its increment are saved together, so
+        #       that nothing stays reserved without a reservation to
+        #       release it.
+        reservation_ref = models.Reservation()
+        reservation_ref.update(dict(uuid=str(utils.gen_uuid()),
+                                    usage_id=usage_id,
+                                    project_id=project_id,
+                                    resource=resource, delta=delta,
+                                    expire=expire))
+        session = get_session()
+        with session.begin():
+            reservation_ref.save(session=session)
+            if delta > 0:
+                _quota_counter_add(elevated, usage_id, reserved=delta,
+                                   session=session)
+
+        if delta > 0 and quotas[resource] >= 0:
+            usage = _quota_counter_usages(elevated, project_id,
+                                          [resource])[resource]
+            if usage['in_use'] + usage['reserved'] > quotas[resource]:
+                quota_counter_rollback(context, [reservation_ref.uuid])
+                overs.append(resource)
+                continue
+
+        reservations.append(reservation_ref.uuid)
+
+    if overs:
+        quota_counter_rollback(context, reservations)
+        usages = _quota_counter_usages(elevated, project_id, deltas.keys())
+        raise exception.OverQuota(overs=sorted(overs), quotas=quotas,
+                                  usages=usages)
+
+    return reservations
+
+
+def _quota_counter_finish(context, reservations, commit):
+    """Apply the reservations to the counters and delete them, and
+    return how many were applied."""
+    if not reservations:
+        return 0
+    finished = 0
+    rows = model_query(context, models.Reservation, read_deleted="no").\
+                   filter(models.Reservation.uuid.in_(reservations)).\
+                   all()
+    for reservation in rows:
+        session = get_session()
+        with session.begin():
+            # NOTE: Only the caller that gets to delete the reservation
+            #       applies it, so it is never applied twice.
+            deleted = model_query(context, models.Reservation,
+                                  session=session, read_deleted="no").\
+                              filter_by(id=reservation.id).\
+                              update({'deleted': True,
+                                      'deleted_at': timeutils.utcnow()},
+                                     synchronize_session=False)
+            if not deleted:
+                continue
+
+            in_use = reservation.delta if commit else 0
+            reserved = -reservation.delta if reservation.delta >= 0 else 0
+            _quota_counter_add(context, reservation.usage_id,
+                               in_use=in_use, reserved=reserved,
+                               session=session)
+            finished += 1
+    return finished
+
+
+@require_context
+def quota_counter_commit(context, reservations):
+    _quota_counter_finish(context, reservations, True)
+
+
+@require_context
+def quota_counter_rollback(context, reservations):
+    _quota_counter_finish(context, reservations, False)
+
+
+@require_admin_context
+def quota_counter_expire(context, batch_size=0):
+    def expire_batch(reservations):
+        return _quota_counter_finish(context,
+                [reservation.uuid for reservation in reservations], False)
+
+    return _reservation_expire_batches(context, expire_batch, batch_size)
+
+
+def _quota_counter_reconcile_reserved(context, project_id):
+    """Reset the reserved counts of a project's usage rows to what their
+    outstanding reservations hold.
+    """
+    usage = models.QuotaUsage
+    reservation = models.Reservation
+    # NOTE: Computed by the UPDATE itself, so that reservations taken or
+    #       released meanwhile are not lost.
+    reserved = select([func.coalesce(func.sum(reservation.delta), 0)]).\
+                    where(and_(reservation.usage_id == usage.id,
+                               reservation.deleted == False,
+                               reservation.delta > 0)).\
+                    as_scalar()
+    model_query(context, usage, read_deleted="no").\
+            filter_by(project_id=project_id).\
+            filter(usage.reserved != reserved).\
+            update({'reserved': reserved,
+                    'updated_at': timeutils.utcnow()},
+                   synchronize_session=False)
+
+
+@require_admin_context
+def quota_counter_reconcile(context, resources):
+    rows = model_query(context, models.QuotaUsage.project_id,
+                       read_deleted="no").\
+                   distinct().\
+                   all()
+    for project_id in [row.project_id for row in rows]:
+        _quota_counter_reconcile_reserved(context, project_id)
+        usages = _quota_counter_usages(context, project_id)
+        synced = set()
+        for resource in resources.values():
+            if resource.sync in synced:
+                continue
+            synced.add(resource.sync)
+
+            session = get_session()
+            counts = resource.sync(context, project_id, session)
+            for res, count in counts.items():
+                if res not in resources:
+                    continue
+                # NOTE: Reservations committed between the count and
+                #       the fix up are counted twice or not at all.
+                #       That is corrected on the next reconciliation.
+                in_use = usages.get(res, {}).get('in_use', 0)
+                if count != in_use:
+                    LOG.debug(_("Correcting %(res)s usage of project "
+                                "%(project_id)s from %(in_use)d to "
+                                "%(count)d") % locals())
+                    usage_id = _quota_counter_get_or_create(
+                            context, project_id, res, 0)
+                    _quota_counter_add(context, usage_id,
+                                       in_use=count - in_use)
 
 
 ###################
@@ -4112,6 +4562,24 @@ def instance_metadata_get(context, instance_uuid, session=None):
     return result
 
 
+@require_context
+@read_only
+def instance_metadata_get_by_instance_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return {}
+    rows = model_query(context, models.InstanceMetadata,
+                       read_deleted="no").\
+                    filter(models.InstanceMetadata.instance_uuid.in_(
+                        instance_uuids)).\
+                    all()
+
+    result = dict((instance_uuid, {}) for instance_uuid in instance_uuids)
+    for row in rows:
+        result[row['instance_uuid']][row['key']] = row['value']
+
+    return result
+
+
 @require_context
 def instance_metadata_delete(context, instance_uuid, key):
     _instance_metadata_get_query(context, instance_uuid).\
@@ -4193,6 +4661,22 @@ def instance_system_metadata_get(context, instance_uuid, session=None):
     return result
 
 
+@require_context
+def instance_system_metadata_get_by_instance_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return {}
+    rows = model_query(context, models.InstanceSystemMetadata).\
+                    filter(models.InstanceSystemMetadata.instance_uuid.in_(
+                        instance_uuids)).\
+                    all()
+
+    result = dict((instance_uuid, {}) for instance_uuid in instance_uuids)
+    for row in rows:
+        result[row['instance_uuid']][row['key']] = row['value']
+
+    return result
+
+
 @require_context
 def instance_system_metadata_delete(context, instance_uuid, key):
     _instance_system_metadata_get_query(context, instance_uuid).\
@@ -4320,6 +4804,8 @@ def bw_usage_get(context, uuid, start_period, mac):
 
 @require_context
 def bw_usage_get_by_uuids(context, uuids, start_period):
+    if not uuids:
+        return []
     return model_query(context, models.BandwidthUsage, read_deleted="yes").\
                    filter(models.BandwidthUsage.uuid.in_(uuids)).\
                    filter_by(start_period=start_period).\
@@ -4366,6 +4852,55 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
         bwusage.save(session=session)
 
 
+@require_context
+def bw_usage_bulk_update(context, start_period, usages, last_refreshed=None):
+    if not usages:
+        return
+
+    if last_refreshed is None:
+        last_refreshed = timeutils.utcnow()
+
+    now = timeutils.utcnow()
+    table = models.BandwidthUsage.__table__
+    session = get_session()
+    with session.begin():
+        rows = model_query(context, models.BandwidthUsage.id,
+                           models.BandwidthUsage.uuid,
+                           models.BandwidthUsage.mac,
+                           session=session, read_deleted="yes").\
+                       filter(models.BandwidthUsage.uuid.in_(
+                           set(usage['uuid'] for usage in usages))).\
+                       filter_by(start_period=start_period).\
+                       all()
+        ids = dict(((row.uuid, row.mac), row.id) for row in rows)
+
+        updates = []
+        inserts = []
+        for usage in usages:
+            values = {'last_refreshed': last_refreshed,
+                      'last_ctr_in': usage['last_ctr_in'],
+                      'last_ctr_out': usage['last_ctr_out'],
+                      'bw_in': usage['bw_in'],
+                      'bw_out': usage['bw_out']}
+            usage_id = ids.get((usage['uuid'], usage['mac']))
+            if usage_id is not None:
+                values.update(_id=usage_id, updated_at=now)
+                updates.append(values)
+            else:
+                values.update(uuid=usage['uuid'], mac=usage['mac'],
+                              start_period=start_period, created_at=now,
+                              deleted=False)
+                inserts.append(values)
+
+        # One executemany for all the updates and one for all the inserts
+        if updates:
+            session.execute(table.update().
+                                where(table.c.id == bindparam('_id')),
+                            updates)
+        if inserts:
+            session.execute(table.insert(), inserts)
+
+
 ####################
 
 
@@ -4932,6 +5467,22 @@ def aggregate_metadata_get_by_host(context, host, key=None):
     return metadata
 
 
+@require_admin_context
+def aggregate_metadata_get_all_by_host(context, key=None):
+    query = model_query(context, models.Aggregate).join("_metadata")
+
+    if key:
+        query = query.filter(models.AggregateMetadata.key == key)
+    rows = query.all()
+    metadata = collections.defaultdict(
+            lambda: collections.defaultdict(set))
+    for agg in rows:
+        for host in agg.hosts:
+            for kv in agg._metadata:
+                metadata[host][kv['key']].add(kv['value'])
+    return metadata
+
+
 @require_admin_context
 def aggregate_update(context, aggregate_id, values):
     session = get_session()
@@ -5122,6 +5673,7 @@ def instance_fault_create(context, values):
     return dict(fault_ref.iteritems())
 
 
+@read_only
 def instance_fault_get_by_instance_uuids(context, instance_uuids):
     """Get all instance faults for the provided instance_uuids."""
     rows = model_query(context, models.InstanceFault, read_deleted='no').\
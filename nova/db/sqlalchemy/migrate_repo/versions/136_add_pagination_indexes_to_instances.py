@@ -0,0 +1,57 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+from sqlalchemy.exc import IntegrityError
+
+
+def _indexes(t):
+    # Based on instance_get_all_by_filters, sorted and paginated by
+    # created_at and id, for a project, for a user and for everyone
+    # from: nova/db/sqlalchemy/api.py
+    return [Index('instances_project_id_deleted_created_at_id_idx',
+                  t.c.project_id, t.c.deleted, t.c.created_at, t.c.id),
+            Index('instances_user_id_deleted_created_at_id_idx',
+                  t.c.user_id, t.c.deleted, t.c.created_at, t.c.id),
+            Index('instances_deleted_created_at_id_idx',
+                  t.c.deleted, t.c.created_at, t.c.id),
+            # ... and with changes-since
+            Index('instances_project_id_updated_at_idx',
+                  t.c.project_id, t.c.updated_at)]
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    t = Table('instances', meta, autoload=True)
+
+    for i in _indexes(t):
+        try:
+            i.create(migrate_engine)
+        except IntegrityError:
+            pass
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    t = Table('instances', meta, autoload=True)
+
+    for i in _indexes(t):
+        i.drop(migrate_engine)
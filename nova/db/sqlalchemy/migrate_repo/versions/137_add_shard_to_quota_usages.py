@@ -0,0 +1,55 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, Index, Integer, MetaData, Table
+from sqlalchemy.exc import IntegrityError
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    # add column:
+    quota_usages = Table('quota_usages', meta, autoload=True)
+    shard = Column('shard', Integer, default=0)
+
+    quota_usages.create_column(shard)
+    quota_usages.update().values(shard=0).execute()
+
+    # The counter quota driver looks up the usage rows of a project's
+    # resource, and of one shard of it.
+    try:
+        Index('quota_usages_project_id_resource_shard_idx',
+              quota_usages.c.project_id, quota_usages.c.resource,
+              quota_usages.c.shard).create(migrate_engine)
+    except IntegrityError:
+        pass
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    quota_usages = Table('quota_usages', meta, autoload=True)
+    Index('quota_usages_project_id_resource_shard_idx',
+          quota_usages.c.project_id, quota_usages.c.resource,
+          quota_usages.c.shard).drop(migrate_engine)
+
+    # drop column, reloading the table without the index:
+    meta = MetaData()
+    meta.bind = migrate_engine
+    quota_usages = Table('quota_usages', meta, autoload=True)
+    quota_usages.drop_column('shard')
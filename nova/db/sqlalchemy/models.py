@@ -162,6 +162,10 @@ class ComputeNode(BASE, NovaBase):
     cpu_info = Column(Text, nullable=True)
     disk_available_least = Column(Integer)
 
+    # Bumped on every update, so that schedulers consuming resources from
+    # the node can tell whether someone else changed it in the meantime.
+    generation = Column(Integer, default=0)
+
 
 class ComputeNodeStat(BASE, NovaBase):
     """Stats related to the current workload of a compute host that are
@@ -480,6 +484,10 @@ class QuotaUsage(BASE, NovaBase):
 
     until_refresh = Column(Integer, nullable=True)
 
+    # The CounterQuotaDriver spreads the usage of a resource over several
+    # rows, the project's usage is the sum of them.
+    shard = Column(Integer, default=0)
+
 
 class Reservation(BASE, NovaBase):
     """Represents a resource reservation for quotas."""
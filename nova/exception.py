@@ -689,6 +689,11 @@ class ComputeHostNotFound(HostNotFound):
     message = _("Compute host %(host)s could not be found.")
 
 
+class ComputeNodeGenerationConflict(NovaException):
+    message = _("Compute node %(compute_id)s is no longer at generation "
+                "%(generation)s.")
+
+
 class HostBinaryNotFound(NotFound):
     message = _("Could not find binary %(binary)s on host %(host)s.")
 
@@ -78,6 +78,12 @@ core_opts = [
                default='sqlite:///$state_path/$sqlite_db',
                help='The SQLAlchemy connection string used to connect to the '
                     'database'),
+    cfg.StrOpt('sql_slave_connection',
+               default='',
+               help='The SQLAlchemy connection string used to connect to a '
+                    'read-only replica of the database.  If set, db api '
+                    'calls that only read and tolerate replication lag use '
+                    'it instead of sql_connection'),
     cfg.StrOpt('api_paste_config',
                default="api-paste.ini",
                help='File name for the paste.deploy config for nova-api'),
@@ -29,15 +29,34 @@ import urlparse
 import glanceclient
 import glanceclient.exc
 
+from nova.common import memorycache
 from nova import exception
 from nova import flags
+from nova.openstack.common import cfg
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
 
+glance_opts = [
+    cfg.IntOpt('glance_image_cache_ttl',
+               default=10,
+               help='Time in seconds to cache the metadata of the images, '
+                    'and the images found not to exist, shown by the '
+                    'process, 0 to disable the cache'),
+    cfg.IntOpt('glance_image_cache_max_entries',
+               default=1000,
+               help='Maximum number of images, by image and requester, in '
+                    'the image metadata cache of the process'),
+    ]
 
 LOG = logging.getLogger(__name__)
 FLAGS = flags.FLAGS
+FLAGS.register_opts(glance_opts)
+
+_IMAGE_CACHE = None
+
+# Cached in place of the metadata of the images which don't exist.
+_IMAGE_NOT_FOUND = 'not-found'
 
 
 def _parse_image_ref(image_href):
@@ -151,6 +170,49 @@ class GlanceClientWrapper(object):
                 time.sleep(1)
 
 
+def _get_image_cache():
+    global _IMAGE_CACHE
+    if _IMAGE_CACHE is None:
+        _IMAGE_CACHE = memorycache.Client(
+                max_entries=FLAGS.glance_image_cache_max_entries)
+    return _IMAGE_CACHE
+
+
+def _image_cache_key(context, image_id):
+    """Returns the cache key of an image as seen by the requester, since
+    which images are visible depends on who asks."""
+    return 'image-%s-%s-%s-%s-%s' % (image_id, context.project_id,
+                                     context.user_id, bool(context.is_admin),
+                                     bool(context.auth_token))
+
+
+def _image_index_key(image_id):
+    """Returns the cache key of the cache keys of an image."""
+    return 'image-%s' % image_id
+
+
+def _cache_image(context, image_id, image_meta):
+    cache = _get_image_cache()
+    ttl = FLAGS.glance_image_cache_ttl
+    key = _image_cache_key(context, image_id)
+    cache.set(key, image_meta, ttl)
+    index_key = _image_index_key(image_id)
+    keys = cache.get(index_key) or []
+    if key not in keys:
+        cache.set(index_key, keys + [key], ttl)
+
+
+def _invalidate_image(image_id):
+    """Drops the cached metadata of an image for all the requesters."""
+    if not FLAGS.glance_image_cache_ttl:
+        return
+    cache = _get_image_cache()
+    index_key = _image_index_key(image_id)
+    for key in cache.get(index_key) or []:
+        cache.delete(key)
+    cache.delete(index_key)
+
+
 class GlanceImageService(object):
     """Provides storage and retrieval of disk image objects within Glance."""
 
@@ -188,7 +250,32 @@ class GlanceImageService(object):
         return _params
 
     def show(self, context, image_id):
-        """Returns a dict with image data for the given opaque image id."""
+        """Returns a dict with image data for the given opaque image id.
+
+        The metadata, or the absence of the image, is cached for
+        glance_image_cache_ttl seconds, as one boot shows the same image
+        several times.
+        """
+        if not FLAGS.glance_image_cache_ttl:
+            return self._show(context, image_id)
+
+        image_meta = _get_image_cache().get(_image_cache_key(context,
+                                                             image_id))
+        if image_meta == _IMAGE_NOT_FOUND:
+            raise exception.ImageNotFound(image_id=image_id)
+        if image_meta is not None:
+            # Callers are free to change what they are given.
+            return copy.deepcopy(image_meta)
+
+        try:
+            image_meta = self._show(context, image_id)
+        except exception.ImageNotFound:
+            _cache_image(context, image_id, _IMAGE_NOT_FOUND)
+            raise
+        _cache_image(context, image_id, copy.deepcopy(image_meta))
+        return image_meta
+
+    def _show(self, context, image_id):
         try:
             image = self._client.call(context, 1, 'get', image_id)
         except Exception:
@@ -253,6 +340,8 @@ class GlanceImageService(object):
             _reraise_translated_image_exception(image_id)
         else:
             return self._translate_from_glance(image_meta)
+        finally:
+            _invalidate_image(image_id)
 
     def delete(self, context, image_id):
         """Delete the given image.
@@ -265,6 +354,8 @@ class GlanceImageService(object):
             self._client.call(context, 1, 'delete', image_id)
         except glanceclient.exc.NotFound:
             raise exception.ImageNotFound(image_id=image_id)
+        finally:
+            _invalidate_image(image_id)
         return True
 
     @staticmethod
@@ -53,18 +53,33 @@ This module provides Manager, a base class for managers.
 
 """
 
+import copy
+import time
+
 import eventlet
 
 from nova.db import base
 from nova import flags
+from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common.plugin import pluginmanager
 from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
+from nova.openstack.common import timeutils
 from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova import version
 
+manager_opts = [
+    cfg.IntOpt('capabilities_full_update_interval',
+               default=0,
+               help='Seconds between the full capability updates sent to '
+                    'the schedulers, which otherwise only get the '
+                    'capabilities that changed. 0 sends full updates every '
+                    'time, which schedulers older than this version need, '
+                    'so only set it once all of them are upgraded.'),
+    ]
 
 FLAGS = flags.FLAGS
+FLAGS.register_opts(manager_opts)
 
 
 LOG = logging.getLogger(__name__)
@@ -73,17 +88,28 @@ LOG = logging.getLogger(__name__)
 def periodic_task(*args, **kwargs):
     """Decorator to indicate that a method is a periodic task.
 
-    This decorator can be used in two ways:
+    This decorator can be used in three ways:
 
         1. Without arguments '@periodic_task', this will be run on every tick
            of the periodic scheduler.
 
         2. With arguments, @periodic_task(ticks_between_runs=N), this will be
            run on every N ticks of the periodic scheduler.
+
+        3. With arguments, @periodic_task(spacing=N), this will be run every
+           N seconds, whatever the interval between the ticks.  N may also
+           be the name of the flag holding the number of seconds, which is
+           then read when the task is scheduled.  A spacing of 0 or less
+           runs the task on every tick.
+
+    When the service runs the periodic tasks concurrently, each task runs in
+    a greenthread of its own, every periodic_interval seconds times its
+    number of ticks between runs unless it has a spacing.
     """
     def decorator(f):
         f._periodic_task = True
         f._ticks_between_runs = kwargs.pop('ticks_between_runs', 0)
+        f._periodic_spacing = kwargs.pop('spacing', None)
         return f
 
     # NOTE(sirp): The `if` is necessary to allow the decorator to be used with
@@ -141,6 +167,7 @@ class Manager(base.Base):
         if not host:
             host = FLAGS.host
         self.host = host
+        self._periodic_stats = {}
         self.load_plugins()
         super(Manager, self).__init__(db_driver)
 
@@ -156,7 +183,8 @@ class Manager(base.Base):
         '''
         return rpc_dispatcher.RpcDispatcher([self])
 
-    def periodic_tasks(self, context, raise_on_error=False):
+    def periodic_tasks(self, context, raise_on_error=False,
+                       periodic_interval=None):
         """Tasks to be run at a periodic interval."""
         for task_name, task in self._periodic_tasks:
             full_task_name = '.'.join([self.__class__.__name__, task_name])
@@ -168,19 +196,104 @@ class Manager(base.Base):
                 self._ticks_to_skip[task_name] -= 1
                 continue
 
+            spacing = self._get_periodic_spacing(task)
+            last_start = self._periodic_task_stats(task_name)['last_start']
+            if (spacing > 0 and last_start and
+                    time.time() - last_start < spacing):
+                LOG.debug(_("Skipping %(full_task_name)s, its spacing of "
+                            "%(spacing)s seconds has not passed"), locals())
+                continue
+
             self._ticks_to_skip[task_name] = task._ticks_between_runs
-            LOG.debug(_("Running periodic task %(full_task_name)s"), locals())
-
-            try:
-                task(self, context)
-                # NOTE(tiantian): After finished a task, allow manager to
-                # do other work (report_state, processing AMPQ request etc.)
-                eventlet.sleep(0)
-            except Exception as e:
-                if raise_on_error:
-                    raise
-                LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
-                              locals())
+            self.run_periodic_task(context, task_name,
+                                   raise_on_error=raise_on_error,
+                                   periodic_interval=periodic_interval)
+            # NOTE(tiantian): After finished a task, allow manager to
+            # do other work (report_state, processing AMPQ request etc.)
+            eventlet.sleep(0)
+
+    def periodic_task_spacing(self, task_name, periodic_interval=None):
+        """Return the seconds between the runs of a periodic task, and the
+        seconds to wait before its first run, when it runs on its own.
+        """
+        if periodic_interval is None:
+            periodic_interval = FLAGS.periodic_interval
+        task = dict(self._periodic_tasks)[task_name]
+        spacing = self._get_periodic_spacing(task)
+        if spacing > 0:
+            return spacing, 0
+        ticks = task._ticks_between_runs
+        return (ticks + 1) * periodic_interval, ticks * periodic_interval
+
+    @staticmethod
+    def _get_periodic_spacing(task):
+        """Return the spacing in seconds of a periodic task, or 0 if it
+        runs every so many ticks instead."""
+        spacing = task._periodic_spacing
+        if isinstance(spacing, basestring):
+            spacing = getattr(FLAGS, spacing)
+        return spacing or 0
+
+    def _periodic_task_stats(self, task_name):
+        if task_name not in self._periodic_stats:
+            self._periodic_stats[task_name] = dict(runs=0,
+                                                   failures=0,
+                                                   overlaps=0,
+                                                   running=False,
+                                                   last_start=None,
+                                                   last_duration=None,
+                                                   last_lag=None,
+                                                   last_error=None)
+        return self._periodic_stats[task_name]
+
+    def run_periodic_task(self, context, task_name, raise_on_error=False,
+                          periodic_interval=None):
+        """Run a periodic task, unless its previous run is still going, and
+        record how long it took and how late it was, given the
+        periodic_interval it is scheduled with.
+        """
+        full_task_name = '.'.join([self.__class__.__name__, task_name])
+        stats = self._periodic_task_stats(task_name)
+        if stats['running']:
+            stats['overlaps'] += 1
+            LOG.warn(_("Skipping %(full_task_name)s, its previous run is "
+                       "still going"), locals())
+            return
+
+        spacing = self.periodic_task_spacing(task_name,
+                                             periodic_interval)[0]
+        start = time.time()
+        if stats['last_start']:
+            stats['last_lag'] = max(start - stats['last_start'] - spacing, 0)
+        stats['last_start'] = start
+        stats['running'] = True
+        LOG.debug(_("Running periodic task %(full_task_name)s"), locals())
+        try:
+            getattr(self, task_name)(context)
+            stats['last_error'] = None
+        except Exception as e:
+            stats['failures'] += 1
+            stats['last_error'] = unicode(e)
+            if raise_on_error:
+                raise
+            LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
+                          locals())
+        finally:
+            duration = time.time() - start
+            stats['running'] = False
+            stats['runs'] += 1
+            stats['last_duration'] = duration
+            if duration > spacing:
+                LOG.warn(_("Periodic task %(full_task_name)s took "
+                           "%(duration).2f seconds, longer than its spacing "
+                           "of %(spacing)s seconds"), locals())
+
+    def periodic_task_stats(self, context):
+        """Return the number of runs, failures and overlapping runs of each
+        periodic task, with the duration and lag in seconds of its last run.
+        """
+        return dict((task_name, self._periodic_task_stats(task_name).copy())
+                    for task_name, task in self._periodic_tasks)
 
     def init_host(self):
         """Handle initialization if this is a standalone service.
@@ -208,10 +321,21 @@ class SchedulerDependentManager(Manager):
     manager.Manager directly. Updates are only sent after
     update_service_capabilities is called with non-None values.
 
+    Between the full updates sent every capabilities_full_update_interval
+    seconds, or when a scheduler asks for one, only the capabilities which
+    changed are sent, numbered so that the schedulers notice the updates
+    they missed.
+
     """
 
     def __init__(self, host=None, db_driver=None, service_name='undefined'):
         self.last_capabilities = None
+        # The capabilities last sent and their sequence number, by
+        # (service name, host, node)
+        self._sent_capabilities = {}
+        self._capability_seqs = {}
+        self._last_full_capabilities_update = None
+        self._capabilities_resync = False
         self.service_name = service_name
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         super(SchedulerDependentManager, self).__init__(host, db_driver)
@@ -226,13 +350,59 @@ class SchedulerDependentManager(Manager):
             capabilities = [capabilities]
         self.last_capabilities = capabilities
 
+    def publish_service_capabilities(self, context):
+        """Send a full capability update to the schedulers now."""
+        self._capabilities_resync = True
+        self._publish_service_capabilities(context)
+
+    def _full_capabilities_update_due(self):
+        interval = FLAGS.capabilities_full_update_interval
+        last_update = self._last_full_capabilities_update
+        return (self._capabilities_resync or last_update is None or
+                timeutils.is_older_than(last_update, interval))
+
     @periodic_task
     def _publish_service_capabilities(self, context):
         """Pass data back to the scheduler at a periodic interval."""
-        if self.last_capabilities:
+        if not self.last_capabilities:
+            return
+        if FLAGS.capabilities_full_update_interval <= 0:
             LOG.debug(_('Notifying Schedulers of capabilities ...'))
             for capability_item in self.last_capabilities:
                 name = capability_item.get('service_name', self.service_name)
                 host = capability_item.get('host', self.host)
                 self.scheduler_rpcapi.update_service_capabilities(context,
                         name, host, capability_item)
+            return
+
+        full = self._full_capabilities_update_due()
+        if full:
+            self._last_full_capabilities_update = timeutils.utcnow()
+            self._capabilities_resync = False
+        LOG.debug(_('Notifying Schedulers of capabilities ...'))
+        for capability_item in self.last_capabilities:
+            name = capability_item.get('service_name', self.service_name)
+            host = capability_item.get('host', self.host)
+            node = capability_item.get('hypervisor_hostname')
+            key = (name, host, node)
+            previous = self._sent_capabilities.get(key)
+            seq = self._capability_seqs.get(key, 0) + 1
+            if full or previous is None:
+                self.scheduler_rpcapi.update_service_capabilities(context,
+                        name, host, capability_item, seq=seq)
+            else:
+                changed = dict((k, v)
+                               for k, v in capability_item.iteritems()
+                               if k not in previous or previous[k] != v)
+                removed = [k for k in previous if k not in capability_item]
+                if not changed and not removed:
+                    continue
+                if node is not None:
+                    # The schedulers tell the nodes of a host apart by it.
+                    changed['hypervisor_hostname'] = node
+                self.scheduler_rpcapi.update_service_capabilities(context,
+                        name, host, changed, seq=seq, removed=removed,
+                        full=False)
+            self._capability_seqs[key] = seq
+            # The drivers may update the dicts they reported in place.
+            self._sent_capabilities[key] = copy.deepcopy(capability_item)
@@ -58,6 +58,23 @@ rpc_opts = [
     cfg.BoolOpt('fake_rabbit',
                 default=False,
                 help='If passed, use a fake RabbitMQ provider'),
+    cfg.IntOpt('rpc_envelope_version',
+               default=1,
+               help='Format of the rpc messages sent: 1 hands them as they '
+                    'are to the messaging driver, 2 sends them in an '
+                    'envelope encoded with rpc_serializer and compressed '
+                    'above rpc_compression_threshold bytes. Every service '
+                    'reads both, set 2 once they all run a version which '
+                    'does.'),
+    cfg.StrOpt('rpc_serializer',
+               default='json',
+               help='Encoding of the messages in version 2 envelopes, json '
+                    'or msgpack. msgpack needs the msgpack module on every '
+                    'service.'),
+    cfg.IntOpt('rpc_compression_threshold',
+               default=4096,
+               help='Size in bytes above which version 2 envelopes are '
+                    'compressed with zlib, 0 to never compress them'),
 ]
 
 cfg.CONF.register_opts(rpc_opts)
@@ -32,14 +32,27 @@ import uuid
 
 from eventlet import greenpool
 from eventlet import pools
+from eventlet import queue
 from eventlet import semaphore
 
+from nova.openstack.common import cfg
 from nova.openstack.common import excutils
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import local
 from nova.openstack.common.rpc import common as rpc_common
 
 
+amqp_opts = [
+    cfg.BoolOpt('amqp_rpc_single_reply_queue',
+                default=False,
+                help='Have each process consume the replies of all its '
+                     'calls from one long-lived queue, instead of '
+                     'declaring a queue per call. Every service must run '
+                     'a version handling such calls before it is enabled.'),
+    ]
+
+cfg.CONF.register_opts(amqp_opts)
+
 LOG = logging.getLogger(__name__)
 
 
@@ -51,6 +64,7 @@ class Pool(pools.Pool):
         kwargs.setdefault("max_size", self.conf.rpc_conn_pool_size)
         kwargs.setdefault("order_as_stack", True)
         super(Pool, self).__init__(*args, **kwargs)
+        self.reply_proxy = None
 
     # TODO(comstud): Timeout connections not used in a while
     def create(self):
@@ -60,9 +74,13 @@ class Pool(pools.Pool):
     def empty(self):
         while self.free_items:
             self.get().close()
+        if self.reply_proxy:
+            self.reply_proxy.close()
+            self.reply_proxy = None
 
 
 _pool_create_sem = semaphore.Semaphore()
+_reply_proxy_create_sem = semaphore.Semaphore()
 
 
 def get_connection_pool(conf, connection_cls):
@@ -148,12 +166,56 @@ class ConnectionContext(rpc_common.Connection):
             raise rpc_common.InvalidRPCConnectionReuse()
 
 
+class ReplyProxy(ConnectionContext):
+    """Connection consuming the replies to all the calls of the process
+    from a single queue, and handing them to the waiter of each call by
+    msg_id.
+    """
+
+    def __init__(self, conf, connection_pool):
+        self._call_waiters = {}
+        self._reply_q = 'reply_' + uuid.uuid4().hex
+        super(ReplyProxy, self).__init__(conf, connection_pool, pooled=False)
+        self.declare_direct_consumer(self._reply_q, self._process_data)
+        self.consume_in_thread()
+
+    def _process_data(self, message_data):
+        waiter = self._call_waiters.get(message_data.get('_msg_id'))
+        if not waiter:
+            # NOTE: Replies may carry secrets, such as auth tokens.
+            rpc_common._safe_log(LOG.warn, _('No call waiting for the '
+                                             'reply: %s'), message_data)
+        else:
+            del message_data['_msg_id']
+            waiter.put(message_data)
+
+    def add_call_waiter(self, waiter, msg_id):
+        self._call_waiters[msg_id] = waiter
+
+    def del_call_waiter(self, msg_id):
+        self._call_waiters.pop(msg_id, None)
+
+    def get_reply_q(self):
+        return self._reply_q
+
+
+def get_reply_proxy(conf, connection_pool):
+    with _reply_proxy_create_sem:
+        # Make sure only one thread declares the reply queue.
+        if not connection_pool.reply_proxy:
+            connection_pool.reply_proxy = ReplyProxy(conf, connection_pool)
+    return connection_pool.reply_proxy
+
+
 def msg_reply(conf, msg_id, connection_pool, reply=None, failure=None,
-              ending=False):
+              ending=False, reply_q=None):
     """Sends a reply or an error on the channel signified by msg_id.
 
     Failure should be a sys.exc_info() tuple.
 
+    If the caller sent a reply_q, the reply goes to that queue, shared by
+    all the calls of the caller's process, along with the msg_id.
+
     """
     with ConnectionContext(conf, connection_pool) as conn:
         if failure:
@@ -167,13 +229,18 @@ def msg_reply(conf, msg_id, connection_pool, reply=None, failure=None,
                    'failure': failure}
         if ending:
             msg['ending'] = True
-        conn.direct_send(msg_id, msg)
+        if reply_q:
+            msg['_msg_id'] = msg_id
+            conn.direct_send(reply_q, msg)
+        else:
+            conn.direct_send(msg_id, msg)
 
 
 class RpcContext(rpc_common.CommonRpcContext):
     """Context that supports replying to a rpc.call"""
     def __init__(self, **kwargs):
         self.msg_id = kwargs.pop('msg_id', None)
+        self.reply_q = kwargs.pop('reply_q', None)
         self.conf = kwargs.pop('conf')
         super(RpcContext, self).__init__(**kwargs)
 
@@ -181,13 +248,14 @@ class RpcContext(rpc_common.CommonRpcContext):
         values = self.to_dict()
         values['conf'] = self.conf
         values['msg_id'] = self.msg_id
+        values['reply_q'] = self.reply_q
         return self.__class__(**values)
 
     def reply(self, reply=None, failure=None, ending=False,
               connection_pool=None):
         if self.msg_id:
             msg_reply(self.conf, self.msg_id, connection_pool, reply, failure,
-                      ending)
+                      ending, self.reply_q)
             if ending:
                 self.msg_id = None
 
@@ -203,6 +271,7 @@ def unpack_context(conf, msg):
             value = msg.pop(key)
             context_dict[key[9:]] = value
     context_dict['msg_id'] = msg.pop('_msg_id', None)
+    context_dict['reply_q'] = msg.pop('_reply_q', None)
     context_dict['conf'] = conf
     ctx = RpcContext.from_dict(context_dict)
     rpc_common._safe_log(LOG.debug, _('unpacked context: %s'), ctx.to_dict())
@@ -277,6 +346,12 @@ class ProxyCallback(object):
             if inspect.isgenerator(rval):
                 for x in rval:
                     ctxt.reply(x, None, connection_pool=self.connection_pool)
+            elif ctxt.reply_q:
+                # Callers with a reply queue take the result and the end
+                # of the call from the same message.
+                ctxt.reply(rval, None, ending=True,
+                           connection_pool=self.connection_pool)
+                return
             else:
                 ctxt.reply(rval, None, connection_pool=self.connection_pool)
             # This final None tells multicall that it is done.
@@ -337,6 +412,59 @@ class MulticallWaiter(object):
             yield result
 
 
+class MulticallProxyWaiter(object):
+    """Waits for the replies to a call from the reply queue of the
+    process."""
+
+    def __init__(self, conf, msg_id, timeout, connection_pool):
+        self._msg_id = msg_id
+        self._timeout = timeout or conf.rpc_response_timeout
+        self._reply_proxy = connection_pool.reply_proxy
+        self._done = False
+        self._conf = conf
+        self._dataqueue = queue.LightQueue()
+        # Add this caller to the reply proxy's call_waiters
+        self._reply_proxy.add_call_waiter(self, self._msg_id)
+
+    def put(self, data):
+        self._dataqueue.put(data)
+
+    def done(self):
+        if self._done:
+            return
+        self._done = True
+        # Remove this caller from reply proxy's call_waiters
+        self._reply_proxy.del_call_waiter(self._msg_id)
+
+    def __iter__(self):
+        """Return the results until the reply marked as the ending.
+
+        The ending may carry the last result, unless it is None: call()
+        returns None anyway when there are no results.
+        """
+        if self._done:
+            raise StopIteration
+        while True:
+            try:
+                data = self._dataqueue.get(timeout=self._timeout)
+            except queue.Empty:
+                self.done()
+                LOG.error(_('Timed out waiting for RPC response to %s'),
+                          self._msg_id)
+                raise rpc_common.Timeout()
+            if data['failure']:
+                self.done()
+                raise rpc_common.deserialize_remote_exception(
+                        self._conf, data['failure'])
+            if not data.get('ending', False):
+                yield data['result']
+                continue
+            self.done()
+            if data.get('result') is not None:
+                yield data['result']
+            raise StopIteration
+
+
 def create_connection(conf, new, connection_pool):
     """Create a connection"""
     return ConnectionContext(conf, connection_pool, pooled=not new)
@@ -354,6 +482,15 @@ def multicall(conf, context, topic, msg, timeout, connection_pool):
     LOG.debug(_('MSG_ID is %s') % (msg_id))
     pack_context(msg, context)
 
+    if conf.amqp_rpc_single_reply_queue:
+        reply_proxy = get_reply_proxy(conf, connection_pool)
+        msg.update({'_reply_q': reply_proxy.get_reply_q()})
+        wait_msg = MulticallProxyWaiter(conf, msg_id, timeout,
+                                        connection_pool)
+        with ConnectionContext(conf, connection_pool) as conn:
+            conn.topic_send(topic, msg)
+        return wait_msg
+
     conn = ConnectionContext(conf, connection_pool)
     wait_msg = MulticallWaiter(conf, conn, timeout)
     conn.declare_direct_consumer(msg_id, wait_msg)
@@ -20,15 +20,47 @@
 import copy
 import logging
 import traceback
+import zlib
 
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import local
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 
 LOG = logging.getLogger(__name__)
 
+# Messages in an envelope are strings starting with the magic, followed by
+# the envelope version, the serializer and the compression of the message,
+# e.g. '\x00rpc 2 json zlib\n' and then the encoded message.
+_ENVELOPE_MAGIC = '\x00rpc'
+_ENVELOPE_VERSION = 2
+_NO_COMPRESSION = 'none'
+_ZLIB_COMPRESSION = 'zlib'
+
+
+def _json_dumps(data):
+    return str(jsonutils.dumps(data, ensure_ascii=True))
+
+
+def _msgpack_dumps(data):
+    return msgpack.packb(data, default=jsonutils.to_primitive)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, encoding='utf-8')
+
+
+# (dumps, loads) by serializer name
+_SERIALIZERS = {'json': (_json_dumps, jsonutils.loads)}
+if msgpack:
+    _SERIALIZERS['msgpack'] = (_msgpack_dumps, _msgpack_loads)
+
 
 class RPCException(Exception):
     message = _("An unknown RPC related exception occurred.")
@@ -72,6 +104,16 @@ class RemoteError(RPCException):
                                           traceback=traceback)
 
 
+class UnsupportedRpcEnvelopeVersion(RPCException):
+    message = _("Specified RPC envelope version, %(version)s, "
+                "not supported by this endpoint.")
+
+
+class UnsupportedRpcSerializer(RPCException):
+    message = _("Specified RPC serializer, %(serializer)s, "
+                "not supported by this endpoint.")
+
+
 class Timeout(RPCException):
     """Signifies that a timeout has occurred.
 
@@ -195,6 +237,58 @@ def _safe_log(log_func, msg, msg_data):
     return log_func(msg, msg_data)
 
 
+def serialize_msg(conf, raw_msg):
+    """Returns what to hand the messaging driver for a message.
+
+    With rpc_envelope_version 1, that is the message itself, which the
+    driver encodes as JSON.  With version 2, it is a string holding the
+    message encoded with rpc_serializer, compressed if it is larger than
+    rpc_compression_threshold.
+    """
+    if conf.rpc_envelope_version < _ENVELOPE_VERSION:
+        return raw_msg
+    if conf.rpc_envelope_version > _ENVELOPE_VERSION:
+        raise UnsupportedRpcEnvelopeVersion(
+                version=conf.rpc_envelope_version)
+
+    try:
+        dumps = _SERIALIZERS[conf.rpc_serializer][0]
+    except KeyError:
+        raise UnsupportedRpcSerializer(serializer=conf.rpc_serializer)
+    payload = dumps(raw_msg)
+    compression = _NO_COMPRESSION
+    threshold = conf.rpc_compression_threshold
+    if threshold and len(payload) > threshold:
+        payload = zlib.compress(payload)
+        compression = _ZLIB_COMPRESSION
+    return '%s %d %s %s\n%s' % (_ENVELOPE_MAGIC, _ENVELOPE_VERSION,
+                                conf.rpc_serializer, compression, payload)
+
+
+def is_enveloped(msg):
+    """Returns whether a message received was sent in an envelope."""
+    return isinstance(msg, str) and msg.startswith(_ENVELOPE_MAGIC)
+
+
+def deserialize_msg(msg):
+    """Returns the message sent, whether it was in an envelope or not, so
+    that services read the messages of both older and newer ones."""
+    if not is_enveloped(msg):
+        return msg
+
+    header, payload = msg.split('\n', 1)
+    version, serializer, compression = header.split(' ')[1:4]
+    if int(version) != _ENVELOPE_VERSION:
+        raise UnsupportedRpcEnvelopeVersion(version=version)
+    try:
+        loads = _SERIALIZERS[serializer][1]
+    except KeyError:
+        raise UnsupportedRpcSerializer(serializer=serializer)
+    if compression == _ZLIB_COMPRESSION:
+        payload = zlib.decompress(payload)
+    return loads(payload)
+
+
 def serialize_remote_exception(failure_info):
     """Prepares exception data to be sent over rpc.
 
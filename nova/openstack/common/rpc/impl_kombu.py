@@ -162,7 +162,7 @@ class ConsumerBase(object):
         def _callback(raw_message):
             message = self.channel.message_to_python(raw_message)
             try:
-                callback(message.payload)
+                callback(rpc_common.deserialize_msg(message.payload))
                 message.ack()
             except Exception:
                 LOG.exception(_("Failed to process message... skipping it."))
@@ -672,15 +672,18 @@ class Connection(object):
 
     def direct_send(self, msg_id, msg):
         """Send a 'direct' message"""
-        self.publisher_send(DirectPublisher, msg_id, msg)
+        self.publisher_send(DirectPublisher, msg_id,
+                            rpc_common.serialize_msg(self.conf, msg))
 
     def topic_send(self, topic, msg):
         """Send a 'topic' message"""
-        self.publisher_send(TopicPublisher, topic, msg)
+        self.publisher_send(TopicPublisher, topic,
+                            rpc_common.serialize_msg(self.conf, msg))
 
     def fanout_send(self, topic, msg):
         """Send a 'fanout' message"""
-        self.publisher_send(FanoutPublisher, topic, msg)
+        self.publisher_send(FanoutPublisher, topic,
+                            rpc_common.serialize_msg(self.conf, msg))
 
     def notify_send(self, topic, msg, **kwargs):
         """Send a notify message on a topic"""
@@ -139,7 +139,7 @@ class ConsumerBase(object):
         """Fetch the message and pass it to the callback object"""
         message = self.receiver.fetch()
         try:
-            self.callback(message.content)
+            self.callback(rpc_common.deserialize_msg(message.content))
         except Exception:
             LOG.exception(_("Failed to process message... skipping it."))
         finally:
@@ -477,15 +477,18 @@ class Connection(object):
 
     def direct_send(self, msg_id, msg):
         """Send a 'direct' message"""
-        self.publisher_send(DirectPublisher, msg_id, msg)
+        self.publisher_send(DirectPublisher, msg_id,
+                            rpc_common.serialize_msg(self.conf, msg))
 
     def topic_send(self, topic, msg):
         """Send a 'topic' message"""
-        self.publisher_send(TopicPublisher, topic, msg)
+        self.publisher_send(TopicPublisher, topic,
+                            rpc_common.serialize_msg(self.conf, msg))
 
     def fanout_send(self, topic, msg):
         """Send a 'fanout' message"""
-        self.publisher_send(FanoutPublisher, topic, msg)
+        self.publisher_send(FanoutPublisher, topic,
+                            rpc_common.serialize_msg(self.conf, msg))
 
     def notify_send(self, topic, msg, **kwargs):
         """Send a notify message on a topic"""
@@ -82,8 +82,11 @@ def _serialize(data):
     Serialization wrapper
     We prefer using JSON, but it cannot encode all types.
     Error if a developer passes us bad data.
+    With rpc_envelope_version 2, the data is sent in an envelope instead.
     """
     try:
+        if CONF.rpc_envelope_version > 1:
+            return rpc_common.serialize_msg(CONF, data)
         return str(jsonutils.dumps(data, ensure_ascii=True))
     except TypeError:
         LOG.error(_("JSON serialization failed."))
@@ -94,6 +97,8 @@ def _deserialize(data):
     """
     Deserialization wrapper
     """
+    if rpc_common.is_enveloped(data):
+        return rpc_common.deserialize_msg(data)
     LOG.debug(_("Deserializing: %s"), data)
     return jsonutils.loads(data)
 
@@ -232,7 +237,8 @@ class RpcContext(rpc_common.CommonRpcContext):
     @classmethod
     def marshal(self, ctx):
         ctx_data = ctx.to_dict()
-        return _serialize(ctx_data)
+        # The context goes inside the message, so it is not enveloped.
+        return str(jsonutils.dumps(ctx_data, ensure_ascii=True))
 
     @classmethod
     def unmarshal(self, data):
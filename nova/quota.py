@@ -74,6 +74,10 @@ quota_opts = [
     cfg.IntOpt('reservation_expire',
                default=86400,
                help='number of seconds until a reservation expires'),
+    cfg.IntOpt('reservation_expire_batch_size',
+               default=1000,
+               help='number of expired reservations rolled back per '
+                    'transaction (0 means all of them at once)'),
     cfg.IntOpt('until_refresh',
                default=0,
                help='count of reservations until usage is refreshed'),
@@ -83,6 +87,15 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
                help='default driver to use for quota checks'),
+    cfg.IntOpt('quota_usage_shards',
+               default=1,
+               help='number of rows the CounterQuotaDriver spreads the '
+                    'usage of each resource of a project over'),
+    cfg.IntOpt('quota_reconcile_interval',
+               default=600,
+               help='number of seconds between reconciliations of the '
+                    'CounterQuotaDriver usage counters with the actual '
+                    'resource counts'),
     ]
 
 FLAGS = flags.FLAGS
@@ -312,15 +325,7 @@ class DbQuotaDriver(object):
                        value will be treated as a number of seconds).
         """
 
-        # Set up the reservation expiration
-        if expire is None:
-            expire = FLAGS.reservation_expire
-        if isinstance(expire, (int, long)):
-            expire = datetime.timedelta(seconds=expire)
-        if isinstance(expire, datetime.timedelta):
-            expire = timeutils.utcnow() + expire
-        if not isinstance(expire, datetime.datetime):
-            raise exception.InvalidReservationExpiration(expire=expire)
+        expire = self._get_expire(expire)
 
         # Get the applicable quotas.
         # NOTE(Vek): We're not worried about races at this point.
@@ -337,6 +342,21 @@ class DbQuotaDriver(object):
         return db.quota_reserve(context, resources, quotas, deltas, expire,
                                 FLAGS.until_refresh, FLAGS.max_age)
 
+    def _get_expire(self, expire):
+        """Return the absolute expiration time of a reservation, see
+        reserve().
+        """
+
+        if expire is None:
+            expire = FLAGS.reservation_expire
+        if isinstance(expire, (int, long)):
+            expire = datetime.timedelta(seconds=expire)
+        if isinstance(expire, datetime.timedelta):
+            expire = timeutils.utcnow() + expire
+        if not isinstance(expire, datetime.datetime):
+            raise exception.InvalidReservationExpiration(expire=expire)
+        return expire
+
     def commit(self, context, reservations):
         """Commit reservations.
 
@@ -372,12 +392,115 @@ class DbQuotaDriver(object):
         """Expire reservations.
 
         Explores all currently existing reservations and rolls back
-        any that have expired.
+        any that have expired, --reservation_expire_batch_size per
+        transaction, and returns how many were rolled back.
 
         :param context: The request context, for access checks.
         """
 
-        db.reservation_expire(context)
+        return db.reservation_expire(context,
+                                     FLAGS.reservation_expire_batch_size)
+
+    def expire_backlog(self, context):
+        """Return the number of expired reservations which are yet to
+        be rolled back.
+
+        :param context: The request context, for access checks.
+        """
+
+        return db.reservation_expire_backlog(context)
+
+    def reconcile(self, context, resources):
+        """Reconcile usages with the actual resource counts.
+
+        Usages are refreshed by reserve() as configured by
+        --until_refresh and --max_age, so there is nothing to do.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        """
+
+        pass
+
+
+class CounterQuotaDriver(DbQuotaDriver):
+    """
+    Driver that keeps the usage of each resource in counters which are
+    only changed by atomic increments, instead of locking all the
+    usages of the project while reserving.  Reservations for different
+    resources never wait for each other, and the counters of a busy
+    project can be spread over --quota_usage_shards rows so that
+    reservations for the same resource don't either.
+
+    The usages are not refreshed while reserving.  Instead, reconcile()
+    corrects them against the actual counts, which the scheduler does
+    every --quota_reconcile_interval seconds.
+
+    The usages are stored in the same table as the DbQuotaDriver's.
+    Switching back to the DbQuotaDriver with more than one shard
+    requires removing the quota usages first, which are then rebuilt.
+    """
+
+    def reserve(self, context, resources, deltas, expire=None):
+        """Check quotas and reserve resources.
+
+        See DbQuotaDriver.reserve().  The usages are not refreshed.
+        """
+
+        expire = self._get_expire(expire)
+        quotas = self._get_quotas(context, resources, deltas.keys(),
+                                  has_sync=True)
+
+        return db.quota_counter_reserve(context, quotas, deltas, expire,
+                                        max(FLAGS.quota_usage_shards, 1))
+
+    def commit(self, context, reservations):
+        """Commit reservations.
+
+        :param context: The request context, for access checks.
+        :param reservations: A list of the reservation UUIDs, as
+                             returned by the reserve() method.
+        """
+
+        db.quota_counter_commit(context, reservations)
+
+    def rollback(self, context, reservations):
+        """Roll back reservations.
+
+        :param context: The request context, for access checks.
+        :param reservations: A list of the reservation UUIDs, as
+                             returned by the reserve() method.
+        """
+
+        db.quota_counter_rollback(context, reservations)
+
+    def expire(self, context):
+        """Expire reservations.
+
+        Explores all currently existing reservations and rolls back
+        any that have expired, --reservation_expire_batch_size per
+        transaction, and returns how many were rolled back.
+
+        :param context: The request context, for access checks.
+        """
+
+        return db.quota_counter_expire(context,
+                                       FLAGS.reservation_expire_batch_size)
+
+    def reconcile(self, context, resources):
+        """Reconcile usages with the actual resource counts.
+
+        Corrects the in_use counts of all projects against the counts
+        of the resources' usage synchronization functions, and their
+        reserved counts against the outstanding reservations.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        """
+
+        sync_resources = dict((k, v) for k, v in resources.items()
+                              if hasattr(v, 'sync'))
+        db.quota_counter_reconcile(context, sync_resources)
 
 
 class BaseResource(object):
@@ -749,12 +872,29 @@ class QuotaEngine(object):
         """Expire reservations.
 
         Explores all currently existing reservations and rolls back
-        any that have expired.
+        any that have expired, and returns how many were rolled back.
+
+        :param context: The request context, for access checks.
+        """
+
+        return self._driver.expire(context)
+
+    def expire_backlog(self, context):
+        """Return the number of expired reservations which are yet to
+        be rolled back by expire().
+
+        :param context: The request context, for access checks.
+        """
+
+        return self._driver.expire_backlog(context)
+
+    def reconcile(self, context):
+        """Reconcile usages with the actual resource counts.
 
         :param context: The request context, for access checks.
         """
 
-        self._driver.expire(context)
+        self._driver.reconcile(context, self._resources)
 
     @property
     def resources(self):
@@ -38,6 +38,7 @@ from nova.openstack.common import log as logging
 from nova.openstack.common.notifier import api as notifier
 from nova.openstack.common import rpc
 from nova.openstack.common import timeutils
+from nova import servicegroup
 from nova import utils
 
 
@@ -180,19 +181,23 @@ class Scheduler(object):
                 FLAGS.scheduler_host_manager)
         self.compute_api = compute_api.API()
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
+        self.servicegroup_api = servicegroup.API()
 
-    def update_service_capabilities(self, service_name, host, capabilities):
-        """Process a capability update from a service node."""
-        self.host_manager.update_service_capabilities(service_name,
-                host, capabilities)
+    def update_service_capabilities(self, service_name, host, capabilities,
+                                    seq=None, removed=None, full=True):
+        """Process a capability update from a service node.
+
+        Returns False if updates from the service node went missing.
+        """
+        return self.host_manager.update_service_capabilities(service_name,
+                host, capabilities, seq=seq, removed=removed, full=full)
 
     def hosts_up(self, context, topic):
         """Return the list of hosts that have a running service for topic."""
 
         services = db.service_get_all_by_topic(context, topic)
         return [service['host']
-                for service in services
-                if utils.service_is_up(service)]
+                for service in self.servicegroup_api.get_up_services(services)]
 
     def schedule_prep_resize(self, context, image, request_spec,
                              filter_properties, instance, instance_type,
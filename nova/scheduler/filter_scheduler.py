@@ -19,11 +19,13 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
 import operator
 
 from nova import db
 from nova import exception
 from nova import flags
+from nova.openstack.common import cfg
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common.notifier import api as notifier
@@ -32,7 +34,30 @@ from nova.scheduler import least_cost
 from nova.scheduler import scheduler_options
 
 
+filter_scheduler_opts = [
+    cfg.BoolOpt('scheduler_group_run_instance_casts',
+                default=False,
+                help='Send the instances of a multi-instance request that '
+                     'were scheduled to the same compute host in a single '
+                     'run_instances cast.  All compute nodes must support '
+                     'compute RPC API version 2.3.'),
+    cfg.BoolOpt('scheduler_optimistic_claims',
+                default=False,
+                help='Claim the resources of each scheduled instance from '
+                     'the compute node in the db, failing if the compute '
+                     'node changed since it was loaded.  Enable this when '
+                     'running more than one nova-scheduler, so that they '
+                     'don\'t place instances on the same free resources.'),
+    cfg.IntOpt('scheduler_claim_max_conflicts',
+               default=3,
+               help='Number of times a host whose resources changed while '
+                    'it was being claimed is reloaded and considered again '
+                    'within one request, when scheduler_optimistic_claims '
+                    'is enabled.'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(filter_scheduler_opts)
 LOG = logging.getLogger(__name__)
 
 
@@ -60,7 +85,6 @@ class FilterScheduler(driver.Scheduler):
 
         Returns a list of the instances created.
         """
-        elevated = context.elevated()
         instance_uuids = request_spec.get('instance_uuids')
         num_instances = len(instance_uuids)
         LOG.debug(_("Attempting to build %(num_instances)d instance(s)") %
@@ -77,6 +101,44 @@ class FilterScheduler(driver.Scheduler):
         # contains an instance of RpcContext that cannot be serialized.
         filter_properties.pop('context', None)
 
+        if FLAGS.scheduler_group_run_instance_casts:
+            self._provision_resources_by_host(context, weighted_hosts,
+                    request_spec, filter_properties, requested_networks,
+                    injected_files, admin_password, is_first_time,
+                    instance_uuids)
+        else:
+            self._provision_resources(context, weighted_hosts,
+                    request_spec, filter_properties, requested_networks,
+                    injected_files, admin_password, is_first_time,
+                    instance_uuids)
+
+        notifier.notify(context, notifier.publisher_id("scheduler"),
+                        'scheduler.run_instance.end', notifier.INFO, payload)
+
+    def schedule_prep_resize(self, context, image, request_spec,
+                             filter_properties, instance, instance_type,
+                             reservations):
+        """Select a target for resize.
+
+        Selects a target host for the instance, post-resize, and casts
+        the prep_resize operation to it.
+        """
+
+        hosts = self._schedule(context, 'compute', request_spec,
+                               filter_properties, [instance['uuid']])
+        if not hosts:
+            raise exception.NoValidHost(reason="")
+        host = hosts.pop(0)
+
+        # Forward off to the host
+        self.compute_rpcapi.prep_resize(context, image, instance,
+                instance_type, host.host_state.host, reservations)
+
+    def _provision_resources(self, context, weighted_hosts, request_spec,
+            filter_properties, requested_networks, injected_files,
+            admin_password, is_first_time, instance_uuids):
+        """Provision each instance with its own run_instance cast."""
+        elevated = context.elevated()
         for num, instance_uuid in enumerate(instance_uuids):
             request_spec['instance_properties']['launch_index'] = num
 
@@ -104,32 +166,98 @@ class FilterScheduler(driver.Scheduler):
             retry = filter_properties.get('retry', {})
             retry['hosts'] = []
 
-        notifier.notify(context, notifier.publisher_id("scheduler"),
-                        'scheduler.run_instance.end', notifier.INFO, payload)
-
-    def schedule_prep_resize(self, context, image, request_spec,
-                             filter_properties, instance, instance_type,
-                             reservations):
-        """Select a target for resize.
-
-        Selects a target host for the instance, post-resize, and casts
-        the prep_resize operation to it.
+    def _provision_resources_by_host(self, context, weighted_hosts,
+            request_spec, filter_properties, requested_networks,
+            injected_files, admin_password, is_first_time, instance_uuids):
+        """Provision the instances with one run_instances cast per
+        selected compute node, which passes the launch index of each
+        instance in the request_spec's launch_indexes.
         """
+        elevated = context.elevated()
+        hosts = []
+        instances_by_node = {}
+        launch_indexes_by_node = {}
+        for num, instance_uuid in enumerate(instance_uuids):
+            request_spec['instance_properties']['launch_index'] = num
 
-        hosts = self._schedule(context, 'compute', request_spec,
-                               filter_properties, [instance['uuid']])
-        if not hosts:
-            raise exception.NoValidHost(reason="")
-        host = hosts.pop(0)
+            try:
+                try:
+                    weighted_host = weighted_hosts.pop(0)
+                except IndexError:
+                    raise exception.NoValidHost(reason="")
 
-        # Forward off to the host
-        self.compute_rpcapi.prep_resize(context, image, instance,
-                instance_type, host.host_state.host, reservations)
+                updated_instance = self._schedule_instance_on_host(elevated,
+                        weighted_host, request_spec, filter_properties,
+                        instance_uuid)
+            except Exception as ex:
+                # NOTE(vish): we don't reraise the exception here to make sure
+                #             that all instances in the request get set to
+                #             error properly
+                driver.handle_schedule_error(context, ex, instance_uuid,
+                                             request_spec)
+                continue
+            finally:
+                # scrub retry host list, it's set per host below:
+                retry = filter_properties.get('retry', {})
+                retry['hosts'] = []
+
+            host_state = weighted_host.host_state
+            # NOTE: The nodes of a host each have their own limits.
+            node = (host_state.host, host_state.nodename)
+            if node not in instances_by_node:
+                hosts.append(host_state)
+                instances_by_node[node] = []
+                launch_indexes_by_node[node] = {}
+            instances_by_node[node].append(updated_instance)
+            launch_indexes_by_node[node][instance_uuid] = num
+
+        for host_state in hosts:
+            node = (host_state.host, host_state.nodename)
+            instances = instances_by_node[node]
+            launch_indexes = launch_indexes_by_node[node]
+            self._add_retry_host(filter_properties, host_state.host)
+            self._add_oversubscription_policy(filter_properties, host_state)
+            request_spec['instance_properties']['launch_index'] = min(
+                    launch_indexes.values())
+            request_spec['launch_indexes'] = launch_indexes
+            try:
+                self.compute_rpcapi.run_instances(elevated,
+                        instances=instances, host=host_state.host,
+                        request_spec=request_spec,
+                        filter_properties=filter_properties,
+                        requested_networks=requested_networks,
+                        injected_files=injected_files,
+                        admin_password=admin_password,
+                        is_first_time=is_first_time)
+            except Exception as ex:
+                for instance in instances:
+                    driver.handle_schedule_error(context, ex,
+                            instance['uuid'], request_spec)
+            retry = filter_properties.get('retry', {})
+            retry['hosts'] = []
+        request_spec.pop('launch_indexes', None)
 
     def _provision_resource(self, context, weighted_host, request_spec,
             filter_properties, requested_networks, injected_files,
             admin_password, is_first_time, instance_uuid=None):
         """Create the requested resource in this Zone."""
+        updated_instance = self._schedule_instance_on_host(context,
+                weighted_host, request_spec, filter_properties,
+                instance_uuid)
+
+        self.compute_rpcapi.run_instance(context, instance=updated_instance,
+                host=weighted_host.host_state.host,
+                request_spec=request_spec, filter_properties=filter_properties,
+                requested_networks=requested_networks,
+                injected_files=injected_files,
+                admin_password=admin_password, is_first_time=is_first_time)
+
+    def _schedule_instance_on_host(self, context, weighted_host,
+            request_spec, filter_properties, instance_uuid):
+        """Record the selected host for an instance and notify about it.
+
+        Returns the updated instance.
+        """
         # Add a retry entry for the selected compute host:
         self._add_retry_host(filter_properties, weighted_host.host_state.host)
 
@@ -155,13 +283,7 @@ class FilterScheduler(driver.Scheduler):
                 system_metadata=smd_dic)
         # Ensure system_metadata is loaded and included in rpc payload
         updated_instance.get('system_metadata')
-
-        self.compute_rpcapi.run_instance(context, instance=updated_instance,
-                host=weighted_host.host_state.host,
-                request_spec=request_spec, filter_properties=filter_properties,
-                requested_networks=requested_networks,
-                injected_files=injected_files,
-                admin_password=admin_password, is_first_time=is_first_time)
+        return updated_instance
 
     def _add_retry_host(self, filter_properties, host):
         """Add a retry entry for the selected compute host.  In the event that
@@ -257,10 +379,12 @@ class FilterScheduler(driver.Scheduler):
         self.populate_filter_properties(request_spec,
                                         filter_properties)
 
-        # Find our local list of acceptable hosts by repeatedly
-        # filtering and weighing our options. Each time we choose a
-        # host, we virtually consume resources on it so subsequent
-        # selections can adjust accordingly.
+        # Find our local list of acceptable hosts by filtering and
+        # weighing our options once. Each time we choose a host, we
+        # virtually consume resources on it so subsequent selections can
+        # adjust accordingly. Filters and cost functions only look at
+        # the host they are given, so only the chosen host has to be
+        # filtered and weighed again before the next selection.
 
         # unfiltered_hosts_dict is {host : ZoneManager.HostInfo()}
         unfiltered_hosts_dict = self.host_manager.get_all_host_states(
@@ -271,36 +395,65 @@ class FilterScheduler(driver.Scheduler):
         # are being scanned in a filter or weighing function.
         hosts = unfiltered_hosts_dict.itervalues()
 
+        # Filter local hosts based on requirements ...
+        hosts = self.host_manager.filter_hosts(hosts, filter_properties)
+        LOG.debug(_("Filtered %(hosts)s") % locals())
+
+        # TODO(comstud): filter_properties will also be used for
+        # weighing and I plan fold weighing into the host manager
+        # in a future patch.  I'll address the naming of this
+        # variable at that time.
+        cost_table = least_cost.HostCostTable(cost_functions,
+                                              filter_properties)
+        # The index breaks ties in favor of the earlier host, as
+        # least_cost.weighted_sum() does.
+        host_heap = [(cost_table.cost(host_state), index, host_state)
+                     for index, host_state in enumerate(hosts)]
+        heapq.heapify(host_heap)
+
         selected_hosts = []
         if instance_uuids:
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
-        for num in xrange(num_instances):
-            # Filter local hosts based on requirements ...
-            hosts = self.host_manager.filter_hosts(hosts,
-                    filter_properties)
-            if not hosts:
+        conflicts = 0
+        while len(selected_hosts) < num_instances:
+            if not host_heap:
                 # Can't get any more locally.
                 break
 
-            LOG.debug(_("Filtered %(hosts)s") % locals())
-
             # weighted_host = WeightedHost() ... the best
             # host for the job.
-            # TODO(comstud): filter_properties will also be used for
-            # weighing and I plan fold weighing into the host manager
-            # in a future patch.  I'll address the naming of this
-            # variable at that time.
-            weighted_host = least_cost.weighted_sum(cost_functions,
-                    hosts, filter_properties)
+            cost, index, host_state = heapq.heappop(host_heap)
+            if (FLAGS.scheduler_optimistic_claims and
+                    not self.host_manager.claim_resources(
+                        elevated, host_state, instance_properties)):
+                # Another scheduler got to the host first.  It has been
+                # reloaded, so weigh and filter it again before retrying.
+                conflicts += 1
+                cost_table.host_changed(host_state)
+                if (conflicts <= FLAGS.scheduler_claim_max_conflicts and
+                        self.host_manager.filter_hosts([host_state],
+                                                       filter_properties)):
+                    heapq.heappush(host_heap,
+                                   (cost_table.cost(host_state), index,
+                                    host_state))
+                continue
+
+            weighted_host = least_cost.WeightedHost(cost,
+                                                    host_state=host_state)
             LOG.debug(_("Weighted %(weighted_host)s") % locals())
             selected_hosts.append(weighted_host)
 
             # Now consume the resources so the filter/weights
             # will change for the next instance.
-            weighted_host.host_state.consume_from_instance(
-                    instance_properties)
+            host_state.consume_from_instance(instance_properties)
+            cost_table.host_changed(host_state)
+            if self.host_manager.filter_hosts([host_state],
+                                              filter_properties):
+                heapq.heappush(host_heap,
+                               (cost_table.cost(host_state), index,
+                                host_state))
 
         selected_hosts.sort(key=operator.attrgetter('weight'))
         return selected_hosts
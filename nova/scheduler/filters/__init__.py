@@ -30,6 +30,16 @@ class BaseHostFilter(object):
     def host_passes(self, host_state, filter_properties):
         raise NotImplementedError()
 
+    def filter_all(self, host_states, filter_properties):
+        """Return the list of host states that pass this filter.
+
+        By default host_passes() is called for each host.  Filters that
+        can decide for a whole set of hosts at once, for example with an
+        index built from a single db query, should override this.
+        """
+        return [host_state for host_state in host_states
+                if self.host_passes(host_state, filter_properties)]
+
     def _full_name(self):
         """module.classname of the filter."""
         return "%s.%s" % (self.__module__, self.__class__.__name__)
@@ -38,7 +38,23 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
 
         context = filter_properties['context'].elevated()
         metadata = db.aggregate_metadata_get_by_host(context, host_state.host)
+        return self._satisfies_extra_specs(host_state, metadata,
+                                           instance_type)
 
+    def filter_all(self, host_states, filter_properties):
+        """Same as host_passes() with one query for all hosts."""
+        instance_type = filter_properties.get('instance_type')
+        if 'extra_specs' not in instance_type:
+            return list(host_states)
+
+        context = filter_properties['context'].elevated()
+        metadata_by_host = db.aggregate_metadata_get_all_by_host(context)
+        return [host_state for host_state in host_states
+                if self._satisfies_extra_specs(host_state,
+                        metadata_by_host.get(host_state.host, {}),
+                        instance_type)]
+
+    def _satisfies_extra_specs(self, host_state, metadata, instance_type):
         for key, req in instance_type['extra_specs'].iteritems():
             # NOTE(jogo) any key containing a scope (scope is terminated
             # by a `:') will be ignored by this filter. (bug 1039386)
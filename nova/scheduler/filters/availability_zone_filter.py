@@ -20,11 +20,25 @@ from nova.scheduler import filters
 class AvailabilityZoneFilter(filters.BaseHostFilter):
     """Filters Hosts by availability zone."""
 
-    def host_passes(self, host_state, filter_properties):
+    def _requested_zone(self, filter_properties):
         spec = filter_properties.get('request_spec', {})
         props = spec.get('instance_properties', {})
-        availability_zone = props.get('availability_zone')
+        return props.get('availability_zone')
+
+    def host_passes(self, host_state, filter_properties):
+        availability_zone = self._requested_zone(filter_properties)
 
         if availability_zone:
             return availability_zone == host_state.service['availability_zone']
         return True
+
+    def filter_all(self, host_states, filter_properties):
+        availability_zone = self._requested_zone(filter_properties)
+        if not availability_zone:
+            return list(host_states)
+
+        hosts_by_zone = {}
+        for host_state in host_states:
+            zone = host_state.service['availability_zone']
+            hosts_by_zone.setdefault(zone, []).append(host_state)
+        return hosts_by_zone.get(availability_zone, [])
@@ -49,3 +49,10 @@ class ComputeCapabilitiesFilter(filters.BaseHostFilter):
                     "requirements"), locals())
             return False
         return True
+
+    def filter_all(self, host_states, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        if 'extra_specs' not in instance_type:
+            return list(host_states)
+        return super(ComputeCapabilitiesFilter, self).filter_all(
+                host_states, filter_properties)
@@ -15,6 +15,7 @@
 
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova import servicegroup
 from nova import utils
 
 
@@ -26,13 +27,31 @@ class ComputeFilter(filters.BaseHostFilter):
 
     def host_passes(self, host_state, filter_properties):
         """Returns True for only active compute nodes"""
+        return self._host_passes(host_state, filter_properties,
+                                 utils.service_is_up)
+
+    def filter_all(self, host_states, filter_properties):
+        """Returns the active compute nodes, asking the servicegroup API
+        which of their services are up once for all of them."""
+        host_states = list(host_states)
+        if not filter_properties.get('instance_type'):
+            return host_states
+        services = [host_state.service for host_state in host_states
+                    if host_state.topic == 'compute']
+        up = set(id(service) for service in
+                 servicegroup.API().get_up_services(services))
+        return [host_state for host_state in host_states
+                if self._host_passes(host_state, filter_properties,
+                                     lambda service: id(service) in up)]
+
+    def _host_passes(self, host_state, filter_properties, service_is_up):
         instance_type = filter_properties.get('instance_type')
         if host_state.topic != 'compute' or not instance_type:
             return True
         capabilities = host_state.capabilities
         service = host_state.service
 
-        if not utils.service_is_up(service) or service['disabled']:
+        if not service_is_up(service) or service['disabled']:
             LOG.debug(_("%(host_state)s is disabled or has not been "
                     "heard from in a while"), locals())
             return False
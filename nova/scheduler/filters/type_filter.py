@@ -38,6 +38,15 @@ class TypeAffinityFilter(filters.BaseHostFilter):
                      context, host_state.host, instance_type['id'])
         return len(instances_other_type) == 0
 
+    def filter_all(self, host_states, filter_properties):
+        """Same as host_passes() with one query for all hosts."""
+        instance_type = filter_properties.get('instance_type')
+        context = filter_properties['context'].elevated()
+        other_type_hosts = db.instance_get_hosts_by_not_type(context,
+                instance_type['id'])
+        return [host_state for host_state in host_states
+                if host_state.host not in other_type_hosts]
+
 
 class AggregateTypeAffinityFilter(filters.BaseHostFilter):
     """AggregateTypeAffinityFilter limits instance_type by aggregate
@@ -51,5 +60,19 @@ class AggregateTypeAffinityFilter(filters.BaseHostFilter):
         context = filter_properties['context'].elevated()
         metadata = db.aggregate_metadata_get_by_host(
                      context, host_state.host, key='instance_type')
+        return self._type_allowed(metadata, instance_type)
+
+    def filter_all(self, host_states, filter_properties):
+        """Same as host_passes() with one query for all hosts."""
+        instance_type = filter_properties.get('instance_type')
+        context = filter_properties['context'].elevated()
+        metadata_by_host = db.aggregate_metadata_get_all_by_host(context,
+                key='instance_type')
+        return [host_state for host_state in host_states
+                if self._type_allowed(metadata_by_host.get(host_state.host,
+                                                           {}),
+                                      instance_type)]
+
+    def _type_allowed(self, metadata, instance_type):
         return (len(metadata) == 0 or
                 instance_type['name'] in metadata['instance_type'])
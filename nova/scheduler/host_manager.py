@@ -17,6 +17,7 @@
 Manage hosts in the current zone.
 """
 
+import time
 import UserDict
 
 from nova.compute import task_states
@@ -47,6 +48,18 @@ host_manager_opts = [
                   ],
                 help='Which filter class names to use for filtering hosts '
                       'when not specified in the request.'),
+    cfg.IntOpt('scheduler_host_state_resync_interval',
+               default=60,
+               help='Interval in seconds between full reloads of the '
+                    'scheduler host state cache from the compute_nodes '
+                    'table.  In between, only compute nodes that changed '
+                    'since the previous request are reloaded.  Set to 0 '
+                    'to reload every compute node on every request.'),
+    cfg.BoolOpt('scheduler_order_filters_by_cost',
+                default=True,
+                help='Run the scheduler filters cheapest and most selective '
+                     'first, based on how they have performed so far, '
+                     'instead of in the order they are configured.'),
     ]
 
 FLAGS = flags.FLAGS
@@ -99,14 +112,14 @@ class HostState(object):
         self.topic = topic
         self.nodename = nodename
 
+        # The compute node this state was loaded from, and its generation
+        # at the time, for claiming resources from it in the db.
+        self.compute_id = None
+        self.generation = 0
+
         # Read-only capability dicts
+        self.update_capabilities(capabilities or {}, service or {})
 
-        if capabilities is None:
-            capabilities = {}
-        self.capabilities = ReadOnlyDict(capabilities.get(topic, None))
-        if service is None:
-            service = {}
-        self.service = ReadOnlyDict(service)
         # Mutable available resources.
         # These will change as resources are virtually "consumed".
         self.total_usable_disk_gb = 0
@@ -115,11 +128,6 @@ class HostState(object):
         self.free_disk_mb = 0
         self.vcpus_total = 0
         self.vcpus_used = 0
-        # Valid vm types on this host: 'pv', 'hvm' or 'all'
-        if 'allowed_vm_type' in self.capabilities:
-            self.allowed_vm_type = self.capabilities['allowed_vm_type']
-        else:
-            self.allowed_vm_type = 'all'
 
         # Additional host information from the compute node stats:
         self.vm_states = {}
@@ -132,8 +140,24 @@ class HostState(object):
         # Resource oversubscription values for the compute host:
         self.limits = {}
 
+    def update_capabilities(self, capabilities=None, service=None):
+        """Replace the read-only capability and service information.
+        Passing None for either leaves the current value in place.
+        """
+        if capabilities is not None:
+            self.capabilities = ReadOnlyDict(capabilities.get(self.topic,
+                                                              None))
+            # Valid vm types on this host: 'pv', 'hvm' or 'all'
+            self.allowed_vm_type = self.capabilities.get('allowed_vm_type',
+                                                         'all')
+        if service is not None:
+            self.service = ReadOnlyDict(service)
+
     def update_from_compute_node(self, compute):
         """Update information about a host from its compute_node info."""
+        self.compute_id = compute.get('id')
+        self.generation = compute.get('generation') or 0
+
         all_ram_mb = compute['memory_mb']
 
         # Assume virtual size is all consumed by instances if use qcow2 disk.
@@ -154,6 +178,13 @@ class HostState(object):
         stats = compute.get('stats', [])
         statmap = self._statmap(stats)
 
+        # Drop anything consumed since the last update; the stats are
+        # authoritative.
+        self.num_instances_by_project = {}
+        self.vm_states = {}
+        self.task_states = {}
+        self.num_instances_by_os_type = {}
+
         # Track number of instances on host
         self.num_instances = int(statmap.get('num_instances', 0))
 
@@ -232,32 +263,6 @@ class HostState(object):
     def _statmap(self, stats):
         return dict((st['key'], st['value']) for st in stats)
 
-    def passes_filters(self, filter_fns, filter_properties):
-        """Return whether or not this host passes filters."""
-
-        if self.host in filter_properties.get('ignore_hosts', []):
-            LOG.debug(_('Host filter fails for ignored host %(host)s'),
-                      {'host': self.host})
-            return False
-
-        force_hosts = filter_properties.get('force_hosts', [])
-        if force_hosts:
-            if not self.host in force_hosts:
-                LOG.debug(_('Host filter fails for non-forced host %(host)s'),
-                          {'host': self.host})
-            return self.host in force_hosts
-
-        for filter_fn in filter_fns:
-            if not filter_fn(self, filter_properties):
-                LOG.debug(_('Host filter function %(func)s failed for '
-                            '%(host)s'),
-                          {'func': repr(filter_fn),
-                           'host': self.host})
-                return False
-
-        LOG.debug(_('Host filter passes for %(host)s'), {'host': self.host})
-        return True
-
     def __repr__(self):
         host_node = self.host
         if self.nodename is not None:
@@ -275,14 +280,26 @@ class HostManager(object):
 
     def __init__(self):
         self.service_states = {}  # { <host> : { <service> : { cap k : v }}}
+        # Sequence number of the last capability update by (host, service),
+        # None while waiting for a full update after missing some.
+        self.service_seqs = {}
+        # Cached HostStates, kept up to date by get_all_host_states().
+        self.host_state_map = {}  # { <host[/node]> : HostState }
+        self._compute_node_hosts = {}  # { <compute id> : <host[/node]> }
+        self._last_refresh = None
+        self._last_full_refresh = None
         self.filter_classes = filters.get_filter_classes(
                 FLAGS.scheduler_available_filters)
+        self.filter_obj_map = {}  # { <filter class name> : filter }
+        # { <filter class name> : { 'hosts_in': int, 'hosts_out': int,
+        #                           'seconds': float } }
+        self.filter_stats = {}
 
     def _choose_host_filters(self, filters):
         """Since the caller may specify which filters to use we need
         to have an authoritative list of what is permissible. This
         function checks the filter names against a predefined set
-        of acceptable filters.
+        of acceptable filters and returns the filter objects to use.
         """
         if filters is None:
             filters = FLAGS.scheduler_default_filters
@@ -295,12 +312,9 @@ class HostManager(object):
             for cls in self.filter_classes:
                 if cls.__name__ == filter_name:
                     found_class = True
-                    filter_instance = cls()
-                    # Get the filter function
-                    filter_func = getattr(filter_instance,
-                            'host_passes', None)
-                    if filter_func:
-                        good_filters.append(filter_func)
+                    if filter_name not in self.filter_obj_map:
+                        self.filter_obj_map[filter_name] = cls()
+                    good_filters.append(self.filter_obj_map[filter_name])
                     break
             if not found_class:
                 bad_filters.append(filter_name)
@@ -309,29 +323,136 @@ class HostManager(object):
             raise exception.SchedulerHostFilterNotFound(filter_name=msg)
         return good_filters
 
+    def _filter_rank(self, filter_obj):
+        """Rank a filter by its cost per host divided by the fraction of
+        hosts it rejects, so cheap and selective filters get a low rank.
+        Filters that have not run yet rank first so they get measured.
+        """
+        stats = self.filter_stats.get(filter_obj.__class__.__name__)
+        if not stats or not stats['hosts_in']:
+            return 0.0
+        cost = stats['seconds'] / stats['hosts_in']
+        rejected = 1.0 - float(stats['hosts_out']) / stats['hosts_in']
+        return cost / max(rejected, 0.0001)
+
+    def _run_filter(self, filter_obj, hosts, filter_properties):
+        """Run one filter over a list of hosts, tracking its cost and
+        selectivity.
+        """
+        start = time.time()
+        filter_all = getattr(filter_obj, 'filter_all', None)
+        if filter_all is not None:
+            passed_hosts = list(filter_all(hosts, filter_properties))
+        else:
+            passed_hosts = [host for host in hosts
+                            if filter_obj.host_passes(host,
+                                                      filter_properties)]
+        elapsed = time.time() - start
+
+        filter_name = filter_obj.__class__.__name__
+        stats = self.filter_stats.setdefault(filter_name,
+                dict(hosts_in=0, hosts_out=0, seconds=0.0))
+        stats['hosts_in'] += len(hosts)
+        stats['hosts_out'] += len(passed_hosts)
+        stats['seconds'] += elapsed
+
+        LOG.debug(_('Host filter %(filter_name)s passed %(passed)d of '
+                    '%(total)d hosts'),
+                  {'filter_name': filter_name, 'passed': len(passed_hosts),
+                   'total': len(hosts)})
+        return passed_hosts
+
     def filter_hosts(self, hosts, filter_properties, filters=None):
         """Filter hosts and return only ones passing all filters"""
-        filtered_hosts = []
-        filter_fns = self._choose_host_filters(filters)
-        for host in hosts:
-            if host.passes_filters(filter_fns, filter_properties):
-                filtered_hosts.append(host)
-        return filtered_hosts
-
-    def update_service_capabilities(self, service_name, host, capabilities):
-        """Update the per-service capabilities based on this notification."""
+        ignore_hosts = filter_properties.get('ignore_hosts', [])
+        force_hosts = filter_properties.get('force_hosts', [])
+        hosts = [host for host in hosts if host.host not in ignore_hosts]
+        if force_hosts:
+            return [host for host in hosts if host.host in force_hosts]
+
+        filter_objs = self._choose_host_filters(filters)
+        if FLAGS.scheduler_order_filters_by_cost:
+            filter_objs = sorted(filter_objs, key=self._filter_rank)
+        for filter_obj in filter_objs:
+            if not hosts:
+                break
+            hosts = self._run_filter(filter_obj, hosts, filter_properties)
+        return hosts
+
+    def update_service_capabilities(self, service_name, host, capabilities,
+                                    seq=None, removed=None, full=True):
+        """Update the per-service capabilities based on this notification.
+
+        Updates which are not full only carry the capabilities which
+        changed, and the names of the ones removed, since the update
+        numbered seq - 1.  When an update went missing, the following
+        ones are dropped until the next full update, and False is returned
+        once, so that the caller can ask the service for a full update.
+        """
         node = capabilities.get('hypervisor_hostname')
         if node is not None:
             host = "%s/%s" % (host, node)
         LOG.debug(_("Received %(service_name)s service update from "
                     "%(host)s.") % locals())
         service_caps = self.service_states.get(host, {})
-        # Copy the capabilities, so we don't modify the original dict
-        capab_copy = dict(capabilities)
+        seq_key = (host, service_name)
+        if full:
+            # Copy the capabilities, so we don't modify the original dict
+            capab_copy = dict(capabilities)
+        else:
+            if seq_key in self.service_seqs and (
+                    self.service_seqs[seq_key] is None):
+                # Already waiting for a full update.
+                return True
+            last_seq = self.service_seqs.get(seq_key)
+            if (last_seq is None or seq != last_seq + 1 or
+                    service_name not in service_caps):
+                LOG.info(_("Missed %(service_name)s service updates from "
+                           "%(host)s, waiting for a full update.") %
+                         locals())
+                self.service_seqs[seq_key] = None
+                return False
+            capab_copy = dict(service_caps[service_name])
+            capab_copy.update(capabilities)
+            for key in removed or []:
+                capab_copy.pop(key, None)
+        if seq is None:
+            self.service_seqs.pop(seq_key, None)
+        else:
+            self.service_seqs[seq_key] = seq
         capab_copy["timestamp"] = timeutils.utcnow()  # Reported time
         service_caps[service_name] = capab_copy
         self.service_states[host] = service_caps
 
+        host_state = self.host_state_map.get(host)
+        if host_state is not None:
+            host_state.update_capabilities(capabilities=service_caps)
+        return True
+
+    def claim_resources(self, context, host_state, instance):
+        """Take the resources of an instance from the compute node of a
+        host in the db, provided the compute node hasn't changed since
+        host_state was loaded.
+
+        Returns False if it has, after reloading host_state from the db.
+        """
+        if host_state.compute_id is None:
+            return True
+        disk_gb = instance['root_gb'] + instance['ephemeral_gb']
+        try:
+            host_state.generation = db.compute_node_consume(context,
+                    host_state.compute_id, host_state.generation,
+                    memory_mb=instance['memory_mb'], disk_gb=disk_gb,
+                    vcpus=instance['vcpus'])
+        except exception.ComputeNodeGenerationConflict:
+            LOG.debug(_("Compute node for %(host)s changed while "
+                        "scheduling, reloading it") %
+                      {'host': host_state.host})
+            compute = db.compute_node_get(context, host_state.compute_id)
+            host_state.update_from_compute_node(compute)
+            return False
+        return True
+
     def get_all_host_states(self, context, topic):
         """Returns a dict of all the hosts the HostManager
         knows about. Also, each of the consumable resources in HostState
@@ -340,7 +461,13 @@ class HostManager(object):
         For example:
         {'192.168.1.100': HostState(), ...}
 
-        Note: this can be very slow with a lot of instances.
+        HostStates are cached between calls.  Only the compute nodes
+        that changed since the previous call are reloaded, along with the
+        service records, and everything is reloaded from the db every
+        scheduler_host_state_resync_interval seconds.  Resources consumed
+        from a cached HostState stay consumed until its compute node
+        reports in again.
+
         InstanceType table isn't required since a copy is stored
         with the instance (in case the InstanceType changed since the
         instance was created)."""
@@ -349,27 +476,84 @@ class HostManager(object):
             raise NotImplementedError(_(
                 "host_manager only implemented for 'compute'"))
 
-        host_state_map = {}
+        # NOTE: Take the timestamp before querying so that nothing
+        # updated while the query runs is missed on the next refresh.
+        now = timeutils.utcnow()
+        interval = FLAGS.scheduler_host_state_resync_interval
+        if (self._last_full_refresh is None or interval <= 0 or
+                timeutils.is_older_than(self._last_full_refresh, interval)):
+            self._refresh_all_host_states(context, topic)
+            self._last_full_refresh = now
+        else:
+            self._refresh_changed_host_states(context, topic)
+        self._last_refresh = now
+
+        return dict(self.host_state_map)
 
-        # Get resource usage across the available compute nodes:
+    def _refresh_all_host_states(self, context, topic):
+        """Rebuild the host state cache from every compute node."""
+        seen_hosts = set()
+        self._compute_node_hosts = {}
         compute_nodes = db.compute_node_get_all(context)
         for compute in compute_nodes:
-            service = compute['service']
-            if not service:
-                LOG.warn(_("No service for compute ID %s") % compute['id'])
-                continue
-            host = service['host']
-            nodename = compute.get('hypervisor_hostname')
-            if nodename is not None:
-                host_node = '%s/%s' % (host, nodename)
+            host_node = self._update_host_state(compute, topic)
+            if host_node is not None:
+                seen_hosts.add(host_node)
+
+        for host_node in set(self.host_state_map) - seen_hosts:
+            del self.host_state_map[host_node]
+
+    def _refresh_changed_host_states(self, context, topic):
+        """Apply the compute nodes changed since the last refresh to the
+        host state cache and refresh the service records.
+        """
+        compute_nodes = db.compute_node_get_all(context,
+                updated_since=self._last_refresh)
+        for compute in compute_nodes:
+            if compute['deleted']:
+                host_node = self._compute_node_hosts.pop(compute['id'], None)
+                self.host_state_map.pop(host_node, None)
             else:
-                host_node = host
-            capabilities = self.service_states.get(host_node, None)
+                self._update_host_state(compute, topic)
+
+        # NOTE: The service records carry the heartbeat checked by the
+        # ComputeFilter, so they can't go stale between full refreshes.
+        services = dict((service['id'], service)
+                        for service in db.service_get_all(context))
+        for host_node, host_state in self.host_state_map.items():
+            service = services.get(host_state.service.get('id'))
+            if service is None:
+                del self.host_state_map[host_node]
+                continue
+            host_state.update_capabilities(
+                    service=dict(service.iteritems()))
+
+    def _update_host_state(self, compute, topic):
+        """Create or update the cached HostState for a compute node.
+        Returns the host state key, or None if the compute node has no
+        service.
+        """
+        service = compute['service']
+        if not service:
+            LOG.warn(_("No service for compute ID %s") % compute['id'])
+            return None
+        host = service['host']
+        nodename = compute.get('hypervisor_hostname')
+        if nodename is not None:
+            host_node = '%s/%s' % (host, nodename)
+        else:
+            host_node = host
+        capabilities = self.service_states.get(host_node, None)
+        host_state = self.host_state_map.get(host_node)
+        if host_state is not None:
+            host_state.update_capabilities(capabilities=capabilities or {},
+                    service=dict(service.iteritems()))
+        else:
             host_state = self.host_state_cls(host, topic,
                     capabilities=capabilities,
                     service=dict(service.iteritems()),
                     nodename=nodename)
-            host_state.update_from_compute_node(compute)
-            host_state_map[host_node] = host_state
-
-        return host_state_map
+            self.host_state_map[host_node] = host_state
+        host_state.update_from_compute_node(compute)
+        self._compute_node_hosts[compute['id']] = host_node
+        return host_node
@@ -89,6 +89,49 @@ def compute_fill_first_cost_fn(host_state, weighing_properties):
     return host_state.free_ram_mb
 
 
+class HostCostTable(object):
+    """Weighted cost of each host for a single scheduling request.
+
+    Cost functions are only called for hosts that haven't been weighed
+    yet or that were marked as changed with host_changed(), so placing N
+    instances weighs each host once plus once per selected host, instead
+    of N times.  This relies on cost functions only looking at the host
+    state and the request, which is true for all the cost functions
+    included with nova.
+    """
+
+    def __init__(self, weighted_fns, weighing_properties):
+        self.weighted_fns = weighted_fns
+        self.weighing_properties = weighing_properties
+        self._costs = {}  # { <HostState> : cost }
+
+    def cost(self, host_state):
+        """Return the weighted cost of a host, weighing it if needed."""
+        try:
+            return self._costs[host_state]
+        except KeyError:
+            cost = sum(weight * fn(host_state, self.weighing_properties)
+                       for weight, fn in self.weighted_fns)
+            self._costs[host_state] = cost
+            return cost
+
+    def host_changed(self, host_state):
+        """Forget the cost of a host, typically after resources have been
+        consumed from it.
+        """
+        self._costs.pop(host_state, None)
+
+    def best_host(self, host_states):
+        """Return a WeightedHost for the host with the least cost."""
+        min_score, best_host = None, None
+        for host_state in host_states:
+            score = self.cost(host_state)
+            if min_score is None or score < min_score:
+                min_score, best_host = score, host_state
+
+        return WeightedHost(min_score, host_state=best_host)
+
+
 def weighted_sum(weighted_fns, host_states, weighing_properties):
     """Use the weighted-sum method to compute a score for an array of objects.
 
@@ -106,12 +149,5 @@ def weighted_sum(weighted_fns, host_states, weighing_properties):
     :returns: a single WeightedHost object which represents the best
               candidate.
     """
-
-    min_score, best_host = None, None
-    for host_state in host_states:
-        score = sum(weight * fn(host_state, weighing_properties)
-                    for weight, fn in weighted_fns)
-        if min_score is None or score < min_score:
-            min_score, best_host = score, host_state
-
-    return WeightedHost(min_score, host_state=best_host)
+    cost_table = HostCostTable(weighted_fns, weighing_properties)
+    return cost_table.best_host(host_states)
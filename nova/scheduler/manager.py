@@ -23,6 +23,7 @@ Scheduler Service
 
 import sys
 
+from nova.compute import rpcapi as compute_rpcapi
 from nova.compute import utils as compute_utils
 from nova.compute import vm_states
 from nova import db
@@ -53,21 +54,30 @@ QUOTAS = quota.QUOTAS
 class SchedulerManager(manager.Manager):
     """Chooses a host to run instances on."""
 
-    RPC_API_VERSION = '2.2'
+    RPC_API_VERSION = '2.3'
 
     def __init__(self, scheduler_driver=None, *args, **kwargs):
         if not scheduler_driver:
             scheduler_driver = FLAGS.scheduler_driver
         self.driver = importutils.import_object(scheduler_driver)
+        self.compute_rpcapi = compute_rpcapi.ComputeAPI()
         super(SchedulerManager, self).__init__(*args, **kwargs)
 
     def update_service_capabilities(self, context, service_name,
-                                    host, capabilities):
-        """Process a capability update from a service node."""
+                                    host, capabilities, seq=None,
+                                    removed=None, full=True):
+        """Process a capability update from a service node.
+
+        Compute nodes whose updates went missing are asked for a full
+        update.
+        """
         if capabilities is None:
             capabilities = {}
-        self.driver.update_service_capabilities(service_name, host,
-                capabilities)
+        in_sync = self.driver.update_service_capabilities(service_name,
+                host, capabilities, seq=seq, removed=removed, full=full)
+        if in_sync is False and service_name == 'compute':
+            self.compute_rpcapi.publish_service_capabilities(context,
+                                                             host=host)
 
     def create_volume(self, context, volume_id, snapshot_id,
                       reservations=None, image_id=None):
@@ -258,3 +268,7 @@ class SchedulerManager(manager.Manager):
     @manager.periodic_task
     def _expire_reservations(self, context):
         QUOTAS.expire(context)
+
+    @manager.periodic_task(spacing='quota_reconcile_interval')
+    def _reconcile_quota_usages(self, context):
+        QUOTAS.reconcile(context)
@@ -74,8 +74,14 @@ class MultiScheduler(driver.Scheduler):
     def schedule_create_volume(self, *args, **kwargs):
         return self.drivers['volume'].schedule_create_volume(*args, **kwargs)
 
-    def update_service_capabilities(self, service_name, host, capabilities):
+    def update_service_capabilities(self, service_name, host, capabilities,
+                                    seq=None, removed=None, full=True):
         # Multi scheduler is only a holder of sub-schedulers, so
         # pass the capabilities to the schedulers that matter
+        in_sync = True
         for d in self.drivers.values():
-            d.update_service_capabilities(service_name, host, capabilities)
+            if d.update_service_capabilities(service_name, host,
+                    capabilities, seq=seq, removed=removed,
+                    full=full) is False:
+                in_sync = False
+        return in_sync
@@ -46,6 +46,7 @@ class SchedulerAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         2.0 - Remove 1.x backwards compat
         2.1 - Add image_id to create_volume()
         2.2 - Remove reservations argument to create_volume()
+        2.3 - Add seq, removed and full to update_service_capabilities()
     '''
 
     #
@@ -103,7 +104,15 @@ class SchedulerAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                   version='2.2')
 
     def update_service_capabilities(self, ctxt, service_name, host,
-            capabilities):
+            capabilities, seq=None, removed=None, full=True):
+        if seq is None:
+            self.fanout_cast(ctxt, self.make_msg(
+                    'update_service_capabilities',
+                    service_name=service_name, host=host,
+                    capabilities=capabilities))
+            return
         self.fanout_cast(ctxt, self.make_msg('update_service_capabilities',
                 service_name=service_name, host=host,
-                capabilities=capabilities))
+                capabilities=capabilities, seq=seq, removed=removed,
+                full=full),
+                version='2.3')
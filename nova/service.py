@@ -39,6 +39,7 @@ from nova.openstack.common import cfg
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
+from nova import servicegroup
 from nova import utils
 from nova import version
 from nova import wsgi
@@ -390,6 +391,7 @@ class Service(object):
         self.periodic_fuzzy_delay = periodic_fuzzy_delay
         self.saved_args, self.saved_kwargs = args, kwargs
         self.timers = []
+        self.servicegroup_api = servicegroup.API()
 
     def start(self):
         vcs_string = version.version_string_with_vcs()
@@ -436,12 +438,18 @@ class Service(object):
             if self.periodic_fuzzy_delay:
                 initial_delay = random.randint(0, self.periodic_fuzzy_delay)
             else:
-                initial_delay = None
-
-            periodic = utils.LoopingCall(self.periodic_tasks)
-            periodic.start(interval=self.periodic_interval,
-                           initial_delay=initial_delay)
-            self.timers.append(periodic)
+                initial_delay = 0
+
+            # Each periodic task runs in a greenthread of its own, so that a
+            # slow task doesn't hold back the others.
+            for task_name, task in self.manager._periodic_tasks:
+                spacing, first_delay = self.manager.periodic_task_spacing(
+                        task_name, self.periodic_interval)
+                periodic = utils.FixedIntervalLoopingCall(
+                        self.run_periodic_task, task_name)
+                periodic.start(interval=spacing,
+                               initial_delay=initial_delay + first_delay)
+                self.timers.append(periodic)
 
     def _create_service_ref(self, context):
         zone = FLAGS.node_availability_zone
@@ -525,39 +533,18 @@ class Service(object):
     def periodic_tasks(self, raise_on_error=False):
         """Tasks to be run at a periodic interval."""
         ctxt = context.get_admin_context()
-        self.manager.periodic_tasks(ctxt, raise_on_error=raise_on_error)
+        self.manager.periodic_tasks(ctxt, raise_on_error=raise_on_error,
+                                    periodic_interval=self.periodic_interval)
 
-    def report_state(self):
-        """Update the state of this service in the datastore."""
+    def run_periodic_task(self, task_name):
+        """Run one of the periodic tasks of the manager."""
         ctxt = context.get_admin_context()
-        zone = FLAGS.node_availability_zone
-        state_catalog = {}
-        try:
-            try:
-                service_ref = db.service_get(ctxt, self.service_id)
-            except exception.NotFound:
-                LOG.debug(_('The service database object disappeared, '
-                            'Recreating it.'))
-                self._create_service_ref(ctxt)
-                service_ref = db.service_get(ctxt, self.service_id)
-
-            state_catalog['report_count'] = service_ref['report_count'] + 1
-            if zone != service_ref['availability_zone']:
-                state_catalog['availability_zone'] = zone
-
-            db.service_update(ctxt,
-                             self.service_id, state_catalog)
-
-            # TODO(termie): make this pattern be more elegant.
-            if getattr(self, 'model_disconnected', False):
-                self.model_disconnected = False
-                LOG.error(_('Recovered model server connection!'))
-
-        # TODO(vish): this should probably only catch connection errors
-        except Exception:  # pylint: disable=W0702
-            if not getattr(self, 'model_disconnected', False):
-                self.model_disconnected = True
-                LOG.exception(_('model server went away'))
+        self.manager.run_periodic_task(
+                ctxt, task_name, periodic_interval=self.periodic_interval)
+
+    def report_state(self):
+        """Report a heartbeat of this service to the servicegroup driver."""
+        self.servicegroup_api.report_state(self)
 
 
 class WSGIService(object):
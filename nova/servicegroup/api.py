@@ -0,0 +1,90 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""The servicegroup API, and the base class of its drivers."""
+
+from nova import flags
+from nova.openstack.common import cfg
+from nova.openstack.common import importutils
+from nova.openstack.common import log as logging
+
+servicegroup_driver_opt = cfg.StrOpt('servicegroup_driver',
+        default='db',
+        help='The driver keeping the heartbeats of the services: db, which '
+             'updates their records in the database, or mc, which keeps '
+             'them in memcached_servers')
+
+FLAGS = flags.FLAGS
+FLAGS.register_opt(servicegroup_driver_opt)
+
+LOG = logging.getLogger(__name__)
+
+_DRIVER_CLASSES = {
+    'db': 'nova.servicegroup.drivers.db.DbDriver',
+    'mc': 'nova.servicegroup.drivers.mc.MemcachedDriver',
+    }
+
+# The drivers loaded by the process, by name
+_drivers = {}
+
+
+class ServiceGroupDriver(object):
+    """Base class for the servicegroup drivers."""
+
+    def report_state(self, service):
+        """Records a heartbeat of a nova.service.Service."""
+        raise NotImplementedError()
+
+    def is_up(self, service_ref):
+        """Returns whether the service of a services record is up."""
+        raise NotImplementedError()
+
+    def get_up_services(self, service_refs):
+        """Returns the services records of the services which are up."""
+        return [service_ref for service_ref in service_refs
+                if self.is_up(service_ref)]
+
+
+class API(object):
+    """Records the heartbeats of the services, and tells which services are
+    up, through the servicegroup_driver."""
+
+    def __init__(self):
+        driver_name = FLAGS.servicegroup_driver
+        driver = _drivers.get(driver_name)
+        if driver is None:
+            try:
+                driver_class = _DRIVER_CLASSES[driver_name]
+            except KeyError:
+                raise TypeError(_("Unknown servicegroup driver %s") %
+                                driver_name)
+            driver = importutils.import_object(driver_class)
+            _drivers[driver_name] = driver
+        self._driver = driver
+
+    def report_state(self, service):
+        """Records a heartbeat of a nova.service.Service."""
+        self._driver.report_state(service)
+
+    def service_is_up(self, service_ref):
+        """Returns whether the service of a services record is up."""
+        return self._driver.is_up(service_ref)
+
+    def get_up_services(self, service_refs):
+        """Returns the services records of the services which are up, asking
+        the driver about all of them at once."""
+        return self._driver.get_up_services(service_refs)
@@ -0,0 +1,70 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Servicegroup driver keeping the heartbeats in memcached.
+
+The heartbeats of the services expire after service_down_time seconds, so
+that the services are up as long as their heartbeats are found, and
+reporting them doesn't write to the database.  Without memcached_servers,
+the heartbeats are kept in the process, which is only of use when all the
+services run in the same process, as in the tests.
+"""
+
+from nova import flags
+from nova.openstack.common import log as logging
+from nova.servicegroup import api
+
+FLAGS = flags.FLAGS
+
+LOG = logging.getLogger(__name__)
+
+
+def _heartbeat_key(topic, host):
+    return 'servicegroup-%s-%s' % (topic, host)
+
+
+class MemcachedDriver(api.ServiceGroupDriver):
+    """Keeps the heartbeats of the services in memcached."""
+
+    def __init__(self):
+        if FLAGS.memcached_servers:
+            import memcache
+        else:
+            from nova.common import memorycache as memcache
+        self.mc = memcache.Client(FLAGS.memcached_servers, debug=0)
+
+    def report_state(self, service):
+        key = _heartbeat_key(service.topic, service.host)
+        if self.mc.set(key, service.host, time=FLAGS.service_down_time):
+            if getattr(service, 'model_disconnected', False):
+                service.model_disconnected = False
+                LOG.error(_('Recovered memcached connection!'))
+        elif not getattr(service, 'model_disconnected', False):
+            service.model_disconnected = True
+            LOG.error(_('Failed to report the state of the service to '
+                        'memcached'))
+
+    def is_up(self, service_ref):
+        key = _heartbeat_key(service_ref['topic'], service_ref['host'])
+        return self.mc.get(key) is not None
+
+    def get_up_services(self, service_refs):
+        keys = [_heartbeat_key(service_ref['topic'], service_ref['host'])
+                for service_ref in service_refs]
+        found = self.mc.get_multi(keys)
+        return [service_ref for key, service_ref in zip(keys, service_refs)
+                if key in found]
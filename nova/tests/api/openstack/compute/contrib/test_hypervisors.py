@@ -120,7 +120,7 @@ def fake_compute_node_statistics(context):
     return result
 
 
-def fake_instance_get_all_by_host(context, host):
+def fake_instance_get_all_by_host(context, host, columns_to_join=None):
     results = []
     for inst in TEST_SERVERS:
         if inst['host'] == host:
@@ -34,6 +34,7 @@ import nova.compute.api
 from nova.compute import instance_types
 from nova.compute import task_states
 from nova.compute import vm_states
+import nova.context
 import nova.db
 from nova.db.sqlalchemy import models
 from nova import flags
@@ -621,7 +622,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             return [fakes.stub_instance(100, uuid=server_uuid)]
 
         self.stubs.Set(nova.compute.API, 'get_all', fake_get_all)
@@ -632,12 +633,53 @@ class ServersControllerTest(test.TestCase):
         self.assertEqual(len(servers), 1)
         self.assertEqual(servers[0]['id'], server_uuid)
 
+    def test_get_servers_only_joins_for_detail(self):
+        joins = []
+
+        def fake_get_all(compute_self, context, search_opts=None,
+                         sort_key=None, sort_dir='desc',
+                         limit=None, marker=None, columns_to_join=None):
+            joins.append(columns_to_join)
+            return [fakes.stub_instance(100)]
+
+        self.stubs.Set(nova.compute.API, 'get_all', fake_get_all)
+
+        req = fakes.HTTPRequest.blank('/v2/fake/servers')
+        self.controller.index(req)
+        req = fakes.HTTPRequest.blank('/v2/fake/servers/detail')
+        self.controller.detail(req)
+        self.assertEqual(joins, [[], ['info_cache', 'security_groups',
+                                      'instance_type']])
+
+    def test_get_servers_detail_loads_metadata_in_bulk(self):
+        def fake_get_all(compute_self, context, search_opts=None,
+                         sort_key=None, sort_dir='desc',
+                         limit=None, marker=None, columns_to_join=None):
+            instances = [fakes.stub_instance(100, uuid='fake-uuid-1'),
+                         fakes.stub_instance(101, uuid='fake-uuid-2')]
+            for instance in instances:
+                del instance['metadata']
+            return instances
+
+        def fake_get_metadata(context, uuids):
+            self.assertEqual(uuids, ['fake-uuid-1', 'fake-uuid-2'])
+            return {'fake-uuid-1': {'seq': '100'}, 'fake-uuid-2': {}}
+
+        self.stubs.Set(nova.compute.API, 'get_all', fake_get_all)
+        self.stubs.Set(nova.db, 'instance_metadata_get_by_instance_uuids',
+                       fake_get_metadata)
+
+        req = fakes.HTTPRequest.blank('/v2/fake/servers/detail')
+        servers = self.controller.detail(req)['servers']
+        self.assertEqual(servers[0]['metadata'], {'seq': '100'})
+        self.assertEqual(servers[1]['metadata'], {})
+
     def test_get_servers_allows_image(self):
         server_uuid = str(utils.gen_uuid())
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('image' in search_opts)
             self.assertEqual(search_opts['image'], '12345')
@@ -653,7 +695,8 @@ class ServersControllerTest(test.TestCase):
 
     def test_tenant_id_filter_converts_to_project_id_for_admin(self):
         def fake_get_all(context, filters=None, sort_key=None,
-                         sort_dir='desc', limit=None, marker=None):
+                         sort_dir='desc', limit=None, marker=None,
+                         columns_to_join=None):
             self.assertNotEqual(filters, None)
             self.assertEqual(filters['project_id'], 'fake')
             self.assertFalse(filters.get('tenant_id'))
@@ -670,7 +713,8 @@ class ServersControllerTest(test.TestCase):
 
     def test_admin_restricted_tenant(self):
         def fake_get_all(context, filters=None, sort_key=None,
-                         sort_dir='desc', limit=None, marker=None):
+                         sort_dir='desc', limit=None, marker=None,
+                         columns_to_join=None):
             self.assertNotEqual(filters, None)
             self.assertEqual(filters['project_id'], 'fake')
             return [fakes.stub_instance(100)]
@@ -686,7 +730,8 @@ class ServersControllerTest(test.TestCase):
 
     def test_admin_all_tenants(self):
         def fake_get_all(context, filters=None, sort_key=None,
-                         sort_dir='desc', limit=None, marker=None):
+                         sort_dir='desc', limit=None, marker=None,
+                         columns_to_join=None):
             self.assertNotEqual(filters, None)
             self.assertTrue('project_id' not in filters)
             return [fakes.stub_instance(100)]
@@ -702,7 +747,8 @@ class ServersControllerTest(test.TestCase):
 
     def test_all_tenants(self):
         def fake_get_all(context, filters=None, sort_key=None,
-                         sort_dir='desc', limit=None, marker=None):
+                         sort_dir='desc', limit=None, marker=None,
+                         columns_to_join=None):
             self.assertNotEqual(filters, None)
             self.assertEqual(filters['project_id'], 'fake')
             return [fakes.stub_instance(100)]
@@ -720,7 +766,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('flavor' in search_opts)
             # flavor is an integer ID
@@ -740,7 +786,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('vm_state' in search_opts)
             self.assertEqual(search_opts['vm_state'], vm_states.ACTIVE)
@@ -771,7 +817,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             self.assertTrue('vm_state' in search_opts)
             self.assertEqual(search_opts['vm_state'], 'deleted')
 
@@ -791,7 +837,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('name' in search_opts)
             self.assertEqual(search_opts['name'], 'whee.*')
@@ -810,7 +856,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('changes-since' in search_opts)
             changes_since = datetime.datetime(2011, 1, 24, 17, 8, 1,
@@ -842,7 +888,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             self.assertNotEqual(search_opts, None)
             # Allowed by user
             self.assertTrue('name' in search_opts)
@@ -871,7 +917,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             self.assertNotEqual(search_opts, None)
             # Allowed by user
             self.assertTrue('name' in search_opts)
@@ -900,7 +946,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('ip' in search_opts)
             self.assertEqual(search_opts['ip'], '10\..*')
@@ -923,7 +969,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, columns_to_join=None):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('ip6' in search_opts)
             self.assertEqual(search_opts['ip6'], 'ffff.*')
@@ -1378,6 +1424,14 @@ class ServersControllerTest(test.TestCase):
                 },
             ],
         }
+
+        def fake_get_metadata(context, uuids):
+            return dict((uuid, {'seq': str(i + 1)})
+                        for i, uuid in enumerate(uuids))
+
+        self.stubs.Set(nova.db, 'instance_metadata_get_by_instance_uuids',
+                       fake_get_metadata)
+
         req = fakes.HTTPRequest.blank('/v2/fake/servers/detail')
         res_dict = self.controller.detail(req)
 
@@ -1472,6 +1526,48 @@ class ServersControllerTest(test.TestCase):
         self.assertEqual(self.server_delete_called, True)
 
 
+class ServersControllerDbTest(test.TestCase):
+    """Tests of the servers controller going through the db API."""
+
+    def setUp(self):
+        super(ServersControllerDbTest, self).setUp()
+        fakes.stub_out_nw_api(self.stubs)
+        self.ext_mgr = extensions.ExtensionManager()
+        self.ext_mgr.extensions = {}
+        self.controller = servers.Controller(self.ext_mgr)
+        self.context = nova.context.RequestContext('fake_user', 'fake')
+        instance_type = instance_types.get_default_instance_type()
+        for seq in xrange(2):
+            nova.db.instance_create(self.context,
+                    {'display_name': 'server%d' % seq,
+                     'user_id': 'fake_user',
+                     'project_id': 'fake',
+                     'image_ref': '10',
+                     'instance_type_id': instance_type['id'],
+                     'vm_state': vm_states.ACTIVE,
+                     'metadata': {'seq': str(seq)}})
+
+    def test_get_servers_detail_metadata(self):
+        req = fakes.HTTPRequest.blank('/v2/fake/servers/detail')
+        servers = self.controller.detail(req)['servers']
+        self.assertEqual(sorted(server['metadata']['seq']
+                                for server in servers), ['0', '1'])
+
+    def test_get_servers_detail_metadata_of_models(self):
+        def fake_get_all(compute_self, context, search_opts=None,
+                         sort_key=None, sort_dir='desc',
+                         limit=None, marker=None, columns_to_join=None):
+            return nova.db.instance_get_all_by_filters(context,
+                    {'deleted': False}, 'created_at', 'desc',
+                    columns_to_join=columns_to_join)
+
+        self.stubs.Set(nova.compute.API, 'get_all', fake_get_all)
+        req = fakes.HTTPRequest.blank('/v2/fake/servers/detail')
+        servers = self.controller.detail(req)['servers']
+        self.assertEqual(sorted(server['metadata']['seq']
+                                for server in servers), ['0', '1'])
+
+
 class ServerStatusTest(test.TestCase):
 
     def setUp(self):
@@ -60,6 +60,7 @@ from nova.tests import fake_network
 from nova.tests.image import fake as fake_image
 from nova import utils
 from nova.virt import driver as virt_driver
+from nova.virt import event as virtevent
 import nova.volume
 
 
@@ -1263,6 +1264,19 @@ class ComputeTestCase(BaseTestCase):
         self.compute.terminate_instance(self.context,
                 instance=jsonutils.to_primitive(inst_ref))
 
+    def test_change_instance_metadata_notification(self):
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        test_notifier.NOTIFICATIONS = []
+        self.compute.change_instance_metadata(self.context,
+                                              diff={'foo': ['+', 'bar']},
+                                              instance=instance)
+
+        self.assertEquals(len(test_notifier.NOTIFICATIONS), 1)
+        msg = test_notifier.NOTIFICATIONS[0]
+        self.assertEquals(msg['event_type'],
+                          'compute.instance.metadata.update')
+        self.assertEquals(msg['payload']['instance_id'], instance['uuid'])
+
     def test_terminate_usage_notification(self):
         """Ensure terminate_instance generates correct usage notification"""
         old_time = datetime.datetime(2012, 4, 1)
@@ -1312,6 +1326,54 @@ class ComputeTestCase(BaseTestCase):
                           instance=instance)
         self.compute.terminate_instance(self.context, instance=instance)
 
+    def test_run_instances(self):
+        """Ensure each instance of a run_instances cast is run"""
+        instance1 = jsonutils.to_primitive(self._create_fake_instance())
+        instance2 = jsonutils.to_primitive(self._create_fake_instance())
+        filter_properties = {'retry': {'num_attempts': 1,
+                                       'hosts': ['fake_host']}}
+
+        def fake_spawn_n(func, *args, **kwargs):
+            func(*args, **kwargs)
+
+        self.stubs.Set(compute_manager.greenthread, 'spawn_n', fake_spawn_n)
+        self.mox.StubOutWithMock(self.compute, 'run_instance')
+        for instance in (instance1, instance2):
+            self.compute.run_instance(self.context, instance,
+                    request_spec={}, filter_properties=filter_properties,
+                    requested_networks=None, injected_files=None,
+                    admin_password=None, is_first_time=True)
+
+        self.mox.ReplayAll()
+        self.compute.run_instances(self.context, [instance1, instance2],
+                request_spec={}, filter_properties=filter_properties,
+                is_first_time=True)
+
+    def test_run_instances_launch_indexes(self):
+        instance1 = jsonutils.to_primitive(self._create_fake_instance())
+        instance2 = jsonutils.to_primitive(self._create_fake_instance())
+        request_spec = {'instance_properties': {'launch_index': 1},
+                        'launch_indexes': {instance1['uuid']: 1,
+                                           instance2['uuid']: 3}}
+
+        def fake_spawn_n(func, *args, **kwargs):
+            func(*args, **kwargs)
+
+        self.stubs.Set(compute_manager.greenthread, 'spawn_n', fake_spawn_n)
+        self.mox.StubOutWithMock(self.compute, 'run_instance')
+        for instance, launch_index in ((instance1, 1), (instance2, 3)):
+            self.compute.run_instance(self.context, instance,
+                    request_spec={'instance_properties':
+                                  {'launch_index': launch_index}},
+                    filter_properties={}, requested_networks=None,
+                    injected_files=None, admin_password=None,
+                    is_first_time=True)
+
+        self.mox.ReplayAll()
+        self.compute.run_instances(self.context, [instance1, instance2],
+                request_spec=request_spec, filter_properties={},
+                is_first_time=True)
+
     def test_instance_set_to_error_on_uncaught_exception(self):
         """Test that instance is set to error state when exception is raised"""
         instance = jsonutils.to_primitive(self._create_fake_instance())
@@ -2266,6 +2328,119 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(task_states.STOPPING, instances[0]['task_state'])
 
+    def _run_instances_for_sync(self, count):
+        self.stubs.Set(compute_manager.ComputeManager,
+                '_report_driver_status', nop_report_driver_status)
+        for i in range(count):
+            instance = jsonutils.to_primitive(self._create_fake_instance())
+            self.compute.run_instance(self.context, instance=instance)
+        return db.instance_get_all(context.get_admin_context())
+
+    def test_sync_power_states_only_looks_at_changed(self):
+        instances = self._run_instances_for_sync(3)
+        self.compute.driver.test_remove_vm(instances[0]['name'])
+
+        def fake_get_info(instance):
+            self.fail('get_info should not be called')
+
+        looked_up = []
+        orig_get_by_uuid = self.compute.db.instance_get_by_uuid
+
+        def fake_get_by_uuid(context, instance_uuid, **kwargs):
+            looked_up.append(instance_uuid)
+            return orig_get_by_uuid(context, instance_uuid, **kwargs)
+
+        self.stubs.Set(self.compute.driver, 'get_info', fake_get_info)
+        self.stubs.Set(self.compute.db, 'instance_get_by_uuid',
+                       fake_get_by_uuid)
+
+        self.compute._sync_power_states(context.get_admin_context())
+
+        self.assertEqual(looked_up, [instances[0]['uuid']])
+        instance = db.instance_get_by_uuid(self.context,
+                                           instances[0]['uuid'])
+        self.assertEqual(instance['power_state'], power_state.NOSTATE)
+        self.assertEqual(instance['task_state'], task_states.STOPPING)
+
+    def test_sync_power_states_without_bulk_listing(self):
+        instances = self._run_instances_for_sync(2)
+        self.compute.driver.test_remove_vm(instances[1]['name'])
+
+        def fake_list_power_states():
+            raise NotImplementedError()
+
+        self.stubs.Set(self.compute.driver, 'list_instance_power_states',
+                       fake_list_power_states)
+
+        self.compute._sync_power_states(context.get_admin_context())
+
+        instance = db.instance_get_by_uuid(self.context,
+                                           instances[1]['uuid'])
+        self.assertEqual(instance['power_state'], power_state.NOSTATE)
+        instance = db.instance_get_by_uuid(self.context,
+                                           instances[0]['uuid'])
+        self.assertEqual(instance['power_state'], power_state.RUNNING)
+
+    def test_sync_power_states_slowed_down_by_lifecycle_events(self):
+        self._run_instances_for_sync(1)
+        self.stubs.Set(self.compute.driver, 'lifecycle_events_enabled',
+                       lambda: True)
+        self.compute._last_power_state_sync = time.time()
+
+        def fake_list_power_states():
+            self.fail('list_instance_power_states should not be called')
+
+        self.stubs.Set(self.compute.driver, 'list_instance_power_states',
+                       fake_list_power_states)
+        self.compute._sync_power_states(context.get_admin_context())
+
+        self.stubs.UnsetAll()
+        self.stubs.Set(self.compute.driver, 'lifecycle_events_enabled',
+                       lambda: True)
+        self.compute._last_power_state_sync = (
+                time.time() - FLAGS.lifecycle_event_sync_interval - 1)
+        self.mox.StubOutWithMock(self.compute.driver,
+                                 'list_instance_power_states')
+        self.compute.driver.list_instance_power_states().AndReturn({})
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(context.get_admin_context())
+
+    def test_handle_lifecycle_event_syncs_power_state(self):
+        instance = self._run_instances_for_sync(1)[0]
+        event = virtevent.LifecycleEvent(instance['uuid'],
+                                         virtevent.EVENT_LIFECYCLE_STOPPED)
+
+        self.compute.handle_lifecycle_event(event)
+
+        instance = db.instance_get_by_uuid(self.context, instance['uuid'])
+        self.assertEqual(instance['power_state'], power_state.SHUTDOWN)
+        self.assertEqual(instance['task_state'], task_states.STOPPING)
+
+    def test_handle_lifecycle_event_ignores_other_hosts(self):
+        instance = self._run_instances_for_sync(1)[0]
+        db.instance_update(self.context, instance['uuid'],
+                           {'host': 'otherhost'})
+        event = virtevent.LifecycleEvent(instance['uuid'],
+                                         virtevent.EVENT_LIFECYCLE_PAUSED)
+
+        self.compute.handle_lifecycle_event(event)
+
+        instance = db.instance_get_by_uuid(self.context, instance['uuid'])
+        self.assertEqual(instance['power_state'], power_state.RUNNING)
+
+    def test_handle_lifecycle_event_unknown_instance(self):
+        event = virtevent.LifecycleEvent('fake-uuid',
+                                         virtevent.EVENT_LIFECYCLE_STARTED)
+        self.compute.handle_lifecycle_event(event)
+
+    def test_handle_events_queues_lifecycle_events(self):
+        event = virtevent.LifecycleEvent('fake-uuid',
+                                         virtevent.EVENT_LIFECYCLE_STARTED)
+        self.compute.handle_events(virtevent.InstanceEvent('fake-uuid'))
+        self.compute.handle_events(event)
+        self.assertEqual(self.compute._lifecycle_events.get_nowait(), event)
+        self.assertTrue(self.compute._lifecycle_events.empty())
+
     def test_add_instance_fault(self):
         exc_info = None
         instance_uuid = str(utils.gen_uuid())
@@ -2355,9 +2530,15 @@ class ComputeTestCase(BaseTestCase):
 
         self.mox.StubOutWithMock(self.compute.db, "instance_get_all_by_host")
         self.compute.db.instance_get_all_by_host(admin_context,
-                                                 self.compute.host
+                                                 self.compute.host,
+                                                 columns_to_join=[]
                                                 ).AndReturn([instance])
 
+        self.mox.StubOutWithMock(self.compute.db, "instance_get_by_uuid")
+        self.compute.db.instance_get_by_uuid(admin_context,
+                                             instance['uuid']
+                                            ).AndReturn(instance)
+
         self.mox.StubOutWithMock(self.compute, "_shutdown_instance")
         self.compute._shutdown_instance(admin_context,
                                         instance).AndReturn(None)
@@ -2390,13 +2571,41 @@ class ComputeTestCase(BaseTestCase):
 
         self.mox.StubOutWithMock(self.compute.db, "instance_get_all_by_host")
         self.compute.db.instance_get_all_by_host('context',
-                                                 'host').AndReturn(
+                                                 'host',
+                                                 columns_to_join=[]).AndReturn(
                                                                 [instance1,
                                                                  instance2])
         self.mox.ReplayAll()
         val = self.compute._running_deleted_instances('context')
         self.assertEqual(val, [instance1])
 
+    def test_poll_bandwidth_usage(self):
+        ctxt = context.get_admin_context()
+        prev_time, start_time = utils.last_completed_audit_period()
+        # A counter that was seen in the previous audit period, one that
+        # was already seen in this one and a new one.
+        db.bw_usage_update(ctxt, 'uuid1', 'mac1', prev_time, 0, 0, 100, 100)
+        db.bw_usage_update(ctxt, 'uuid1', 'mac2', start_time, 50, 50,
+                           200, 200)
+        bw_counters = [dict(uuid='uuid1', mac_address='mac1',
+                            bw_in=150, bw_out=120),
+                       dict(uuid='uuid1', mac_address='mac2',
+                            bw_in=10, bw_out=220),
+                       dict(uuid='uuid2', mac_address='mac3',
+                            bw_in=5, bw_out=5)]
+        self.stubs.Set(self.compute.driver, 'get_all_bw_counters',
+                       lambda instances: bw_counters)
+        self.compute._poll_bandwidth_usage(ctxt)
+
+        usages = db.bw_usage_get_by_uuids(ctxt, ['uuid1', 'uuid2'],
+                                          start_time)
+        usages = dict((usage['mac'], (usage['bw_in'], usage['bw_out']))
+                      for usage in usages)
+        # mac2's in counter rolled over.
+        self.assertEqual(usages, {'mac1': (50, 20),
+                                  'mac2': (60, 70),
+                                  'mac3': (0, 0)})
+
     def test_heal_instance_info_cache(self):
         # Update on every call for the test
         self.flags(heal_instance_info_cache_interval=-1)
@@ -2412,7 +2621,8 @@ class ComputeTestCase(BaseTestCase):
         call_info = {'get_all_by_host': 0, 'get_by_uuid': 0,
                 'get_nw_info': 0, 'expected_instance': None}
 
-        def fake_instance_get_all_by_host(context, host):
+        def fake_instance_get_all_by_host(context, host, columns_to_join):
+            self.assertEqual(columns_to_join, [])
             call_info['get_all_by_host'] += 1
             return instances[:]
 
@@ -2441,13 +2651,13 @@ class ComputeTestCase(BaseTestCase):
         call_info['expected_instance'] = instances[0]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(call_info['get_all_by_host'], 1)
-        self.assertEqual(call_info['get_by_uuid'], 0)
+        self.assertEqual(call_info['get_by_uuid'], 1)
         self.assertEqual(call_info['get_nw_info'], 1)
 
         call_info['expected_instance'] = instances[1]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(call_info['get_all_by_host'], 1)
-        self.assertEqual(call_info['get_by_uuid'], 1)
+        self.assertEqual(call_info['get_by_uuid'], 2)
         self.assertEqual(call_info['get_nw_info'], 2)
 
         # Make an instance switch hosts
@@ -2459,7 +2669,7 @@ class ComputeTestCase(BaseTestCase):
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(call_info['get_all_by_host'], 1)
         # Incremented for '2' and '4'.. '3' caused a raise above.
-        self.assertEqual(call_info['get_by_uuid'], 3)
+        self.assertEqual(call_info['get_by_uuid'], 4)
         self.assertEqual(call_info['get_nw_info'], 3)
         # Should be no more left.
         self.assertEqual(len(self.compute._instance_uuids_to_heal), 0)
@@ -2469,8 +2679,8 @@ class ComputeTestCase(BaseTestCase):
         call_info['expected_instance'] = instances[0]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(call_info['get_all_by_host'], 2)
-        # Stays the same, beacuse the instance came from the DB
-        self.assertEqual(call_info['get_by_uuid'], 3)
+        # The instance is fetched in full, the listing only has the uuids
+        self.assertEqual(call_info['get_by_uuid'], 5)
         self.assertEqual(call_info['get_nw_info'], 4)
 
     def test_poll_unconfirmed_resizes(self):
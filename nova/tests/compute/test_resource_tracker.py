@@ -85,7 +85,7 @@ class BaseTestCase(test.TestCase):
 
         self._instances = []
         self.stubs.Set(db, 'instance_get_all_by_host',
-                       lambda c, h: self._instances)
+                       lambda c, h, columns_to_join=None: self._instances)
 
     def _create_compute_node(self, values=None):
         compute = {
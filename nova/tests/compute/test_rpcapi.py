@@ -215,6 +215,10 @@ class ComputeRpcAPITestCase(test.TestCase):
                 image='fake_image', host='host',
                 reservations=list('fake_res'))
 
+    def test_publish_service_capabilities(self):
+        self._test_compute_api('publish_service_capabilities', 'cast',
+                host='host', version='2.4')
+
     def test_reboot_instance(self):
         self._test_compute_api('reboot_instance', 'cast',
                 instance=self.fake_instance, reboot_type='type')
@@ -290,6 +294,13 @@ class ComputeRpcAPITestCase(test.TestCase):
                 requested_networks='networks', injected_files='files',
                 admin_password='pw', is_first_time=True)
 
+    def test_run_instances(self):
+        self._test_compute_api('run_instances', 'cast',
+                instances=[self.fake_instance], host='fake_host',
+                request_spec='fake_spec', filter_properties={},
+                requested_networks='networks', injected_files='files',
+                admin_password='pw', is_first_time=True, version='2.3')
+
     def test_set_admin_password(self):
         self._test_compute_api('set_admin_password', 'call',
                 instance=self.fake_instance, new_pass='pw')
@@ -22,6 +22,7 @@ FLAGS = flags.FLAGS
 
 flags.DECLARE('compute_scheduler_driver', 'nova.scheduler.multi')
 flags.DECLARE('fake_network', 'nova.network.manager')
+flags.DECLARE('glance_image_cache_ttl', 'nova.image.glance')
 flags.DECLARE('iscsi_num_targets', 'nova.volume.driver')
 flags.DECLARE('network_size', 'nova.network.manager')
 flags.DECLARE('num_networks', 'nova.network.manager')
@@ -35,6 +36,7 @@ def set_defaults(conf):
     conf.set_default('fake_network', True)
     conf.set_default('fake_rabbit', True)
     conf.set_default('flat_network_bridge', 'br100')
+    conf.set_default('glance_image_cache_ttl', 0)
     conf.set_default('iscsi_num_targets', 8)
     conf.set_default('network_size', 8)
     conf.set_default('num_networks', 2)
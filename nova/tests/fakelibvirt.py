@@ -68,6 +68,17 @@ VIR_DOMAIN_SHUTDOWN = 4
 VIR_DOMAIN_SHUTOFF = 5
 VIR_DOMAIN_CRASHED = 6
 
+# virDomainEventType
+VIR_DOMAIN_EVENT_DEFINED = 0
+VIR_DOMAIN_EVENT_UNDEFINED = 1
+VIR_DOMAIN_EVENT_STARTED = 2
+VIR_DOMAIN_EVENT_SUSPENDED = 3
+VIR_DOMAIN_EVENT_RESUMED = 4
+VIR_DOMAIN_EVENT_STOPPED = 5
+VIR_DOMAIN_EVENT_SHUTDOWN = 6
+
+VIR_DOMAIN_EVENT_ID_LIFECYCLE = 0
+
 VIR_DOMAIN_XML_SECURE = 1
 
 VIR_DOMAIN_UNDEFINE_MANAGED_SAVE = 1
@@ -496,6 +507,7 @@ class Connection(object):
         self._running_vms = {}
         self._id_counter = 1  # libvirt reserves 0 for the hypervisor.
         self._nwfilters = {}
+        self._event_callbacks = {}
 
     def _add_filter(self, nwfilter):
         self._nwfilters[nwfilter._name] = nwfilter
@@ -535,6 +547,12 @@ class Connection(object):
     def listDomainsID(self):
         return self._running_vms.keys()
 
+    def listAllDomains(self, flags):
+        return self._vms.values()
+
+    def domainEventRegisterAny(self, dom, eventid, callback, opaque):
+        self._event_callbacks[eventid] = [callback, opaque]
+
     def lookupByID(self, id):
         if id in self._running_vms:
             return self._running_vms[id]
@@ -430,6 +430,69 @@ class TestGlanceImageService(test.TestCase):
         self.assertEqual(image_meta['created_at'], self.NOW_DATETIME)
         self.assertEqual(image_meta['updated_at'], self.NOW_DATETIME)
 
+    def _enable_image_cache(self):
+        self.flags(glance_image_cache_ttl=10)
+        self.stubs.Set(glance, '_IMAGE_CACHE', None)
+        calls = []
+        orig_call = glance.GlanceClientWrapper.call
+
+        def fake_call(client, context, version, method, *args, **kwargs):
+            calls.append(method)
+            return orig_call(client, context, version, method, *args,
+                             **kwargs)
+
+        self.stubs.Set(glance.GlanceClientWrapper, 'call', fake_call)
+        return calls
+
+    def test_show_is_cached(self):
+        calls = self._enable_image_cache()
+        fixture = self._make_fixture(name='image1', is_public=True)
+        image_id = self.service.create(self.context, fixture)['id']
+
+        image_meta = self.service.show(self.context, image_id)
+        image_meta['properties']['foo'] = 'bar'
+        image_meta = self.service.show(self.context, image_id)
+        self.assertEqual(image_meta['name'], 'image1')
+        self.assertEqual(image_meta['properties'], {})
+        self.assertEqual(calls, ['create', 'get'])
+
+    def test_show_caches_not_found(self):
+        calls = self._enable_image_cache()
+        for i in range(2):
+            self.assertRaises(exception.ImageNotFound, self.service.show,
+                              self.context, 'missing')
+        self.assertEqual(calls, ['get'])
+
+    def test_show_is_cached_by_requester(self):
+        calls = self._enable_image_cache()
+        fixture = self._make_fixture(name='image1',
+                                     is_public=False,
+                                     properties={'one': 'two'})
+        image_id = self.service.create(self.context, fixture)['id']
+        self.service.show(self.context, image_id)
+
+        other_context = context.RequestContext('other', 'other')
+        self.assertRaises(exception.ImageNotFound, self.service.show,
+                          other_context, image_id)
+        self.assertEqual(calls, ['create', 'get', 'get'])
+
+    def test_update_and_delete_invalidate_cache(self):
+        calls = self._enable_image_cache()
+        fixture = self._make_fixture(name='test image')
+        image_id = self.service.create(self.context, fixture)['id']
+        self.service.show(self.context, image_id)
+
+        fixture['name'] = 'new image name'
+        self.service.update(self.context, image_id, fixture)
+        image_meta = self.service.show(self.context, image_id)
+        self.assertEqual(image_meta['name'], 'new image name')
+
+        self.service.delete(self.context, image_id)
+        self.assertRaises(exception.ImageNotFound, self.service.show,
+                          self.context, image_id)
+        self.assertEqual(calls, ['create', 'get', 'update', 'get',
+                                 'delete', 'get'])
+
     def test_detail_makes_datetimes(self):
         fixture = self._make_datetime_fixture()
         self.service.create(self.context, fixture)
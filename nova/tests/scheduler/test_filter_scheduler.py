@@ -153,17 +153,223 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         self.driver.schedule_run_instance(context_fake, request_spec,
                 None, None, None, None, {})
 
+    def test_run_instance_grouped_by_host(self):
+        self.flags(scheduler_group_run_instance_casts=True)
+        fake_context = context.RequestContext('user', 'project')
+        uuids = ['fake-uuid1', 'fake-uuid2', 'fake-uuid3']
+        instance_properties = {'project_id': 1, 'os_type': 'Linux'}
+        request_spec = {'instance_properties': instance_properties,
+                        'instance_uuids': uuids}
+        host1 = least_cost.WeightedHost(1.0,
+                host_state=host_manager.HostState('host1', 'compute'))
+        host2 = least_cost.WeightedHost(2.0,
+                host_state=host_manager.HostState('host2', 'compute'))
+        instances = [{'uuid': uuid} for uuid in uuids]
+
+        self.mox.StubOutWithMock(self.driver, '_schedule')
+        self.mox.StubOutWithMock(self.driver, '_schedule_instance_on_host')
+        self.mox.StubOutWithMock(self.driver.compute_rpcapi, 'run_instances')
+
+        self.driver._schedule(fake_context, 'compute', request_spec, {},
+                uuids).AndReturn([host1, host2, host1])
+        for weighted_host, uuid, instance in zip([host1, host2, host1],
+                                                 uuids, instances):
+            self.driver._schedule_instance_on_host(mox.IgnoreArg(),
+                    weighted_host, request_spec, {}, uuid).AndReturn(instance)
+        self.driver.compute_rpcapi.run_instances(mox.IgnoreArg(),
+                instances=[instances[0], instances[2]], host='host1',
+                request_spec=mox.Func(self._has_launch_indexes(
+                        {'fake-uuid1': 0, 'fake-uuid3': 2})),
+                filter_properties=mox.IgnoreArg(),
+                requested_networks=None, injected_files=None,
+                admin_password=None, is_first_time=None)
+        self.driver.compute_rpcapi.run_instances(mox.IgnoreArg(),
+                instances=[instances[1]], host='host2',
+                request_spec=mox.Func(self._has_launch_indexes(
+                        {'fake-uuid2': 1})),
+                filter_properties=mox.IgnoreArg(),
+                requested_networks=None, injected_files=None,
+                admin_password=None, is_first_time=None)
+
+        self.mox.ReplayAll()
+        self.driver.schedule_run_instance(fake_context, request_spec,
+                None, None, None, None, {})
+
+    def _has_launch_indexes(self, launch_indexes):
+        def _check(request_spec):
+            return (request_spec['launch_indexes'] == launch_indexes and
+                    request_spec['instance_properties']['launch_index'] ==
+                    min(launch_indexes.values()))
+        return _check
+
+    def test_run_instance_grouped_by_node(self):
+        self.flags(scheduler_group_run_instance_casts=True)
+        fake_context = context.RequestContext('user', 'project')
+        uuids = ['fake-uuid1', 'fake-uuid2', 'fake-uuid3']
+        request_spec = {'instance_properties': {'project_id': 1},
+                        'instance_uuids': uuids}
+        node1 = least_cost.WeightedHost(1.0,
+                host_state=host_manager.HostState('host1', 'compute',
+                                                  nodename='node1'))
+        node1.host_state.limits = {'memory_mb': 1}
+        node2 = least_cost.WeightedHost(2.0,
+                host_state=host_manager.HostState('host1', 'compute',
+                                                  nodename='node2'))
+        node2.host_state.limits = {'memory_mb': 2}
+        instances = [{'uuid': uuid} for uuid in uuids]
+
+        self.mox.StubOutWithMock(self.driver, '_schedule')
+        self.mox.StubOutWithMock(self.driver, '_schedule_instance_on_host')
+        self.mox.StubOutWithMock(self.driver.compute_rpcapi, 'run_instances')
+
+        self.driver._schedule(fake_context, 'compute', request_spec, {},
+                uuids).AndReturn([node1, node2, node2])
+        for weighted_host, uuid, instance in zip([node1, node2, node2],
+                                                 uuids, instances):
+            self.driver._schedule_instance_on_host(mox.IgnoreArg(),
+                    weighted_host, request_spec, {}, uuid).AndReturn(instance)
+        for node, node_instances, launch_indexes in (
+                (node1, instances[:1], {'fake-uuid1': 0}),
+                (node2, instances[1:], {'fake-uuid2': 1, 'fake-uuid3': 2})):
+            limits = node.host_state.limits
+            self.driver.compute_rpcapi.run_instances(mox.IgnoreArg(),
+                    instances=node_instances, host='host1',
+                    request_spec=mox.Func(
+                            self._has_launch_indexes(launch_indexes)),
+                    filter_properties=mox.Func(
+                            lambda props, limits=limits:
+                                props['limits'] == limits),
+                    requested_networks=None, injected_files=None,
+                    admin_password=None, is_first_time=None)
+
+        self.mox.ReplayAll()
+        self.driver.schedule_run_instance(fake_context, request_spec,
+                None, None, None, None, {})
+        self.assertFalse('launch_indexes' in request_spec)
+
+    def test_schedule_only_refilters_selected_host(self):
+        filtered = []
+
+        def _counting_filter_hosts(hosts, filter_properties):
+            hosts = list(hosts)
+            filtered.append(len(hosts))
+            return hosts
+
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        self.stubs.Set(sched.host_manager, 'filter_hosts',
+                _counting_filter_hosts)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+
+        request_spec = {'num_instances': 3,
+                        'instance_type': {'memory_mb': 512, 'root_gb': 512,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 512,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        self.mox.ReplayAll()
+        weighted_hosts = sched._schedule(fake_context, 'compute',
+                request_spec, {})
+        self.assertEqual(filtered, [4, 1, 1, 1])
+        # The default cost function spreads instances by free ram:
+        # host4 has 8192MB free, host3 3072MB
+        self.assertEqual([weighted_host.host_state.host
+                          for weighted_host in weighted_hosts],
+                         ['host4', 'host4', 'host4'])
+
+    def test_schedule_retries_host_after_claim_conflict(self):
+        self.flags(scheduler_optimistic_claims=True)
+        filtered = []
+        claims = []
+
+        def _counting_filter_hosts(hosts, filter_properties):
+            hosts = list(hosts)
+            filtered.append(len(hosts))
+            return hosts
+
+        def _claim_resources(context, host_state, instance):
+            # The first claim loses the race with another scheduler.
+            claims.append(host_state.host)
+            return len(claims) > 1
+
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        self.stubs.Set(sched.host_manager, 'filter_hosts',
+                _counting_filter_hosts)
+        self.stubs.Set(sched.host_manager, 'claim_resources',
+                _claim_resources)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+
+        request_spec = {'num_instances': 2,
+                        'instance_type': {'memory_mb': 512, 'root_gb': 512,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 512,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        self.mox.ReplayAll()
+        weighted_hosts = sched._schedule(fake_context, 'compute',
+                request_spec, {})
+        self.assertEqual(claims, ['host4', 'host4', 'host4'])
+        self.assertEqual(filtered, [4, 1, 1, 1])
+        self.assertEqual([weighted_host.host_state.host
+                          for weighted_host in weighted_hosts],
+                         ['host4', 'host4'])
+
+    def test_schedule_drops_host_after_max_claim_conflicts(self):
+        self.flags(scheduler_optimistic_claims=True,
+                   scheduler_claim_max_conflicts=0)
+        claims = []
+
+        def _claim_resources(context, host_state, instance):
+            claims.append(host_state.host)
+            return host_state.host != 'host4'
+
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        self.stubs.Set(sched.host_manager, 'filter_hosts',
+                fake_filter_hosts)
+        self.stubs.Set(sched.host_manager, 'claim_resources',
+                _claim_resources)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+
+        request_spec = {'num_instances': 1,
+                        'instance_type': {'memory_mb': 512, 'root_gb': 512,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 512,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        self.mox.ReplayAll()
+        weighted_hosts = sched._schedule(fake_context, 'compute',
+                request_spec, {})
+        self.assertEqual(claims, ['host4', 'host3'])
+        self.assertEqual([weighted_host.host_state.host
+                          for weighted_host in weighted_hosts],
+                         ['host3'])
+
     def test_schedule_happy_day(self):
         """Make sure there's nothing glaringly wrong with _schedule()
         by doing a happy day pass through."""
 
         self.next_weight = 1.0
 
-        def _fake_weighted_sum(functions, hosts, options):
+        def _fake_cost(cost_table, host_state):
             self.next_weight += 2.0
-            host_state = hosts[0]
-            return least_cost.WeightedHost(self.next_weight,
-                    host_state=host_state)
+            return self.next_weight
 
         sched = fakes.FakeFilterScheduler()
         fake_context = context.RequestContext('user', 'project',
@@ -171,7 +377,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.stubs.Set(sched.host_manager, 'filter_hosts',
                 fake_filter_hosts)
-        self.stubs.Set(least_cost, 'weighted_sum', _fake_weighted_sum)
+        self.stubs.Set(least_cost.HostCostTable, 'cost', _fake_cost)
         fakes.mox_host_manager_db_calls(self.mox, fake_context)
 
         request_spec = {'num_instances': 10,
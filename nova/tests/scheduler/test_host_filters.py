@@ -26,6 +26,7 @@ from nova.openstack.common import jsonutils
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
 from nova.scheduler.filters.trusted_filter import AttestationService
+from nova import servicegroup
 from nova import test
 from nova.tests.scheduler import fakes
 from nova import utils
@@ -480,6 +481,23 @@ class HostFiltersTestCase(test.TestCase):
                            params={'host': 'fake_host', 'instance_type_id': 2})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_type_filter_filter_all(self):
+        filt_cls = self.class_map['TypeAffinityFilter']()
+
+        filter_properties = {'context': self.context,
+                             'instance_type': {'id': 1}}
+        host1 = fakes.FakeHostState('host1', 'compute', {})
+        host2 = fakes.FakeHostState('host2', 'compute', {})
+        host3 = fakes.FakeHostState('host3', 'compute', {})
+        fakes.FakeInstance(context=self.context,
+                           params={'host': 'host1', 'instance_type_id': 1})
+        fakes.FakeInstance(context=self.context,
+                           params={'host': 'host2', 'instance_type_id': 2})
+        # host3 is empty
+        self.assertEqual(filt_cls.filter_all([host1, host2, host3],
+                                             filter_properties),
+                         [host1, host3])
+
     def test_aggregate_type_filter(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['AggregateTypeAffinityFilter']()
@@ -502,6 +520,23 @@ class HostFiltersTestCase(test.TestCase):
         #False since type matches aggregate, metadata
         self.assertFalse(filt_cls.host_passes(host, filter2_properties))
 
+    def test_aggregate_type_filter_filter_all(self):
+        filt_cls = self.class_map['AggregateTypeAffinityFilter']()
+
+        filter_properties = {'context': self.context,
+                             'instance_type': {'name': 'fake1'}}
+        host1 = fakes.FakeHostState('host1', 'compute', {})
+        host2 = fakes.FakeHostState('host2', 'compute', {})
+        host3 = fakes.FakeHostState('host3', 'compute', {})
+        self._create_aggregate_with_host(name='fake_aggregate1',
+                hosts=['host1'], metadata={'instance_type': 'fake1'})
+        self._create_aggregate_with_host(name='fake_aggregate2',
+                hosts=['host2'], metadata={'instance_type': 'fake2'})
+        # host3 is not in any aggregate
+        self.assertEqual(filt_cls.filter_all([host1, host2, host3],
+                                             filter_properties),
+                         [host1, host3])
+
     def test_ram_filter_fails_on_memory(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['RamFilter']()
@@ -638,6 +673,31 @@ class HostFiltersTestCase(test.TestCase):
                  'service': service})
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_compute_filter_filter_all(self):
+        filt_cls = self.class_map['ComputeFilter']()
+        filter_properties = {'instance_type': {'memory_mb': 1024}}
+        services = [{'host': 'host%d' % i, 'disabled': i == 3}
+                    for i in xrange(1, 5)]
+        hosts = [fakes.FakeHostState(service['host'], 'compute',
+                                     {'capabilities': {'enabled': True},
+                                      'service': service})
+                 for service in services]
+        hosts.append(fakes.FakeHostState('host5', 'volume',
+                                         {'capabilities': {},
+                                          'service': {'host': 'host5'}}))
+        calls = []
+
+        def fake_get_up_services(self, service_refs):
+            calls.append(service_refs)
+            return [service_ref for service_ref in service_refs
+                    if service_ref['host'] != 'host2']
+
+        self.stubs.Set(servicegroup.API, 'get_up_services',
+                       fake_get_up_services)
+        self.assertEqual(filt_cls.filter_all(hosts, filter_properties),
+                         [hosts[0], hosts[3], hosts[4]])
+        self.assertEqual(calls, [services])
+
     def test_compute_filter_passes_on_no_instance_type(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['ComputeFilter']()
@@ -782,6 +842,8 @@ class HostFiltersTestCase(test.TestCase):
         host = fakes.FakeHostState('host1', 'compute', {'free_ram_mb': 1024})
         assertion = self.assertTrue if passes else self.assertFalse
         assertion(filt_cls.host_passes(host, filter_properties))
+        passed_hosts = filt_cls.filter_all([host], filter_properties)
+        assertion(passed_hosts == [host])
 
     def test_aggregate_filter_fails_extra_specs_deleted_host(self):
         self._stub_service_is_up(True)
@@ -1256,6 +1318,25 @@ class HostFiltersTestCase(test.TestCase):
         host = fakes.FakeHostState('host1', 'compute', {'service': service})
         self.assertFalse(filt_cls.host_passes(host, request))
 
+    def test_availability_zone_filter_filter_all(self):
+        filt_cls = self.class_map['AvailabilityZoneFilter']()
+        host1 = fakes.FakeHostState('host1', 'compute',
+                {'service': {'availability_zone': 'nova'}})
+        host2 = fakes.FakeHostState('host2', 'compute',
+                {'service': {'availability_zone': 'other'}})
+        host3 = fakes.FakeHostState('host3', 'compute',
+                {'service': {'availability_zone': 'nova'}})
+        hosts = [host1, host2, host3]
+        self.assertEqual(filt_cls.filter_all(hosts,
+                                             self._make_zone_request('nova')),
+                         [host1, host3])
+        self.assertEqual(filt_cls.filter_all(hosts,
+                                             self._make_zone_request('bad')),
+                         [])
+        self.assertEqual(filt_cls.filter_all(hosts,
+                                             self._make_zone_request(None)),
+                         hosts)
+
     def test_retry_filter_disabled(self):
         """Test case where retry/re-scheduling is disabled"""
         filt_cls = self.class_map['RetryFilter']()
@@ -16,6 +16,7 @@
 Tests For HostManager
 """
 
+import mox
 
 from nova.compute import task_states
 from nova.compute import vm_states
@@ -56,37 +57,126 @@ class HostManagerTestCase(test.TestCase):
         self.host_manager.filter_classes = [ComputeFilterClass1,
                 ComputeFilterClass2]
 
-        # Test 'compute' returns 1 correct function
-        filter_fns = self.host_manager._choose_host_filters(None)
-        self.assertEqual(len(filter_fns), 1)
-        self.assertEqual(filter_fns[0].__func__,
-                ComputeFilterClass2.host_passes.__func__)
+        # Test 'compute' returns 1 correct filter
+        filter_objs = self.host_manager._choose_host_filters(None)
+        self.assertEqual(len(filter_objs), 1)
+        self.assertTrue(isinstance(filter_objs[0], ComputeFilterClass2))
+
+        # Filter objects are reused between requests
+        self.assertEqual(self.host_manager._choose_host_filters(None),
+                         filter_objs)
+
+    def _stub_filters(self, passes1=True, passes2=True):
+        """Set up ComputeFilterClass1/2 to be used by filter_hosts() with
+        the given host_passes() results.
+        """
+        self.flags(scheduler_order_filters_by_cost=False)
+        self.host_manager.filter_classes = [ComputeFilterClass1,
+                ComputeFilterClass2]
+        filter_objs = self.host_manager._choose_host_filters(
+                ['ComputeFilterClass1', 'ComputeFilterClass2'])
+        self.mox.StubOutWithMock(filter_objs[0], 'host_passes')
+        self.mox.StubOutWithMock(filter_objs[1], 'host_passes')
+        return filter_objs
 
     def test_filter_hosts(self):
         topic = 'fake_topic'
 
-        filters = ['fake-filter1', 'fake-filter2']
+        filters = ['ComputeFilterClass1', 'ComputeFilterClass2']
         fake_host1 = host_manager.HostState('host1', topic)
         fake_host2 = host_manager.HostState('host2', topic)
         hosts = [fake_host1, fake_host2]
         filter_properties = {'fake_prop': 'fake_val'}
 
-        self.mox.StubOutWithMock(self.host_manager,
-                '_choose_host_filters')
-        self.mox.StubOutWithMock(fake_host1, 'passes_filters')
-        self.mox.StubOutWithMock(fake_host2, 'passes_filters')
-
-        self.host_manager._choose_host_filters(None).AndReturn(filters)
-        fake_host1.passes_filters(filters, filter_properties).AndReturn(
-                False)
-        fake_host2.passes_filters(filters, filter_properties).AndReturn(
-                True)
+        cls1, cls2 = self._stub_filters()
+        cls1.host_passes(fake_host1, filter_properties).AndReturn(False)
+        cls1.host_passes(fake_host2, filter_properties).AndReturn(True)
+        # cls2.host_passes() is only called for host2
+        cls2.host_passes(fake_host2, filter_properties).AndReturn(True)
 
         self.mox.ReplayAll()
         filtered_hosts = self.host_manager.filter_hosts(hosts,
-                filter_properties, filters=None)
-        self.assertEqual(len(filtered_hosts), 1)
-        self.assertEqual(filtered_hosts[0], fake_host2)
+                filter_properties, filters=filters)
+        self.assertEqual(filtered_hosts, [fake_host2])
+
+    def test_filter_hosts_uses_filter_all(self):
+        filters = ['FakeFilterAllClass']
+
+        class FakeFilterAllClass(ComputeFilterClass1):
+            def filter_all(self, host_states, filter_properties):
+                return [host_state for host_state in host_states
+                        if host_state.host == 'host2']
+
+        self.host_manager.filter_classes = [FakeFilterAllClass]
+        fake_host1 = host_manager.HostState('host1', 'compute')
+        fake_host2 = host_manager.HostState('host2', 'compute')
+
+        filtered_hosts = self.host_manager.filter_hosts(
+                [fake_host1, fake_host2], {}, filters=filters)
+        self.assertEqual(filtered_hosts, [fake_host2])
+        self.assertEqual(self.host_manager.filter_stats[
+                'FakeFilterAllClass']['hosts_in'], 2)
+        self.assertEqual(self.host_manager.filter_stats[
+                'FakeFilterAllClass']['hosts_out'], 1)
+
+    def test_filter_hosts_with_ignore(self):
+        filters = ['ComputeFilterClass1', 'ComputeFilterClass2']
+        fake_host1 = host_manager.HostState('host1', 'compute')
+        fake_host2 = host_manager.HostState('host2', 'compute')
+        filter_properties = {'ignore_hosts': ['host1']}
+
+        cls1, cls2 = self._stub_filters()
+        # host_passes() is not called for the ignored host
+        cls1.host_passes(fake_host2, filter_properties).AndReturn(True)
+        cls2.host_passes(fake_host2, filter_properties).AndReturn(True)
+
+        self.mox.ReplayAll()
+        filtered_hosts = self.host_manager.filter_hosts(
+                [fake_host1, fake_host2], filter_properties, filters=filters)
+        self.assertEqual(filtered_hosts, [fake_host2])
+
+    def test_filter_hosts_skipped_from_force(self):
+        filters = ['ComputeFilterClass1', 'ComputeFilterClass2']
+        fake_host1 = host_manager.HostState('host1', 'compute')
+        fake_host2 = host_manager.HostState('host2', 'compute')
+        filter_properties = {'force_hosts': ['host1']}
+
+        self._stub_filters()
+        # host_passes() not called because of short circuit with
+        # matching host to force
+
+        self.mox.ReplayAll()
+        filtered_hosts = self.host_manager.filter_hosts(
+                [fake_host1, fake_host2], filter_properties, filters=filters)
+        self.assertEqual(filtered_hosts, [fake_host1])
+
+    def test_filter_hosts_ordered_by_cost(self):
+        self.flags(scheduler_order_filters_by_cost=True)
+        self.host_manager.filter_classes = [ComputeFilterClass1,
+                ComputeFilterClass2]
+        filters = ['ComputeFilterClass1', 'ComputeFilterClass2']
+        # ComputeFilterClass1 is slow and rejects nothing,
+        # ComputeFilterClass2 is fast and rejects half of the hosts.
+        self.host_manager.filter_stats = {
+            'ComputeFilterClass1': dict(hosts_in=10, hosts_out=10,
+                                        seconds=1.0),
+            'ComputeFilterClass2': dict(hosts_in=10, hosts_out=5,
+                                        seconds=0.1),
+        }
+        filter_objs = self.host_manager._choose_host_filters(filters)
+        fake_host1 = host_manager.HostState('host1', 'compute')
+        fake_host2 = host_manager.HostState('host2', 'compute')
+
+        self.mox.StubOutWithMock(filter_objs[0], 'host_passes')
+        self.mox.StubOutWithMock(filter_objs[1], 'host_passes')
+        filter_objs[1].host_passes(fake_host1, {}).AndReturn(False)
+        filter_objs[1].host_passes(fake_host2, {}).AndReturn(True)
+        filter_objs[0].host_passes(fake_host2, {}).AndReturn(True)
+
+        self.mox.ReplayAll()
+        filtered_hosts = self.host_manager.filter_hosts(
+                [fake_host1, fake_host2], {}, filters=filters)
+        self.assertEqual(filtered_hosts, [fake_host2])
 
     def test_update_service_capabilities(self):
         service_states = self.host_manager.service_states
@@ -123,6 +213,39 @@ class HostManagerTestCase(test.TestCase):
                     'host2': {'compute': host2_compute_capabs}}
         self.assertDictMatch(service_states, expected)
 
+    def test_update_service_capabilities_deltas(self):
+        hm = self.host_manager
+        self.assertTrue(hm.update_service_capabilities('compute', 'host1',
+                dict(free_memory=1234, host_memory=5678), seq=1))
+        self.assertTrue(hm.update_service_capabilities('compute', 'host1',
+                dict(free_memory=1000, free_disk=10), seq=2,
+                removed=['host_memory'], full=False))
+        capabs = hm.service_states['host1']['compute']
+        self.assertEqual(capabs['free_memory'], 1000)
+        self.assertEqual(capabs['free_disk'], 10)
+        self.assertFalse('host_memory' in capabs)
+
+        # A missed update is reported once, and the following ones are
+        # dropped until the next full update.
+        self.assertFalse(hm.update_service_capabilities('compute', 'host1',
+                dict(free_memory=500), seq=4, full=False))
+        self.assertTrue(hm.update_service_capabilities('compute', 'host1',
+                dict(free_memory=400), seq=5, full=False))
+        self.assertEqual(hm.service_states['host1']['compute'][
+                'free_memory'], 1000)
+        self.assertTrue(hm.update_service_capabilities('compute', 'host1',
+                dict(free_memory=300), seq=6))
+        self.assertTrue(hm.update_service_capabilities('compute', 'host1',
+                dict(free_memory=200), seq=7, full=False))
+        self.assertEqual(hm.service_states['host1']['compute'][
+                'free_memory'], 200)
+
+    def test_update_service_capabilities_delta_first(self):
+        self.assertFalse(self.host_manager.update_service_capabilities(
+                'compute', 'host1', dict(free_memory=500), seq=4,
+                full=False))
+        self.assertEqual(self.host_manager.service_states, {})
+
     def test_get_all_host_states(self):
 
         context = 'fake_context'
@@ -158,97 +281,157 @@ class HostManagerTestCase(test.TestCase):
         # 8191GB
         self.assertEqual(host_states['host4'].free_disk_mb, 8388608)
 
+    def _fake_compute_node(self, compute_id, host, free_ram_mb,
+                           deleted=False):
+        return dict(id=compute_id, local_gb=1024, memory_mb=1024, vcpus=1,
+                    disk_available_least=512, free_ram_mb=free_ram_mb,
+                    vcpus_used=0, local_gb_used=0, deleted=deleted,
+                    service=dict(id=compute_id, host=host, disabled=False))
 
-class HostStateTestCase(test.TestCase):
-    """Test case for HostState class"""
-
-    # update_from_compute_node() and consume_from_instance() are tested
-    # in HostManagerTestCase.test_get_all_host_states()
+    def test_get_all_host_states_refreshes_changed_hosts(self):
+        context = 'fake_context'
+        node1 = self._fake_compute_node(1, 'host1', 512)
+        node2 = self._fake_compute_node(2, 'host2', 1024)
+        services = [node1['service'], node2['service']]
+        self.flags(scheduler_host_state_resync_interval=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        first_refresh = timeutils.utcnow()
 
-    def test_host_state_passes_filters_passes(self):
-        fake_host = host_manager.HostState('host1', 'compute')
-        filter_properties = {}
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.compute_node_get_all(context).AndReturn([node1, node2])
+        db.compute_node_get_all(context,
+                updated_since=first_refresh).AndReturn(
+                        [self._fake_compute_node(1, 'host1', 256)])
+        db.service_get_all(context).AndReturn(services)
 
-        cls1 = ComputeFilterClass1()
-        cls2 = ComputeFilterClass2()
-        self.mox.StubOutWithMock(cls1, 'host_passes')
-        self.mox.StubOutWithMock(cls2, 'host_passes')
-        filter_fns = [cls1.host_passes, cls2.host_passes]
+        self.mox.ReplayAll()
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(host_states['host1'].free_ram_mb, 512)
+        host2_state = host_states['host2']
+        host2_state.consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                               memory_mb=128, vcpus=1))
+
+        timeutils.advance_time_seconds(10)
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(host_states['host1'].free_ram_mb, 256)
+        # host2 did not change, so it is the same consumed HostState
+        self.assertTrue(host_states['host2'] is host2_state)
+        self.assertEqual(host_states['host2'].free_ram_mb, 896)
+
+    def test_get_all_host_states_drops_deleted_hosts(self):
+        context = 'fake_context'
+        node1 = self._fake_compute_node(1, 'host1', 512)
+        node2 = self._fake_compute_node(2, 'host2', 1024)
+        deleted_node2 = dict(node2, deleted=True, service=None)
+        self.flags(scheduler_host_state_resync_interval=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
 
-        cls1.host_passes(fake_host, filter_properties).AndReturn(True)
-        cls2.host_passes(fake_host, filter_properties).AndReturn(True)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.compute_node_get_all(context).AndReturn([node1, node2])
+        db.compute_node_get_all(context,
+                updated_since=mox.IgnoreArg()).AndReturn([deleted_node2])
+        db.service_get_all(context).AndReturn([node1['service']])
 
         self.mox.ReplayAll()
-        result = fake_host.passes_filters(filter_fns, filter_properties)
-        self.assertTrue(result)
-
-    def test_host_state_passes_filters_passes_with_ignore(self):
-        fake_host = host_manager.HostState('host1', 'compute')
-        filter_properties = {'ignore_hosts': ['host2']}
+        self.host_manager.get_all_host_states(context, 'compute')
+        timeutils.advance_time_seconds(10)
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(host_states.keys(), ['host1'])
 
-        cls1 = ComputeFilterClass1()
-        cls2 = ComputeFilterClass2()
-        self.mox.StubOutWithMock(cls1, 'host_passes')
-        self.mox.StubOutWithMock(cls2, 'host_passes')
-        filter_fns = [cls1.host_passes, cls2.host_passes]
+    def test_get_all_host_states_full_refresh_after_interval(self):
+        context = 'fake_context'
+        node1 = self._fake_compute_node(1, 'host1', 512)
+        node2 = self._fake_compute_node(2, 'host2', 1024)
+        self.flags(scheduler_host_state_resync_interval=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
 
-        cls1.host_passes(fake_host, filter_properties).AndReturn(True)
-        cls2.host_passes(fake_host, filter_properties).AndReturn(True)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn([node1, node2])
+        db.compute_node_get_all(context).AndReturn([node2])
 
         self.mox.ReplayAll()
-        result = fake_host.passes_filters(filter_fns, filter_properties)
-        self.assertTrue(result)
-
-    def test_host_state_passes_filters_fails(self):
-        fake_host = host_manager.HostState('host1', 'compute')
-        filter_properties = {}
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        host_states['host2'].consume_from_instance(dict(root_gb=0,
+                ephemeral_gb=0, memory_mb=128, vcpus=1))
+        timeutils.advance_time_seconds(61)
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(host_states.keys(), ['host2'])
+        self.assertEqual(host_states['host2'].free_ram_mb, 1024)
 
-        cls1 = ComputeFilterClass1()
-        cls2 = ComputeFilterClass2()
-        self.mox.StubOutWithMock(cls1, 'host_passes')
-        self.mox.StubOutWithMock(cls2, 'host_passes')
-        filter_fns = [cls1.host_passes, cls2.host_passes]
+    def test_update_service_capabilities_updates_cached_host_state(self):
+        context = 'fake_context'
+        node1 = self._fake_compute_node(1, 'host1', 512)
 
-        cls1.host_passes(fake_host, filter_properties).AndReturn(False)
-        # cls2.host_passes() not called because of short circuit
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn([node1])
 
         self.mox.ReplayAll()
-        result = fake_host.passes_filters(filter_fns, filter_properties)
-        self.assertFalse(result)
-
-    def test_host_state_passes_filters_fails_from_ignore(self):
-        fake_host = host_manager.HostState('host1', 'compute')
-        filter_properties = {'ignore_hosts': ['host1']}
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(host_states['host1'].allowed_vm_type, 'all')
+        self.host_manager.update_service_capabilities('compute', 'host1',
+                dict(allowed_vm_type='hvm'))
+        self.assertEqual(host_states['host1'].allowed_vm_type, 'hvm')
+        self.assertEqual(host_states['host1'].capabilities['allowed_vm_type'],
+                         'hvm')
 
-        cls1 = ComputeFilterClass1()
-        cls2 = ComputeFilterClass2()
-        self.mox.StubOutWithMock(cls1, 'host_passes')
-        self.mox.StubOutWithMock(cls2, 'host_passes')
-        filter_fns = [cls1.host_passes, cls2.host_passes]
+    def test_claim_resources(self):
+        context = 'fake_context'
+        host_state = host_manager.HostState('host1', 'compute')
+        host_state.update_from_compute_node(
+                self._fake_compute_node(1, 'host1', 512))
+        instance = dict(root_gb=10, ephemeral_gb=5, memory_mb=256, vcpus=1)
 
-        # cls[12].host_passes() not called because of short circuit
-        # with matching host to ignore
+        self.mox.StubOutWithMock(db, 'compute_node_consume')
+        db.compute_node_consume(context, 1, 0, memory_mb=256, disk_gb=15,
+                                vcpus=1).AndReturn(1)
 
         self.mox.ReplayAll()
-        result = fake_host.passes_filters(filter_fns, filter_properties)
-        self.assertFalse(result)
+        self.assertTrue(self.host_manager.claim_resources(context,
+                                                          host_state,
+                                                          instance))
+        self.assertEqual(1, host_state.generation)
 
-    def test_host_state_passes_filters_skipped_from_force(self):
-        fake_host = host_manager.HostState('host1', 'compute')
-        filter_properties = {'force_hosts': ['host1']}
+    def test_claim_resources_conflict_reloads_host_state(self):
+        context = 'fake_context'
+        host_state = host_manager.HostState('host1', 'compute')
+        host_state.update_from_compute_node(
+                self._fake_compute_node(1, 'host1', 512))
+        instance = dict(root_gb=10, ephemeral_gb=5, memory_mb=256, vcpus=1)
+        node1 = self._fake_compute_node(1, 'host1', 128)
+        node1['generation'] = 4
+
+        self.mox.StubOutWithMock(db, 'compute_node_consume')
+        self.mox.StubOutWithMock(db, 'compute_node_get')
+        db.compute_node_consume(context, 1, 0, memory_mb=256, disk_gb=15,
+                                vcpus=1).AndRaise(
+                exception.ComputeNodeGenerationConflict(compute_id=1,
+                                                        generation=0))
+        db.compute_node_get(context, 1).AndReturn(node1)
+
+        self.mox.ReplayAll()
+        self.assertFalse(self.host_manager.claim_resources(context,
+                                                           host_state,
+                                                           instance))
+        self.assertEqual(4, host_state.generation)
+        self.assertEqual(128, host_state.free_ram_mb)
 
-        cls1 = ComputeFilterClass1()
-        cls2 = ComputeFilterClass2()
-        self.mox.StubOutWithMock(cls1, 'host_passes')
-        self.mox.StubOutWithMock(cls2, 'host_passes')
-        filter_fns = [cls1.host_passes, cls2.host_passes]
 
-        # cls[12].host_passes() not called because of short circuit
-        # with matching host to force
+class HostStateTestCase(test.TestCase):
+    """Test case for HostState class"""
 
-        self.mox.ReplayAll()
-        result = fake_host.passes_filters(filter_fns, filter_properties)
-        self.assertTrue(result)
+    # update_from_compute_node() and consume_from_instance() are tested
+    # in HostManagerTestCase.test_get_all_host_states()
 
     def test_stat_consumption_from_compute_node(self):
         stats = [
@@ -88,6 +88,33 @@ class LeastCostTestCase(test.TestCase):
         self.assertEqual(weighted_host.weight, 10512)
         self.assertEqual(weighted_host.host_state.host, 'host1')
 
+    def test_cost_table_only_reweighs_changed_hosts(self):
+        calls = []
+
+        def counting_offset(hostinfo, options):
+            calls.append(hostinfo.host)
+            return offset(hostinfo, options)
+
+        hostinfo_list = self._get_all_hosts()
+        cost_table = least_cost.HostCostTable([(1.0, counting_offset)], {})
+
+        weighted_host = cost_table.best_host(hostinfo_list)
+        self.assertEqual(weighted_host.host_state.host, 'host1')
+        self.assertEqual(len(calls), 4)
+
+        # Nothing changed, so nothing is weighed again
+        weighted_host = cost_table.best_host(hostinfo_list)
+        self.assertEqual(weighted_host.host_state.host, 'host1')
+        self.assertEqual(len(calls), 4)
+
+        # Only the changed host is weighed again
+        weighted_host.host_state.free_ram_mb += 20000
+        cost_table.host_changed(weighted_host.host_state)
+        weighted_host = cost_table.best_host(hostinfo_list)
+        self.assertEqual(weighted_host.host_state.host, 'host2')
+        self.assertEqual(weighted_host.weight, 11024)
+        self.assertEqual(calls[4:], ['host1'])
+
 
 class TestWeightedHost(test.TestCase):
     def test_dict_conversion_without_host_state(self):
@@ -76,7 +76,8 @@ class MultiDriverTestCase(test_scheduler.SchedulerTestCase):
         self.assertTrue(mgr.drivers['default'].is_fake_default)
 
     def test_update_service_capabilities(self):
-        def fake_update_service_capabilities(self, service, host, caps):
+        def fake_update_service_capabilities(self, service, host, caps,
+                                             **kwargs):
             self.is_update_caps_called = True
 
         mgr = self._manager
@@ -107,7 +108,8 @@ class SimpleSchedulerTestCase(MultiDriverTestCase):
         self._manager = multi.MultiScheduler()
 
     def test_update_service_capabilities(self):
-        def fake_update_service_capabilities(self, service, host, caps):
+        def fake_update_service_capabilities(self, service, host, caps,
+                                             **kwargs):
             self.is_update_caps_called = True
 
         mgr = self._manager
@@ -84,6 +84,13 @@ class SchedulerRpcAPITestCase(test.TestCase):
                 rpc_method='fanout_cast', service_name='fake_name',
                 host='fake_host', capabilities='fake_capabilities')
 
+    def test_update_service_capabilities_delta(self):
+        self._test_scheduler_api('update_service_capabilities',
+                rpc_method='fanout_cast', service_name='fake_name',
+                host='fake_host', capabilities='fake_capabilities',
+                seq=2, removed=['fake_capability'], full=False,
+                version='2.3')
+
     def test_create_volume(self):
         self._test_scheduler_api('create_volume',
                 rpc_method='cast', volume_id="fake_volume",
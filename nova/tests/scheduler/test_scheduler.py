@@ -73,7 +73,7 @@ class SchedulerManagerTestCase(test.TestCase):
 
         # Test no capabilities passes empty dictionary
         self.manager.driver.update_service_capabilities(service_name,
-                host, {})
+                host, {}, seq=None, removed=None, full=True)
         self.mox.ReplayAll()
         result = self.manager.update_service_capabilities(self.context,
                 service_name=service_name, host=host, capabilities={})
@@ -83,12 +83,29 @@ class SchedulerManagerTestCase(test.TestCase):
         # Test capabilities passes correctly
         capabilities = {'fake_capability': 'fake_value'}
         self.manager.driver.update_service_capabilities(
-                service_name, host, capabilities)
+                service_name, host, capabilities, seq=None, removed=None,
+                full=True)
         self.mox.ReplayAll()
         result = self.manager.update_service_capabilities(self.context,
                 service_name=service_name, host=host,
                 capabilities=capabilities)
 
+    def test_update_service_capabilities_resync(self):
+        self.mox.StubOutWithMock(self.manager.driver,
+                'update_service_capabilities')
+        self.mox.StubOutWithMock(self.manager.compute_rpcapi,
+                'publish_service_capabilities')
+
+        self.manager.driver.update_service_capabilities('compute',
+                'fake_host', {}, seq=5, removed=[],
+                full=False).AndReturn(False)
+        self.manager.compute_rpcapi.publish_service_capabilities(
+                self.context, host='fake_host')
+        self.mox.ReplayAll()
+        self.manager.update_service_capabilities(self.context,
+                service_name='compute', host='fake_host', capabilities={},
+                seq=5, removed=[], full=False)
+
     def test_show_host_resources(self):
         host = 'fake_host'
 
@@ -282,7 +299,8 @@ class SchedulerTestCase(test.TestCase):
 
         capabilities = {'fake_capability': 'fake_value'}
         self.driver.host_manager.update_service_capabilities(
-                service_name, host, capabilities)
+                service_name, host, capabilities, seq=None, removed=None,
+                full=True)
         self.mox.ReplayAll()
         result = self.driver.update_service_capabilities(service_name,
                 host, capabilities)
@@ -293,12 +311,13 @@ class SchedulerTestCase(test.TestCase):
         services = [service1, service2]
 
         self.mox.StubOutWithMock(db, 'service_get_all_by_topic')
-        self.mox.StubOutWithMock(utils, 'service_is_up')
+        self.mox.StubOutWithMock(self.driver.servicegroup_api,
+                                 'get_up_services')
 
         db.service_get_all_by_topic(self.context,
                 self.topic).AndReturn(services)
-        utils.service_is_up(service1).AndReturn(False)
-        utils.service_is_up(service2).AndReturn(True)
+        self.driver.servicegroup_api.get_up_services(
+                services).AndReturn([service2])
 
         self.mox.ReplayAll()
         result = self.driver.hosts_up(self.context, self.topic)
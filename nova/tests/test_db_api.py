@@ -23,6 +23,8 @@ import datetime
 
 from nova import context
 from nova import db
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import session as db_session
 from nova import exception
 from nova import flags
 from nova.openstack.common import timeutils
@@ -86,6 +88,15 @@ class DbApiTestCase(test.TestCase):
                                                 {'display_name': '%test%'})
         self.assertEqual(2, len(result))
 
+    def test_instance_get_all_by_filters_regex_literal(self):
+        self.create_instances_with_args(display_name='test.1')
+        self.create_instances_with_args(display_name='test.12')
+        self.create_instances_with_args(display_name='testx1')
+        result = db.instance_get_all_by_filters(self.context,
+                                                {'display_name': '^test\\.1$'})
+        self.assertEqual(['test.1'], [inst['display_name']
+                                      for inst in result])
+
     def test_instance_get_all_by_filters_metadata(self):
         self.create_instances_with_args(metadata={'foo': 'bar'})
         self.create_instances_with_args()
@@ -143,6 +154,53 @@ class DbApiTestCase(test.TestCase):
                           self.context, {'display_name': '%test%'},
                           marker=str(utils.gen_uuid()))
 
+    def test_instance_get_all_by_filters_paginate_equal_sort_keys(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        instances = [self.create_instances_with_args() for i in xrange(5)]
+        expected = [inst['uuid'] for inst in reversed(instances)]
+
+        uuids = []
+        marker = None
+        while True:
+            result = db.instance_get_all_by_filters(self.context, {},
+                                                    limit=2, marker=marker)
+            if not result:
+                break
+            uuids.extend(inst['uuid'] for inst in result)
+            marker = result[-1]['uuid']
+        self.assertEqual(expected, uuids)
+
+    def test_instance_get_all_by_filters_marker_in_other_project(self):
+        other_context = context.RequestContext('other', 'other')
+        other = db.instance_create(other_context, {'project_id': 'other'})
+        self.create_instances_with_args()
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          self.context, {}, marker=other['uuid'])
+
+    def test_instance_get_all_by_host_columns_to_join(self):
+        ctxt = context.get_admin_context()
+        self.create_instances_with_args(metadata={'foo': 'bar'})
+        result = db.instance_get_all_by_host(ctxt, 'host1')
+        self.assertTrue('metadata' in result[0].__dict__)
+        self.assertTrue('info_cache' in result[0].__dict__)
+        result = db.instance_get_all_by_host(ctxt, 'host1',
+                                             columns_to_join=[])
+        self.assertFalse('metadata' in result[0].__dict__)
+        self.assertFalse('info_cache' in result[0].__dict__)
+
+    def test_instance_get_all_by_filters_columns_to_join(self):
+        self.create_instances_with_args(metadata={'foo': 'bar'})
+        result = db.instance_get_all_by_filters(self.context, {},
+                                                columns_to_join=[])
+        self.assertFalse('metadata' in result[0].__dict__)
+        self.assertFalse('info_cache' in result[0].__dict__)
+        result = db.instance_get_all_by_filters(self.context, {},
+                                                columns_to_join=['metadata'])
+        self.assertTrue('metadata' in result[0].__dict__)
+        self.assertFalse('info_cache' in result[0].__dict__)
+
     def test_migration_get_unconfirmed_by_dest_compute(self):
         ctxt = context.get_admin_context()
 
@@ -356,6 +414,39 @@ class DbApiTestCase(test.TestCase):
         expected = {uuids[0]: [], uuids[1]: []}
         self.assertEqual(expected, instance_faults)
 
+    def test_instance_metadata_get_by_instance_uuids(self):
+        instance1 = self.create_instances_with_args(metadata={'foo': 'bar'})
+        instance2 = self.create_instances_with_args()
+        uuids = [instance1['uuid'], instance2['uuid']]
+        metadata = db.instance_metadata_get_by_instance_uuids(self.context,
+                                                              uuids)
+        expected = {uuids[0]: {'foo': 'bar'}, uuids[1]: {}}
+        self.assertEqual(expected, metadata)
+        self.assertEqual({},
+                db.instance_metadata_get_by_instance_uuids(self.context, []))
+
+    def test_instance_system_metadata_get_by_instance_uuids(self):
+        instance1 = self.create_instances_with_args(
+                system_metadata={'node': 'node1'})
+        instance2 = self.create_instances_with_args(
+                system_metadata={'node': 'node2'})
+        uuids = [instance1['uuid'], instance2['uuid']]
+        sys_meta = db.instance_system_metadata_get_by_instance_uuids(
+                self.context, uuids)
+        expected = {uuids[0]: {'node': 'node1'}, uuids[1]: {'node': 'node2'}}
+        self.assertEqual(expected, sys_meta)
+
+    def test_instance_info_cache_get_by_instance_uuids(self):
+        instance1 = self.create_instances_with_args()
+        instance2 = self.create_instances_with_args()
+        db.instance_info_cache_update(self.context, instance1['uuid'],
+                                      {'network_info': 'net1'})
+        uuids = [instance1['uuid'], instance2['uuid'], 'missing']
+        caches = db.instance_info_cache_get_by_instance_uuids(self.context,
+                                                              uuids)
+        self.assertEqual(sorted(caches.keys()), sorted(uuids[:2]))
+        self.assertEqual(caches[uuids[0]]['network_info'], 'net1')
+
     def test_dns_registration(self):
         domain1 = 'test.domain.one'
         domain2 = 'test.domain.two'
@@ -532,6 +623,35 @@ class DbApiTestCase(test.TestCase):
         _compare(bw_usages[2], expected_bw_usages[2])
         timeutils.clear_time_override()
 
+    def test_bw_usage_bulk_update(self):
+        ctxt = context.get_admin_context()
+        start_period = timeutils.utcnow() - datetime.timedelta(seconds=10)
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac1', start_period,
+                           100, 200, 12345, 67890)
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac1',
+                           start_period - datetime.timedelta(days=1),
+                           1, 1, 1, 1)
+
+        db.bw_usage_bulk_update(ctxt, start_period, [
+                dict(uuid='fake_uuid1', mac='fake_mac1', bw_in=150,
+                     bw_out=250, last_ctr_in=12395, last_ctr_out=67940),
+                dict(uuid='fake_uuid2', mac='fake_mac2', bw_in=0,
+                     bw_out=0, last_ctr_in=42, last_ctr_out=43)])
+
+        bw_usages = db.bw_usage_get_by_uuids(ctxt,
+                ['fake_uuid1', 'fake_uuid2'], start_period)
+        bw_usages = dict((bw_usage['mac'],
+                          (bw_usage['bw_in'], bw_usage['bw_out'],
+                           bw_usage['last_ctr_in'], bw_usage['last_ctr_out']))
+                         for bw_usage in bw_usages)
+        self.assertEqual(bw_usages, {'fake_mac1': (150, 250, 12395, 67940),
+                                     'fake_mac2': (0, 0, 42, 43)})
+
+        # The other period is left alone.
+        bw_usages = db.bw_usage_get_by_uuids(ctxt, ['fake_uuid1'],
+                start_period - datetime.timedelta(days=1))
+        self.assertEqual(bw_usages[0]['bw_in'], 1)
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate',
@@ -961,6 +1081,28 @@ class CapacityTestCase(test.TestCase):
         self.assertEqual(2, int(stats['num_proj_12345']))
         self.assertEqual(3, int(stats['num_vm_building']))
 
+    def test_compute_node_get_all_updated_since(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        item = self._create_helper('host1')
+        timeutils.advance_time_seconds(10)
+        since = timeutils.utcnow()
+        nodes = db.compute_node_get_all(self.ctxt, updated_since=since)
+        self.assertEqual([], nodes)
+
+        # Stats-only updates are picked up
+        timeutils.advance_time_seconds(10)
+        db.compute_node_update(self.ctxt, item['id'],
+                               {'stats': dict(num_instances=4)})
+        nodes = db.compute_node_get_all(self.ctxt, updated_since=since)
+        self.assertEqual([item['id']], [node['id'] for node in nodes])
+
+        # ...and so are deleted compute nodes
+        db.service_destroy(self.ctxt, self.service['id'])
+        nodes = db.compute_node_get_all(self.ctxt, updated_since=since)
+        self.assertEqual([item['id']], [node['id'] for node in nodes])
+        self.assertTrue(nodes[0]['deleted'])
+
     def test_compute_node_update(self):
         item = self._create_helper('host1')
 
@@ -982,6 +1124,61 @@ class CapacityTestCase(test.TestCase):
         self.assertEqual(2, int(stats['num_proj_12345']))
         self.assertEqual(1, int(stats['num_tribbles']))
 
+    def test_compute_node_update_bumps_generation(self):
+        item = self._create_helper('host1')
+        self.assertEqual(0, item['generation'])
+        item = db.compute_node_update(self.ctxt, item['id'], {'vcpus': 4})
+        self.assertEqual(1, item['generation'])
+
+    def test_compute_node_consume(self):
+        item = self._create_helper('host1')
+        generation = db.compute_node_consume(self.ctxt, item['id'], 0,
+                memory_mb=512, disk_gb=10, vcpus=1)
+        self.assertEqual(1, generation)
+
+        item = db.compute_node_get(self.ctxt, item['id'])
+        self.assertEqual(1, item['generation'])
+        self.assertEqual(512, item['free_ram_mb'])
+        self.assertEqual(512, item['memory_mb_used'])
+        self.assertEqual(2038, item['free_disk_gb'])
+        self.assertEqual(10, item['local_gb_used'])
+        self.assertEqual(1, item['vcpus_used'])
+
+    def test_compute_node_consume_generation_conflict(self):
+        item = self._create_helper('host1')
+        db.compute_node_update(self.ctxt, item['id'], {'vcpus': 4})
+        self.assertRaises(exception.ComputeNodeGenerationConflict,
+                          db.compute_node_consume, self.ctxt, item['id'], 0,
+                          memory_mb=512)
+
+        item = db.compute_node_get(self.ctxt, item['id'])
+        self.assertEqual(1024, item['free_ram_mb'])
+
+    def test_compute_node_update_after_concurrent_consume(self):
+        item = self._create_helper('host1')
+        orig_compute_node_get = sqlalchemy_api.compute_node_get
+        consumed = []
+
+        def compute_node_get(context, compute_id, session=None):
+            # A scheduler claims the node while the update is in progress.
+            compute_ref = orig_compute_node_get(context, compute_id,
+                                                session=session)
+            if not consumed:
+                consumed.append(db.compute_node_consume(self.ctxt,
+                        compute_id, compute_ref['generation'],
+                        memory_mb=512))
+            return compute_ref
+
+        self.stubs.Set(sqlalchemy_api, 'compute_node_get', compute_node_get)
+        item = db.compute_node_update(self.ctxt, item['id'], {'vcpus': 4})
+        self.assertEqual([1], consumed)
+        self.assertEqual(2, item['generation'])
+
+        # A claim against the generation the consume left is now stale.
+        self.assertRaises(exception.ComputeNodeGenerationConflict,
+                          db.compute_node_consume, self.ctxt, item['id'], 1,
+                          memory_mb=512)
+
     def test_compute_node_stat_prune(self):
         item = self._create_helper('host1')
         for stat in item['stats']:
@@ -1042,6 +1239,61 @@ class TestIpAllocation(test.TestCase):
         self.assertEqual(fixed_ip.network_id, self.network.id)
 
 
+class ReadOnlyTestCase(test.TestCase):
+    def setUp(self):
+        super(ReadOnlyTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.slave_sessions = []
+        orig_get_session = db_session.get_session
+
+        def fake_get_session(**kwargs):
+            self.slave_sessions.append(kwargs['slave_session'])
+            return orig_get_session(**kwargs)
+
+        self.stubs.Set(db_session, 'get_session', fake_get_session)
+
+    def test_read_only_calls_use_slave_session(self):
+        db.instance_get_all_by_filters(self.context, {})
+        db.compute_node_get_all(self.context)
+        self.assertTrue(self.slave_sessions)
+        self.assertTrue(all(self.slave_sessions))
+
+    def test_other_calls_use_main_session(self):
+        instance = db.instance_create(self.context, {})
+        db.instance_get_by_uuid(self.context, instance['uuid'])
+        self.assertTrue(self.slave_sessions)
+        self.assertFalse(any(self.slave_sessions))
+
+    def test_read_only_resets_after_error(self):
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters, self.context, {},
+                          marker='missing')
+        del self.slave_sessions[:]
+        self.assertRaises(exception.InstanceNotFound,
+                          db.instance_get_by_uuid, self.context, 'missing')
+        self.assertEqual(self.slave_sessions, [False])
+
+
+class SlaveSessionTestCase(test.TestCase):
+    def setUp(self):
+        super(SlaveSessionTestCase, self).setUp()
+        self.stubs.Set(db_session, '_SLAVE_ENGINE', None)
+        self.stubs.Set(db_session, '_SLAVE_MAKER', None)
+
+    def test_slave_session_without_slave_connection(self):
+        session = db_session.get_session(slave_session=True)
+        self.assertEqual(session.bind, db_session.get_engine())
+
+    def test_slave_session(self):
+        self.flags(sql_slave_connection='sqlite://')
+        session = db_session.get_session(slave_session=True)
+        self.assertEqual(session.bind,
+                         db_session.get_engine(slave_engine=True))
+        self.assertNotEqual(session.bind, db_session.get_engine())
+        session = db_session.get_session()
+        self.assertEqual(session.bind, db_session.get_engine())
+
+
 class InstanceDestroyConstraints(test.TestCase):
 
     def test_destroy_with_equal_any_constraint_met(self):
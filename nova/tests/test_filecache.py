@@ -0,0 +1,101 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the file backed memcache client."""
+
+import datetime
+import os
+import shutil
+import tempfile
+
+from nova.common import filecache
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class FileCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(FileCacheTestCase, self).setUp()
+        self.now = datetime.datetime(2012, 11, 1, 12, 0, 0)
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.client = filecache.Client(self.directory)
+
+    def _keys(self):
+        return [name for name in os.listdir(self.directory)
+                if not name.startswith('.')]
+
+    def test_set_get(self):
+        self.assertTrue(self.client.set('foo', {'bar': ('baz', 1)}))
+        self.assertEqual(self.client.get('foo'), {'bar': ('baz', 1)})
+        self.assertEqual(self.client.get('baz'), None)
+
+    def test_keys_are_shared(self):
+        other = filecache.Client(self.directory)
+        self.client.set('foo', 'bar')
+        self.assertEqual(other.get('foo'), 'bar')
+        other.delete('foo')
+        self.assertEqual(self.client.get('foo'), None)
+
+    def test_add_incr_delete(self):
+        self.assertTrue(self.client.add('foo', '1', time=10))
+        self.assertFalse(self.client.add('foo', '2'))
+        self.assertEqual(self.client.incr('foo', 10), 11)
+        self.assertEqual(self.client.get('foo'), '11')
+        self.assertEqual(self.client.incr('bar'), None)
+
+        timeutils.advance_time_seconds(20)
+        self.assertEqual(self.client.get('foo'), None)
+        self.assertTrue(self.client.add('foo', '3'))
+        self.assertTrue(self.client.delete('foo'))
+        self.assertFalse(self.client.delete('foo'))
+
+    def test_expired_files_are_purged(self):
+        self.stubs.Set(filecache, 'PURGE_INTERVAL', 3)
+        self.client.set('short', 'a', time=10)
+        self.client.set('forever', 'b')
+        timeutils.advance_time_seconds(20)
+        self.assertEqual(self.client.get('short'), None)
+        self.assertEqual(len(self._keys()), 2)
+
+        self.client.set('other', 'c')
+        self.assertEqual(len(self._keys()), 2)
+        self.assertEqual(self.client.get_multi(['short', 'forever', 'other']),
+                         {'forever': 'b', 'other': 'c'})
+
+    def test_purge_does_not_read_files(self):
+        self.stubs.Set(filecache, 'PURGE_INTERVAL', 2)
+        self.client.set('short', 'a', time=10)
+        timeutils.advance_time_seconds(20)
+
+        def fail_read(path):
+            self.fail('%s should not be read' % path)
+
+        self.stubs.Set(self.client, '_read', fail_read)
+        self.client.set('forever', 'b')
+        self.assertEqual(self._keys(), [os.path.basename(
+                self.client._path('forever'))])
+
+    def test_set_multi_get_multi(self):
+        self.assertEqual(self.client.set_multi({'a': '1', 'b': '2'},
+                                               key_prefix='x-'), [])
+        self.assertEqual(self.client.get('x-a'), '1')
+        self.assertEqual(self.client.get_multi(['a', 'b', 'c'],
+                                               key_prefix='x-'),
+                         {'a': '1', 'b': '2'})
@@ -47,6 +47,7 @@ import nova.tests.image.fake
 from nova import utils
 from nova.virt.disk import api as disk
 from nova.virt import driver
+from nova.virt import event as virtevent
 from nova.virt import firewall as base_firewall
 from nova.virt import images
 from nova.virt.libvirt import config
@@ -991,6 +992,71 @@ class LibvirtConnTestCase(test.TestCase):
         # None should be listed, since we fake deleted the last one
         self.assertEquals(len(instances), 0)
 
+    def test_list_instance_power_states(self):
+
+        class FakeDomain(object):
+            def __init__(self, name, state):
+                self._name = name
+                self._state = state
+
+            def name(self):
+                return self._name
+
+            def info(self):
+                if self._state is None:
+                    raise libvirt.libvirtError("we deleted an instance!")
+                return [self._state, 0, 0, 1, 0]
+
+        domains = [FakeDomain('running', libvirt_driver.VIR_DOMAIN_RUNNING),
+                   FakeDomain('shutoff', libvirt_driver.VIR_DOMAIN_SHUTOFF),
+                   FakeDomain('deleted', None)]
+        self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
+        libvirt_driver.LibvirtDriver._conn.listAllDomains = (
+                lambda flags: domains)
+
+        self.mox.ReplayAll()
+        conn = libvirt_driver.LibvirtDriver(False)
+        self.assertEqual(conn.list_instance_power_states(),
+                         {'running': power_state.RUNNING,
+                          'shutoff': power_state.SHUTDOWN})
+
+    def test_lifecycle_events(self):
+
+        class FakeDomain(object):
+            def UUIDString(self):
+                return 'fake-uuid'
+
+        conn = libvirt_driver.LibvirtDriver(False)
+        events = []
+        conn.register_event_listener(events.append)
+        conn._init_events_pipe()
+
+        for event in (libvirt.VIR_DOMAIN_EVENT_DEFINED,
+                      libvirt.VIR_DOMAIN_EVENT_STARTED,
+                      libvirt.VIR_DOMAIN_EVENT_STOPPED):
+            conn._event_lifecycle_callback(None, FakeDomain(), event, 0,
+                                           conn)
+        conn._dispatch_events()
+
+        self.assertEqual([(e.uuid, e.transition) for e in events],
+                         [('fake-uuid', virtevent.EVENT_LIFECYCLE_STARTED),
+                          ('fake-uuid', virtevent.EVENT_LIFECYCLE_STOPPED)])
+
+    def test_register_lifecycle_events(self):
+        self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
+        self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver._conn,
+                                 'domainEventRegisterAny')
+        libvirt_driver.LibvirtDriver._conn.domainEventRegisterAny(
+                None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                libvirt_driver.LibvirtDriver._event_lifecycle_callback,
+                mox.IsA(libvirt_driver.LibvirtDriver))
+
+        self.mox.ReplayAll()
+        conn = libvirt_driver.LibvirtDriver(False)
+        self.assertFalse(conn.lifecycle_events_enabled())
+        conn._register_lifecycle_events(conn._conn)
+        self.assertTrue(conn.lifecycle_events_enabled())
+
     def test_get_all_block_devices(self):
         xml = [
             # NOTE(vish): id 0 is skipped
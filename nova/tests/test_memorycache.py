@@ -0,0 +1,134 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the in process memcache client."""
+
+import datetime
+
+from nova.common import memorycache
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class MemoryCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(MemoryCacheTestCase, self).setUp()
+        self.now = datetime.datetime(2012, 11, 1, 12, 0, 0)
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+        self.client = memorycache.Client()
+
+    def _stats(self):
+        return self.client.get_stats()[0][1]
+
+    def test_set_get(self):
+        self.assertTrue(self.client.set('foo', 'bar'))
+        self.assertEqual(self.client.get('foo'), 'bar')
+        self.assertEqual(self.client.get('baz'), None)
+        stats = self._stats()
+        self.assertEqual(stats['get_hits'], 1)
+        self.assertEqual(stats['get_misses'], 1)
+        self.assertEqual(stats['curr_items'], 1)
+        self.assertEqual(stats['bytes'], 3)
+
+    def test_add_incr_delete(self):
+        self.assertTrue(self.client.add('foo', '1'))
+        self.assertFalse(self.client.add('foo', '2'))
+        self.assertEqual(self.client.incr('foo', 10), 11)
+        self.assertEqual(self.client.get('foo'), '11')
+        self.assertEqual(self.client.incr('bar'), None)
+        self.assertTrue(self.client.delete('foo'))
+        self.assertFalse(self.client.delete('foo'))
+        self.assertEqual(self._stats()['bytes'], 0)
+
+    def test_expiry_drops_keys_not_read_again(self):
+        self.client.set('short', 'a', time=10)
+        self.client.set('long', 'b', time=100)
+        self.client.set('forever', 'c')
+        self.client.set('short', 'd', time=50)
+
+        timeutils.advance_time_seconds(20)
+        self.client.set('other', 'e')
+        self.assertEqual(self._stats()['curr_items'], 4)
+
+        timeutils.advance_time_seconds(40)
+        self.client.set('other', 'f')
+        self.assertTrue('short' not in self.client.cache)
+        self.assertEqual(self._stats()['expirations'], 1)
+
+        timeutils.advance_time_seconds(60)
+        self.assertEqual(self.client.get_multi(['short', 'long', 'forever']),
+                         {'forever': 'c'})
+        self.assertEqual(self._stats()['expirations'], 2)
+
+    def test_timeouts_do_not_grow_with_overwrites(self):
+        for i in xrange(1000):
+            self.client.set('foo', str(i), time=10 + i)
+            self.client.set('bar-%d' % (i % 10), str(i), time=10 + i)
+        self.assertTrue(len(self.client._timeouts) <=
+                        memorycache.MIN_TIMEOUTS_REBUILD)
+
+        timeutils.advance_time_seconds(1000)
+        self.assertEqual(self.client.get('bar-9'), '999')
+        self.assertEqual(self.client.get('foo'), '999')
+        timeutils.advance_time_seconds(10)
+        self.assertEqual(self.client.get('foo'), None)
+        self.assertEqual(self._stats()['curr_items'], 0)
+        self.assertEqual(self._stats()['expirations'], 11)
+
+    def test_timeouts_do_not_grow_with_evictions(self):
+        client = memorycache.Client(max_entries=10)
+        for i in xrange(1000):
+            client.set('foo-%d' % i, str(i), time=10)
+        self.assertTrue(len(client._timeouts) <=
+                        memorycache.MIN_TIMEOUTS_REBUILD)
+        self.assertEqual(client.get_stats()[0][1]['evictions'], 990)
+
+    def test_size_of_values_other_than_strings(self):
+        value = {'name': 'x' * 1000}
+        self.client.set('foo', value)
+        self.assertTrue(self._stats()['bytes'] > 1000)
+
+    def test_lru_eviction_by_entries(self):
+        client = memorycache.Client(max_entries=2)
+        client.set('a', '1')
+        client.set('b', '2')
+        client.get('a')
+        client.set('c', '3')
+        self.assertEqual(client.get_multi(['a', 'b', 'c']),
+                         {'a': '1', 'c': '3'})
+        self.assertEqual(client.get_stats()[0][1]['evictions'], 1)
+
+    def test_lru_eviction_by_bytes(self):
+        client = memorycache.Client(max_entries=0, max_bytes=10)
+        client.set('a', '12345')
+        client.set('b', '12345')
+        client.set('a', '1234')
+        client.set('c', '12')
+        self.assertEqual(client.get_multi(['a', 'b', 'c']),
+                         {'a': '1234', 'c': '12'})
+        stats = client.get_stats()[0][1]
+        self.assertEqual(stats['bytes'], 6)
+        self.assertEqual(stats['evictions'], 1)
+
+    def test_set_multi_get_multi(self):
+        self.assertEqual(self.client.set_multi({'a': '1', 'b': '2'},
+                                               key_prefix='x-'), [])
+        self.assertEqual(self.client.get('x-a'), '1')
+        self.assertEqual(self.client.get_multi(['a', 'b', 'c'],
+                                               key_prefix='x-'),
+                         {'a': '1', 'b': '2'})
@@ -27,7 +27,10 @@ import webob
 
 from nova.api.metadata import base
 from nova.api.metadata import handler
+from nova.api.metadata import notifier
 from nova import block_device
+from nova.common import filecache
+from nova.common import memorycache
 from nova import db
 from nova.db.sqlalchemy import api
 from nova import exception
@@ -35,6 +38,7 @@ from nova import flags
 from nova.network import api as network_api
 from nova import test
 from nova.tests import fake_network
+from nova import utils
 
 FLAGS = flags.FLAGS
 
@@ -334,6 +338,34 @@ class OpenStackMetadataTestCase(test.TestCase):
             mdinst.lookup, "/openstack/2012-08-10/user_data")
 
 
+class RenderedPathsTestCase(test.TestCase):
+    def setUp(self):
+        super(RenderedPathsTestCase, self).setUp()
+        fake_network.stub_out_nw_api_get_instance_nw_info(self.stubs,
+                                                          spectacular=True)
+
+    def test_rendered_paths_match_lookup(self):
+        mdinst = fake_InstanceMetadata(self.stubs, INSTANCES[0],
+                                       content=[('/etc/motd', 'hello')])
+        paths = mdinst.get_rendered_paths()
+
+        for path in ('/ec2', '/ec2/latest/meta-data/public-keys/0/_name',
+                     '/ec2/2009-04-04/user-data',
+                     '/openstack/latest/meta_data.json',
+                     '/openstack/content/0000'):
+            self.assertTrue(path in paths, path)
+        for path, body in paths.iteritems():
+            self.assertEqual(body, base.ec2_md_print(mdinst.lookup(path)))
+
+    def test_normalize_path(self):
+        self.assertEqual(base.normalize_path(''), '/ec2')
+        self.assertEqual(base.normalize_path('/'), '/ec2')
+        self.assertEqual(base.normalize_path('2009-04-04/meta-data/'),
+                         '/ec2/2009-04-04/meta-data')
+        self.assertEqual(base.normalize_path('/openstack/latest/../'),
+                         '/openstack')
+
+
 class MetadataHandlerTestCase(test.TestCase):
     """Test that metadata is returning proper values."""
 
@@ -373,6 +405,170 @@ class MetadataHandlerTestCase(test.TestCase):
                                 relpath="/2009-04-04/user-data", address=None)
         self.assertEqual(response.status_int, 500)
 
+    def test_responses_are_rendered_once(self):
+        calls = []
+
+        def fake_get_metadata(address):
+            calls.append(address)
+            return self.mdinst
+
+        app = handler.MetadataRequestHandler()
+        self.stubs.Set(app, 'get_metadata', fake_get_metadata)
+
+        for relpath in ('/2009-04-04/user-data', '/latest/meta-data/',
+                        '/openstack/latest/meta_data.json'):
+            request = webob.Request.blank(relpath)
+            request.remote_addr = '127.0.0.1'
+            response = request.get_response(app)
+            self.assertEqual(response.status_int, 200)
+        self.assertEqual(calls, ['127.0.0.1'])
+
+    def test_etag(self):
+        app = handler.MetadataRequestHandler()
+        self.stubs.Set(app, 'get_metadata', lambda address: self.mdinst)
+
+        request = webob.Request.blank('/2009-04-04/user-data')
+        request.remote_addr = '127.0.0.1'
+        response = request.get_response(app)
+        self.assertEqual(response.status_int, 200)
+        self.assertTrue(response.etag)
+
+        request = webob.Request.blank('/2009-04-04/user-data')
+        request.remote_addr = '127.0.0.1'
+        request.if_none_match = response.etag
+        response = request.get_response(app)
+        self.assertEqual(response.status_int, 304)
+
+    def test_user_data_is_cached_once(self):
+        inst = copy(self.instance)
+        inst['user_data'] = base64.b64encode('x' * 1024)
+        mdinst = fake_InstanceMetadata(self.stubs, inst)
+        app = handler.MetadataRequestHandler()
+        self.stubs.Set(app, 'get_metadata', lambda address: mdinst)
+
+        responses = app.get_responses('127.0.0.1')
+        self.assertEqual(responses['/ec2/2009-04-04/user-data'],
+                         responses['/openstack/latest/user_data'])
+        values = [entry[memorycache.VALUE]
+                  for entry in app._cache.cache.itervalues()]
+        self.assertEqual(values.count('x' * 1024), 1)
+
+        request = webob.Request.blank('/openstack/latest/user_data')
+        request.remote_addr = '127.0.0.1'
+        self.assertEqual(request.get_response(app).body, 'x' * 1024)
+
+    def test_dropped_body_is_rendered_again(self):
+        calls = []
+
+        def fake_get_metadata(address):
+            calls.append(address)
+            return self.mdinst
+
+        app = handler.MetadataRequestHandler()
+        self.stubs.Set(app, 'get_metadata', fake_get_metadata)
+        etag = app.get_responses('127.0.0.1')['/ec2/2009-04-04/user-data']
+        app._cache.delete(handler.body_cache_key(etag))
+
+        request = webob.Request.blank('/2009-04-04/user-data')
+        request.remote_addr = '127.0.0.1'
+        response = request.get_response(app)
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.body,
+                         base64.b64decode(self.instance['user_data']))
+        self.assertEqual(calls, ['127.0.0.1', '127.0.0.1'])
+
+    def test_dropped_body_of_changed_instance(self):
+        inst = copy(self.instance)
+        mdinst = fake_InstanceMetadata(self.stubs, inst)
+        app = handler.MetadataRequestHandler()
+        self.stubs.Set(app, 'get_metadata', lambda address: mdinst)
+        etag = app.get_responses('127.0.0.1')['/ec2/2009-04-04/user-data']
+        app._cache.delete(handler.body_cache_key(etag))
+
+        # The user data changes before the dropped body is rendered again.
+        inst['user_data'] = base64.b64encode('changed')
+        mdinst = fake_InstanceMetadata(self.stubs, inst)
+
+        request = webob.Request.blank('/2009-04-04/user-data')
+        request.remote_addr = '127.0.0.1'
+        response = request.get_response(app)
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.body, 'changed')
+        self.assertNotEqual(response.etag, etag)
+        self.assertEqual(response.etag,
+                app.get_responses('127.0.0.1')['/ec2/2009-04-04/user-data'])
+
+    def test_notifier_invalidates_instance(self):
+        calls = []
+
+        def fake_get_metadata(address):
+            calls.append(address)
+            return self.mdinst
+
+        app = handler.MetadataRequestHandler()
+        self.stubs.Set(app, 'get_metadata', fake_get_metadata)
+        for address in ('127.0.0.1', '127.0.0.2', '127.0.0.1'):
+            app.get_responses(address)
+        self.assertEqual(calls, ['127.0.0.1', '127.0.0.2'])
+
+        notifier.invalidate_instance(app._cache, self.instance['uuid'])
+
+        for address in ('127.0.0.1', '127.0.0.2', '127.0.0.2'):
+            app.get_responses(address)
+        self.assertEqual(calls, ['127.0.0.1', '127.0.0.2'] * 2)
+
+    def test_instance_token_is_added_once(self):
+        app = handler.MetadataRequestHandler()
+        cache = app._cache
+        token = app._get_token('fake-uuid')
+        self.assertEqual(app._get_token('fake-uuid'), token)
+
+        # Another worker adds the token between the get and the add.
+        other_token = 'other-token'
+        real_get = cache.get
+
+        def racing_get(key):
+            self.stubs.Set(cache, 'get', real_get)
+            cache.add(key, other_token)
+            return None
+
+        self.stubs.Set(cache, 'get', racing_get)
+        self.assertEqual(app._get_token('other-uuid'), other_token)
+        self.assertEqual(cache.get(handler.instance_cache_key('other-uuid')),
+                         other_token)
+
+    def test_workers_share_cache(self):
+        calls = []
+
+        def fake_get_metadata(address):
+            calls.append(address)
+            return self.mdinst
+
+        with utils.tempdir() as tmpdir:
+            self.flags(metadata_workers=2, metadata_cache_dir=tmpdir)
+            apps = [handler.MetadataRequestHandler() for i in range(2)]
+            for app in apps:
+                self.assertTrue(isinstance(app._cache, filecache.Client))
+                self.stubs.Set(app, 'get_metadata', fake_get_metadata)
+                request = webob.Request.blank('/2009-04-04/user-data')
+                request.remote_addr = '127.0.0.1'
+                response = request.get_response(app)
+                self.assertEqual(response.status_int, 200)
+        self.assertEqual(calls, ['127.0.0.1'])
+
+    def test_notify(self):
+        self.flags(memcached_servers=['localhost:11211'])
+        invalidated = []
+        self.stubs.Set(notifier, '_get_cache', lambda: 'cache')
+        self.stubs.Set(notifier, 'invalidate_instance',
+                       lambda cache, uuid: invalidated.append(uuid))
+
+        notifier.notify(None, {'event_type': 'compute.instance.update',
+                               'payload': {'instance_id': 'fake-uuid'}})
+        notifier.notify(None, {'event_type': 'volume.create.end',
+                               'payload': {'volume_id': 'fake-volume'}})
+        self.assertEqual(invalidated, ['fake-uuid'])
+
     def test_invalid_path_is_404(self):
         response = fake_request(self.stubs, self.mdinst,
                                 relpath="/2009-04-04/user-data-invalid")
@@ -261,6 +261,57 @@ class QuotaIntegrationTestCase(test.TestCase):
 
         assertInstancesReserved(0)
 
+    def test_reservation_expire_in_batches(self):
+        self.flags(reservation_expire_batch_size=2)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        queries = []
+        orig_query = sqa_api._expired_reservations_query
+
+        def fake_query(*args, **kwargs):
+            queries.append(args)
+            return orig_query(*args, **kwargs)
+
+        self.stubs.Set(sqa_api, '_expired_reservations_query', fake_query)
+
+        for i in range(4):
+            quota.QUOTAS.reserve(self.context, expire=60, cores=1)
+        timeutils.advance_time_seconds(80)
+
+        self.assertEqual(quota.QUOTAS.expire_backlog(self.context), 4)
+        del queries[:]
+        self.assertEqual(quota.QUOTAS.expire(self.context), 4)
+        result = quota.QUOTAS.get_project_quotas(self.context,
+                                                 self.context.project_id)
+        self.assertEqual(result['cores']['reserved'], 0)
+        # The backlog count, two full batches and a look for more.
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(quota.QUOTAS.expire(self.context), 0)
+        self.assertEqual(quota.QUOTAS.expire_backlog(self.context), 0)
+
+    def test_reservation_expire_after_rollback(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        reservations = quota.QUOTAS.reserve(self.context, expire=60,
+                                            cores=2)
+        timeutils.advance_time_seconds(80)
+        orig_batches = sqa_api._reservation_expire_batches
+
+        def fake_batches(context, expire_batch, batch_size):
+            # The reservations are rolled back once read for expiry.
+            def racing_expire_batch(batch):
+                quota.QUOTAS.rollback(self.context, reservations)
+                return expire_batch(batch)
+
+            return orig_batches(context, racing_expire_batch, batch_size)
+
+        self.stubs.Set(sqa_api, '_reservation_expire_batches', fake_batches)
+
+        self.assertEqual(quota.QUOTAS.expire(self.context), 0)
+        result = quota.QUOTAS.get_project_quotas(self.context,
+                                                 self.context.project_id)
+        self.assertEqual(result['cores']['reserved'], 0)
+
 
 class FakeContext(object):
     def __init__(self, project_id, quota_class):
@@ -331,6 +382,12 @@ class FakeDriver(object):
     def expire(self, context):
         self.called.append(('expire', context))
 
+    def expire_backlog(self, context):
+        self.called.append(('expire_backlog', context))
+
+    def reconcile(self, context, resources):
+        self.called.append(('reconcile', context, resources))
+
 
 class BaseResourceTestCase(test.TestCase):
     def test_no_flag(self):
@@ -705,6 +762,26 @@ class QuotaEngineTestCase(test.TestCase):
                 ('expire', context),
                 ])
 
+    def test_expire_backlog(self):
+        context = FakeContext(None, None)
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.expire_backlog(context)
+
+        self.assertEqual(driver.called, [
+                ('expire_backlog', context),
+                ])
+
+    def test_reconcile(self):
+        context = FakeContext(None, None)
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.reconcile(context)
+
+        self.assertEqual(driver.called, [
+                ('reconcile', context, quota_obj._resources),
+                ])
+
     def test_resources(self):
         quota_obj = self._make_quota_obj(None)
 
@@ -1386,6 +1463,147 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
 
+class CounterQuotaDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(CounterQuotaDriverTestCase, self).setUp()
+        self.flags(quota_instances=2,
+                   quota_cores=4)
+        self.driver = quota.CounterQuotaDriver()
+        self.resources = quota.QUOTAS._resources
+        self.context = context.RequestContext('fake_user', 'fake_project')
+        self.admin_context = context.get_admin_context()
+
+    def _reserve(self, **deltas):
+        return self.driver.reserve(self.context, self.resources, deltas)
+
+    def _usages(self):
+        quotas = self.driver.get_project_quotas(self.context,
+                                                self.resources,
+                                                'fake_project')
+        return dict((res, (quota['in_use'], quota['reserved']))
+                    for res, quota in quotas.items()
+                    if res in ('instances', 'cores'))
+
+    def test_reserve_and_commit(self):
+        reservations = self._reserve(instances=1, cores=2)
+        self.assertEqual(len(reservations), 2)
+        self.assertEqual(self._usages(),
+                         {'instances': (0, 1), 'cores': (0, 2)})
+
+        self.driver.commit(self.context, reservations)
+        self.assertEqual(self._usages(),
+                         {'instances': (1, 0), 'cores': (2, 0)})
+
+        # Committing again changes nothing.
+        self.driver.commit(self.context, reservations)
+        self.assertEqual(self._usages(),
+                         {'instances': (1, 0), 'cores': (2, 0)})
+
+    def test_reserve_and_rollback(self):
+        reservations = self._reserve(instances=1, cores=2)
+        self.driver.rollback(self.context, reservations)
+        self.assertEqual(self._usages(),
+                         {'instances': (0, 0), 'cores': (0, 0)})
+
+    def test_negative_delta(self):
+        self.driver.commit(self.context, self._reserve(instances=2))
+        reservations = self._reserve(instances=-1)
+        self.assertEqual(self._usages()['instances'], (2, 0))
+        self.driver.commit(self.context, reservations)
+        self.assertEqual(self._usages()['instances'], (1, 0))
+
+    def test_over_quota(self):
+        self.driver.commit(self.context, self._reserve(cores=3))
+        try:
+            self._reserve(instances=1, cores=2)
+        except exception.OverQuota as exc:
+            self.assertEqual(exc.kwargs['overs'], ['cores'])
+            self.assertEqual(exc.kwargs['usages']['cores'],
+                             dict(in_use=3, reserved=0))
+        else:
+            self.fail('OverQuota not raised')
+
+        # Nothing stays reserved.
+        self.assertEqual(self._usages(),
+                         {'instances': (0, 0), 'cores': (3, 0)})
+
+    def test_shards(self):
+        self.flags(quota_usage_shards=3)
+        shards = iter([0, 1, 2, 1])
+        self.stubs.Set(sqa_api.random, 'randrange',
+                       lambda stop: shards.next())
+        for i in range(3):
+            self.driver.commit(self.context, self._reserve(cores=1))
+        self.assertRaises(exception.OverQuota, self._reserve, cores=2)
+        self.assertEqual(self._usages()['cores'], (3, 0))
+
+        rows = db.quota_usage_get_all_by_project(self.context,
+                                                 'fake_project')
+        self.assertEqual(rows['cores'], dict(in_use=3, reserved=0))
+
+    def test_expire(self):
+        self.flags(reservation_expire_batch_size=1)
+        reservations = self._reserve(instances=1)
+        self._reserve(cores=2)
+        self.assertEqual(self.driver.expire(self.admin_context), 0)
+        self.assertEqual(self._usages(),
+                         {'instances': (0, 1), 'cores': (0, 2)})
+
+        timeutils.set_time_override(timeutils.utcnow() +
+                datetime.timedelta(seconds=FLAGS.reservation_expire + 1))
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertEqual(self.driver.expire_backlog(self.admin_context), 2)
+        self.assertEqual(self.driver.expire(self.admin_context), 2)
+        self.assertEqual(self.driver.expire_backlog(self.admin_context), 0)
+        self.assertEqual(self._usages(),
+                         {'instances': (0, 0), 'cores': (0, 0)})
+
+        # The expired reservation can't be committed anymore.
+        self.driver.commit(self.context, reservations)
+        self.assertEqual(self._usages()['instances'], (0, 0))
+
+    def test_reconcile(self):
+        self.driver.commit(self.context, self._reserve(instances=2, cores=4))
+        db.instance_create(self.admin_context,
+                           dict(project_id='fake_project', vcpus=1,
+                                memory_mb=512))
+
+        self.driver.reconcile(self.admin_context, self.resources)
+        self.assertEqual(self._usages(),
+                         {'instances': (1, 0), 'cores': (1, 0)})
+
+    def test_reserve_failure_reserves_nothing(self):
+        def fake_add(*args, **kwargs):
+            raise exception.DBError()
+
+        self.stubs.Set(sqa_api, '_quota_counter_add', fake_add)
+        self.assertRaises(exception.DBError, self._reserve, instances=1)
+        self.assertEqual(self._usages(),
+                         {'instances': (0, 0), 'cores': (0, 0)})
+        self.assertEqual(sqa_api.model_query(self.admin_context,
+                                             sqa_models.Reservation).count(),
+                         0)
+
+    def test_reconcile_reserved(self):
+        reservations = self._reserve(instances=1, cores=2)
+        # Reserved counts leaked by reservations that were never saved.
+        rows = sqa_api.model_query(self.admin_context,
+                                   sqa_models.QuotaUsage).all()
+        for row in rows:
+            sqa_api._quota_counter_add(self.admin_context, row.id,
+                                       reserved=5)
+        self.assertEqual(self._usages(),
+                         {'instances': (0, 6), 'cores': (0, 7)})
+
+        self.driver.reconcile(self.admin_context, self.resources)
+        self.assertEqual(self._usages(),
+                         {'instances': (0, 1), 'cores': (0, 2)})
+
+        self.driver.commit(self.context, reservations)
+        self.assertEqual(self._usages(),
+                         {'instances': (1, 0), 'cores': (2, 0)})
+
+
 class FakeSession(object):
     def begin(self):
         return self
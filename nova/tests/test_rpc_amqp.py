@@ -0,0 +1,216 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the calls of the AMQP based rpc drivers."""
+
+import copy
+
+import eventlet
+from eventlet import queue
+
+from nova import context
+from nova import flags
+from nova.openstack.common.rpc import amqp
+from nova.openstack.common.rpc import common as rpc_common
+from nova import test
+
+FLAGS = flags.FLAGS
+
+# The queues of the fake broker, by name.
+_QUEUES = {}
+
+
+def _get_queue(name):
+    return _QUEUES.setdefault(name, queue.LightQueue())
+
+
+class FakeConnection(object):
+    """In memory stand-in for the AMQP connections, delivering the
+    messages sent to a queue to the consumer of the queue, serialized the
+    way the drivers send them."""
+
+    pool = None
+
+    def __init__(self, conf, server_params=None):
+        self.conf = conf
+        self.consumer = None
+        self.consumer_thread = None
+
+    def declare_direct_consumer(self, topic, callback):
+        self.consumer = (topic, callback)
+
+    def create_consumer(self, topic, proxy, fanout=False):
+        self.consumer = (topic, proxy)
+
+    def iterconsume(self, limit=None, timeout=None):
+        topic, callback = self.consumer
+        while True:
+            try:
+                msg = _get_queue(topic).get(timeout=timeout)
+            except queue.Empty:
+                raise rpc_common.Timeout()
+            callback(rpc_common.deserialize_msg(msg))
+            yield
+
+    def consume_in_thread(self):
+        def _consume():
+            for iteration in self.iterconsume():
+                pass
+
+        self.consumer_thread = eventlet.spawn(_consume)
+
+    def _send(self, topic, msg):
+        _get_queue(topic).put(
+                copy.deepcopy(rpc_common.serialize_msg(self.conf, msg)))
+
+    def topic_send(self, topic, msg):
+        self._send(topic, msg)
+
+    def direct_send(self, msg_id, msg):
+        self._send(msg_id, msg)
+
+    def reset(self):
+        pass
+
+    def close(self):
+        if self.consumer_thread:
+            self.consumer_thread.kill()
+            self.consumer_thread = None
+
+
+class FakeProxy(object):
+    def dispatch(self, ctxt, version, method, **kwargs):
+        return getattr(self, method)(ctxt, **kwargs)
+
+    def echo(self, ctxt, value, delay=0):
+        eventlet.sleep(delay)
+        return value
+
+    def stream(self, ctxt, values):
+        for value in values:
+            yield value
+
+
+class AmqpRpcTestCase(test.TestCase):
+    """Calls consuming their replies from a queue per call."""
+
+    single_reply_queue = False
+
+    def setUp(self):
+        super(AmqpRpcTestCase, self).setUp()
+        self.flags(amqp_rpc_single_reply_queue=self.single_reply_queue)
+        _QUEUES.clear()
+        self.context = context.get_admin_context()
+        self.pool = amqp.Pool(FLAGS, FakeConnection)
+        self.addCleanup(self.pool.empty)
+
+        conn = amqp.create_connection(FLAGS, True, self.pool)
+        conn.create_consumer('test_topic',
+                             amqp.ProxyCallback(FLAGS, FakeProxy(), self.pool))
+        conn.consume_in_thread()
+        self.addCleanup(conn.close)
+
+    def _call(self, method, timeout=None, **kwargs):
+        return amqp.call(FLAGS, self.context, 'test_topic',
+                         {'method': method, 'args': kwargs}, timeout,
+                         self.pool)
+
+    def _multicall(self, method, timeout=None, **kwargs):
+        return list(amqp.multicall(FLAGS, self.context, 'test_topic',
+                                   {'method': method, 'args': kwargs},
+                                   timeout, self.pool))
+
+    def test_call(self):
+        self.assertEqual(self._call('echo', value='foo'), 'foo')
+        self.assertEqual(self._call('echo', value=None), None)
+
+    def test_multicall(self):
+        self.assertEqual(self._multicall('stream', values=[1, 2, 3]),
+                         [1, 2, 3])
+        self.assertEqual(self._multicall('stream', values=[]), [])
+        self.assertEqual(self._call('stream', values=[1, 2]), 2)
+
+    def test_call_in_envelope(self):
+        self.flags(rpc_envelope_version=2, rpc_compression_threshold=1024)
+        self.assertEqual(self._call('echo', value='foo'), 'foo')
+        self.assertEqual(self._call('echo', value='x' * 2048), 'x' * 2048)
+        self.assertEqual(self._multicall('stream', values=[1, 2]), [1, 2])
+
+    def test_concurrent_calls_get_their_own_replies(self):
+        slow = eventlet.spawn(self._call, 'echo', value='slow', delay=0.1)
+        fast = eventlet.spawn(self._call, 'echo', value='fast')
+        self.assertEqual(fast.wait(), 'fast')
+        self.assertEqual(slow.wait(), 'slow')
+
+    def test_call_timeout(self):
+        self.assertRaises(rpc_common.Timeout, self._call, 'echo',
+                          timeout=0.05, value='late', delay=0.2)
+        # The late reply doesn't reach the next call.
+        eventlet.sleep(0.2)
+        self.assertEqual(self._call('echo', value='next'), 'next')
+
+    def test_queues(self):
+        self._call('echo', value='foo')
+        self._call('echo', value='bar')
+        self.assertEqual(len(_QUEUES), 3)
+        self.assertEqual(self.pool.reply_proxy, None)
+
+
+class AmqpRpcSingleReplyQueueTestCase(AmqpRpcTestCase):
+    """Calls consuming their replies from the reply queue of the process,
+    which the replies are routed from by _msg_id."""
+
+    single_reply_queue = True
+
+    def test_queues(self):
+        self._call('echo', value='foo')
+        self._call('echo', value='bar')
+        reply_proxy = self.pool.reply_proxy
+        self.assertEqual(sorted(_QUEUES),
+                         sorted(['test_topic', reply_proxy.get_reply_q()]))
+        self.assertEqual(reply_proxy._call_waiters, {})
+
+    def test_call_timeout_drops_waiter(self):
+        self.assertRaises(rpc_common.Timeout, self._call, 'echo',
+                          timeout=0.05, value='late', delay=0.1)
+        self.assertEqual(self.pool.reply_proxy._call_waiters, {})
+
+    def test_reply_routed_by_msg_id(self):
+        reply_proxy = amqp.get_reply_proxy(FLAGS, self.pool)
+        waiter = amqp.MulticallProxyWaiter(FLAGS, 'msg-1', 1, self.pool)
+        other = amqp.MulticallProxyWaiter(FLAGS, 'msg-2', 1, self.pool)
+        reply_proxy._process_data({'_msg_id': 'msg-2', 'result': 'two',
+                                   'failure': None, 'ending': True})
+        reply_proxy._process_data({'_msg_id': 'msg-1', 'result': 'one',
+                                   'failure': None})
+        reply_proxy._process_data({'_msg_id': 'msg-1', 'result': None,
+                                   'failure': None, 'ending': True})
+        self.assertEqual(list(waiter), ['one'])
+        self.assertEqual(list(other), ['two'])
+        self.assertEqual(reply_proxy._call_waiters, {})
+
+    def test_reply_to_unknown_msg_id(self):
+        logged = []
+
+        def fake_safe_log(log_func, msg, msg_data):
+            logged.append(msg_data)
+
+        self.stubs.Set(rpc_common, '_safe_log', fake_safe_log)
+        reply_proxy = amqp.get_reply_proxy(FLAGS, self.pool)
+        reply = {'_msg_id': 'unknown', 'result': 'secret', 'failure': None}
+        reply_proxy._process_data(reply)
+        self.assertEqual(logged, [reply])
@@ -0,0 +1,187 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the envelopes of the rpc messages."""
+
+import datetime
+import json
+
+from nova import context
+from nova import flags
+from nova.openstack.common import jsonutils
+from nova.openstack.common.rpc import common as rpc_common
+from nova.openstack.common import timeutils
+from nova import test
+
+try:
+    from nova.openstack.common.rpc import impl_zmq
+except ImportError:
+    impl_zmq = None
+
+FLAGS = flags.FLAGS
+
+MSG = {'method': 'echo',
+       'args': {'value': u'\xe9t\xe9', 'values': [1, 2.5, None, True]},
+       '_msg_id': 'fake-msg-id',
+       '_context_user_id': 'fake'}
+
+
+class SerializeMsgTestCase(test.TestCase):
+    def _round_trip(self, msg=MSG):
+        serialized = rpc_common.serialize_msg(FLAGS, msg)
+        self.assertTrue(rpc_common.is_enveloped(serialized))
+        self.assertEqual(rpc_common.deserialize_msg(serialized), msg)
+        return serialized
+
+    def _header(self, serialized):
+        return serialized.split('\n', 1)[0]
+
+    def test_version_1_is_not_enveloped(self):
+        self.flags(rpc_envelope_version=1)
+        serialized = rpc_common.serialize_msg(FLAGS, MSG)
+        self.assertEqual(serialized, MSG)
+        self.assertFalse(rpc_common.is_enveloped(serialized))
+
+    def test_json_round_trip(self):
+        self.flags(rpc_envelope_version=2, rpc_serializer='json')
+        serialized = self._round_trip()
+        self.assertEqual(self._header(serialized), '\x00rpc 2 json none')
+
+    @test.skip_unless(rpc_common.msgpack, 'msgpack is not installed')
+    def test_msgpack_round_trip(self):
+        self.flags(rpc_envelope_version=2, rpc_serializer='msgpack')
+        serialized = self._round_trip()
+        self.assertEqual(self._header(serialized), '\x00rpc 2 msgpack none')
+
+    def test_msgpack_encodes_with_to_primitive(self):
+        # Like msgpack, the fake only encodes the types it knows, and
+        # calls default for the others.
+        class FakeMsgpack(object):
+            @staticmethod
+            def packb(data, default=None):
+                return json.dumps(data, default=default)
+
+            @staticmethod
+            def unpackb(data, encoding=None):
+                return json.loads(data, encoding=encoding)
+
+        self.stubs.Set(rpc_common, 'msgpack', FakeMsgpack)
+        serializers = dict(rpc_common._SERIALIZERS)
+        serializers['msgpack'] = (rpc_common._msgpack_dumps,
+                                  rpc_common._msgpack_loads)
+        self.stubs.Set(rpc_common, '_SERIALIZERS', serializers)
+        self.flags(rpc_envelope_version=2, rpc_serializer='msgpack')
+
+        now = datetime.datetime(2012, 11, 5, 12, 30, 15)
+        msg = {'method': 'echo', 'args': {'value': now}}
+        serialized = rpc_common.serialize_msg(FLAGS, msg)
+        self.assertEqual(self._header(serialized), '\x00rpc 2 msgpack none')
+        self.assertEqual(rpc_common.deserialize_msg(serialized),
+                         {'method': 'echo',
+                          'args': {'value': timeutils.strtime(now)}})
+
+    def test_compressed_above_threshold(self):
+        self.flags(rpc_envelope_version=2, rpc_compression_threshold=1024)
+        msg = {'method': 'echo', 'args': {'value': 'x' * 2048}}
+        serialized = self._round_trip(msg)
+        self.assertEqual(self._header(serialized), '\x00rpc 2 json zlib')
+        self.assertTrue(len(serialized) < 1024)
+
+    def test_not_compressed_below_threshold(self):
+        self.flags(rpc_envelope_version=2, rpc_compression_threshold=1024)
+        msg = {'method': 'echo', 'args': {'value': 'x' * 512}}
+        serialized = self._round_trip(msg)
+        self.assertEqual(self._header(serialized), '\x00rpc 2 json none')
+
+        self.flags(rpc_compression_threshold=0)
+        msg = {'method': 'echo', 'args': {'value': 'x' * 2048}}
+        serialized = self._round_trip(msg)
+        self.assertEqual(self._header(serialized), '\x00rpc 2 json none')
+
+    def test_unsupported_envelope_version(self):
+        self.flags(rpc_envelope_version=3)
+        self.assertRaises(rpc_common.UnsupportedRpcEnvelopeVersion,
+                          rpc_common.serialize_msg, FLAGS, MSG)
+        self.assertRaises(rpc_common.UnsupportedRpcEnvelopeVersion,
+                          rpc_common.deserialize_msg,
+                          '\x00rpc 3 json none\n{}')
+
+    def test_unsupported_serializer(self):
+        self.flags(rpc_envelope_version=2, rpc_serializer='bogus')
+        self.assertRaises(rpc_common.UnsupportedRpcSerializer,
+                          rpc_common.serialize_msg, FLAGS, MSG)
+        self.assertRaises(rpc_common.UnsupportedRpcSerializer,
+                          rpc_common.deserialize_msg,
+                          '\x00rpc 2 bogus none\n{}')
+
+    def test_mixed_versions(self):
+        # Services still sending version 1 messages are read by the
+        # upgraded ones, which are read by the others once they upgrade,
+        # whatever their own rpc_envelope_version.
+        self.flags(rpc_envelope_version=1)
+        self.assertEqual(rpc_common.deserialize_msg(
+                rpc_common.serialize_msg(FLAGS, MSG)), MSG)
+
+        self.flags(rpc_envelope_version=2)
+        serialized = rpc_common.serialize_msg(FLAGS, MSG)
+        self.flags(rpc_envelope_version=1)
+        self.assertEqual(rpc_common.deserialize_msg(serialized), MSG)
+
+    def test_legacy_string_messages_are_not_enveloped(self):
+        legacy = jsonutils.dumps(MSG)
+        self.assertFalse(rpc_common.is_enveloped(legacy))
+        self.assertEqual(rpc_common.deserialize_msg(legacy), legacy)
+
+
+class ZmqMarshalTestCase(test.TestCase):
+    """The ZeroMQ driver marshals the context on its own, into the
+    message, bypassing the envelope."""
+
+    def setUp(self):
+        super(ZmqMarshalTestCase, self).setUp()
+        if impl_zmq:
+            self.stubs.Set(impl_zmq, 'CONF', FLAGS)
+        self.context = context.RequestContext('fake_user', 'fake_project',
+                                              auth_token='fake_token')
+        self.expected_context = jsonutils.loads(
+                jsonutils.dumps(self.context.to_dict()))
+
+    @test.skip_unless(impl_zmq, 'zmq is not installed')
+    def test_context_is_not_enveloped(self):
+        self.flags(rpc_envelope_version=2)
+        marshalled = impl_zmq.RpcContext.marshal(self.context)
+        self.assertFalse(rpc_common.is_enveloped(marshalled))
+        self.assertEqual(
+                impl_zmq.RpcContext.unmarshal(marshalled).to_dict(),
+                self.expected_context)
+
+    @test.skip_unless(impl_zmq, 'zmq is not installed')
+    def test_payload_read_by_all_versions(self):
+        for sender_version in (1, 2):
+            self.flags(rpc_envelope_version=sender_version)
+            payload = [impl_zmq.RpcContext.marshal(self.context), MSG]
+            serialized = impl_zmq._serialize(payload)
+            self.assertEqual(rpc_common.is_enveloped(serialized),
+                             sender_version == 2)
+
+            for receiver_version in (1, 2):
+                self.flags(rpc_envelope_version=receiver_version)
+                marshalled, msg = impl_zmq._deserialize(serialized)
+                self.assertEqual(msg, MSG)
+                self.assertEqual(
+                        impl_zmq.RpcContext.unmarshal(marshalled).to_dict(),
+                        self.expected_context)
@@ -30,6 +30,7 @@ from nova import flags
 from nova import manager
 from nova.openstack.common import cfg
 from nova import service
+from nova.servicegroup.drivers import db as db_driver
 from nova import test
 from nova import wsgi
 
@@ -55,6 +56,25 @@ class FakeManager(manager.Manager):
         return 'manager'
 
 
+class FakePeriodicManager(manager.Manager):
+    """Fake manager with periodic tasks for tests"""
+    def __init__(self, *args, **kwargs):
+        super(FakePeriodicManager, self).__init__(*args, **kwargs)
+        self.runs = []
+
+    @manager.periodic_task
+    def _every_tick(self, context):
+        self.runs.append('every_tick')
+
+    @manager.periodic_task(ticks_between_runs=2)
+    def _every_third_tick(self, context):
+        self.runs.append('every_third_tick')
+
+    @manager.periodic_task(spacing=600)
+    def _spaced(self, context):
+        self.runs.append('spaced')
+
+
 class ExtendedService(service.Service):
     def test_method(self):
         return 'service'
@@ -80,6 +100,181 @@ class ServiceManagerTestCase(test.TestCase):
         self.assertEqual(serv.test_method(), 'service')
 
 
+class PeriodicTasksTestCase(test.TestCase):
+    """Test cases for the periodic tasks of managers"""
+
+    def setUp(self):
+        super(PeriodicTasksTestCase, self).setUp()
+        self.flags(periodic_interval=60)
+        self.manager = FakePeriodicManager()
+        self.context = context.get_admin_context()
+
+    def test_periodic_task_spacing(self):
+        self.assertEqual(self.manager.periodic_task_spacing('_every_tick'),
+                         (60, 0))
+        self.assertEqual(
+                self.manager.periodic_task_spacing('_every_third_tick'),
+                (180, 120))
+        self.assertEqual(self.manager.periodic_task_spacing('_spaced'),
+                         (600, 0))
+        self.assertEqual(
+                self.manager.periodic_task_spacing('_every_tick', 10),
+                (10, 0))
+        self.assertEqual(
+                self.manager._get_periodic_spacing(self.manager._every_tick),
+                0)
+
+    def test_periodic_task_spacing_from_flag(self):
+        self.stubs.Set(self.manager._spaced.im_func, '_periodic_spacing',
+                       'periodic_interval')
+        self.assertEqual(self.manager.periodic_task_spacing('_spaced'),
+                         (60, 0))
+        self.flags(periodic_interval=300)
+        self.assertEqual(self.manager.periodic_task_spacing('_spaced'),
+                         (300, 0))
+
+        # A spacing of 0 runs the task on every tick.
+        self.flags(periodic_interval=0)
+        for tick in xrange(2):
+            self.manager.periodic_tasks(self.context)
+        self.assertEqual(self.manager.runs.count('spaced'), 2)
+
+    def test_periodic_tasks_honours_ticks_and_spacing(self):
+        for tick in xrange(3):
+            self.manager.periodic_tasks(self.context)
+        self.assertEqual(sorted(self.manager.runs),
+                         ['every_third_tick', 'every_tick', 'every_tick',
+                          'every_tick', 'spaced'])
+
+    def test_run_periodic_task_stats(self):
+        def fake_task(context):
+            raise test.TestingException('boom')
+
+        self.manager.run_periodic_task(self.context, '_every_tick')
+        self.stubs.Set(self.manager, '_every_tick', fake_task)
+        self.manager.run_periodic_task(self.context, '_every_tick')
+
+        stats = self.manager.periodic_task_stats(self.context)
+        self.assertEqual(set(stats), set(['_every_tick', '_every_third_tick',
+                                          '_spaced']))
+        self.assertEqual(stats['_every_tick']['runs'], 2)
+        self.assertEqual(stats['_every_tick']['failures'], 1)
+        self.assertEqual(stats['_every_tick']['last_error'], 'boom')
+        self.assertEqual(stats['_every_tick']['last_lag'], 0)
+        self.assertFalse(stats['_every_tick']['running'])
+        self.assertTrue(stats['_every_tick']['last_duration'] >= 0)
+        self.assertEqual(stats['_spaced']['runs'], 0)
+
+        self.assertRaises(test.TestingException,
+                          self.manager.run_periodic_task, self.context,
+                          '_every_tick', raise_on_error=True)
+
+    def test_run_periodic_task_lag_from_interval(self):
+        times = [1000, 1001, 1012, 1013]
+
+        class FakeTime(object):
+            @staticmethod
+            def time():
+                return times.pop(0)
+
+        self.stubs.Set(manager, 'time', FakeTime)
+
+        # Scheduled every 10 seconds rather than every periodic_interval,
+        # the second run is 2 seconds late.
+        for run in xrange(2):
+            self.manager.run_periodic_task(self.context, '_every_tick',
+                                           periodic_interval=10)
+        stats = self.manager.periodic_task_stats(self.context)
+        self.assertEqual(stats['_every_tick']['last_lag'], 2)
+
+    def test_service_run_periodic_task_passes_interval(self):
+        serv = service.Service('test', 'test', 'test',
+                               'nova.tests.test_service.FakePeriodicManager',
+                               periodic_interval=10)
+        self.mox.StubOutWithMock(serv.manager, 'run_periodic_task')
+        serv.manager.run_periodic_task(mox.IgnoreArg(), '_every_tick',
+                                       periodic_interval=10)
+        self.mox.ReplayAll()
+
+        serv.run_periodic_task('_every_tick')
+
+    def test_run_periodic_task_skips_overlapping_runs(self):
+        def fake_task(context):
+            self.manager.run_periodic_task(context, '_every_tick')
+            self.manager.runs.append('outer')
+
+        self.stubs.Set(self.manager, '_every_tick', fake_task)
+        self.manager.run_periodic_task(self.context, '_every_tick')
+
+        self.assertEqual(self.manager.runs, ['outer'])
+        stats = self.manager.periodic_task_stats(self.context)
+        self.assertEqual(stats['_every_tick']['runs'], 1)
+        self.assertEqual(stats['_every_tick']['overlaps'], 1)
+
+    def test_service_runs_tasks_independently(self):
+        self.mox.StubOutWithMock(service.utils, 'FixedIntervalLoopingCall')
+        serv = service.Service('test', 'test', 'test',
+                               'nova.tests.test_service.FakePeriodicManager',
+                               periodic_interval=60, periodic_fuzzy_delay=0)
+        for task_name, interval, initial_delay in (
+                ('_every_tick', 60, 0),
+                ('_every_third_tick', 180, 120),
+                ('_spaced', 600, 0)):
+            timer = self.mox.CreateMockAnything()
+            service.utils.FixedIntervalLoopingCall(
+                    serv.run_periodic_task, task_name).InAnyOrder().AndReturn(
+                            timer)
+            timer.start(interval=interval, initial_delay=initial_delay)
+        self.mox.ReplayAll()
+
+        serv.start()
+        self.assertEqual(len(serv.timers), 3)
+
+
+class CapabilityUpdatesTestCase(test.TestCase):
+    """Test cases for the capability updates sent to the schedulers"""
+
+    def setUp(self):
+        super(CapabilityUpdatesTestCase, self).setUp()
+        self.manager = manager.SchedulerDependentManager('fake_host',
+                service_name='compute')
+        self.context = context.get_admin_context()
+        self.updates = []
+
+        def fake_update(context, service_name, host, capabilities, **kwargs):
+            self.updates.append((dict(capabilities), kwargs))
+
+        self.stubs.Set(self.manager.scheduler_rpcapi,
+                       'update_service_capabilities', fake_update)
+
+    def test_sends_deltas_between_full_updates(self):
+        self.flags(capabilities_full_update_interval=600)
+        capabilities = {'free_ram_mb': 512, 'vcpus': 2, 'hypervisor_type': 'x'}
+        self.manager.update_service_capabilities(capabilities)
+        self.manager._publish_service_capabilities(self.context)
+        capabilities['free_ram_mb'] = 256
+        del capabilities['hypervisor_type']
+        self.manager._publish_service_capabilities(self.context)
+        # Nothing changed, nothing to send.
+        self.manager._publish_service_capabilities(self.context)
+        self.manager.publish_service_capabilities(self.context)
+
+        self.assertEqual(self.updates, [
+                ({'free_ram_mb': 512, 'vcpus': 2, 'hypervisor_type': 'x'},
+                 {'seq': 1}),
+                ({'free_ram_mb': 256},
+                 {'seq': 2, 'removed': ['hypervisor_type'], 'full': False}),
+                ({'free_ram_mb': 256, 'vcpus': 2}, {'seq': 3})])
+
+    def test_full_updates_without_interval(self):
+        self.flags(capabilities_full_update_interval=0)
+        self.manager.update_service_capabilities({'free_ram_mb': 512})
+        self.manager._publish_service_capabilities(self.context)
+        self.manager._publish_service_capabilities(self.context)
+        self.assertEqual(self.updates, [({'free_ram_mb': 512}, {}),
+                                        ({'free_ram_mb': 512}, {})])
+
+
 class ServiceFlagsTestCase(test.TestCase):
     def test_service_enabled_on_create_based_on_flag(self):
         self.flags(enable_new_services=True)
@@ -110,6 +305,7 @@ class ServiceTestCase(test.TestCase):
     def setUp(self):
         super(ServiceTestCase, self).setUp()
         self.mox.StubOutWithMock(service, 'db')
+        self.stubs.Set(db_driver, 'db', service.db)
 
     def test_create(self):
         host = 'foo'
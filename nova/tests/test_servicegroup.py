@@ -0,0 +1,132 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the servicegroup API and drivers."""
+
+import datetime
+
+from nova import context
+from nova import db
+from nova.openstack.common import timeutils
+from nova import servicegroup
+from nova.servicegroup import api
+from nova import test
+from nova import utils
+
+
+class FakeService(object):
+    def __init__(self, host, topic):
+        self.host = host
+        self.topic = topic
+
+
+class ServiceGroupAPITestCase(test.TestCase):
+    def setUp(self):
+        super(ServiceGroupAPITestCase, self).setUp()
+        self.stubs.Set(api, '_drivers', {})
+
+    def test_driver_is_shared(self):
+        self.flags(servicegroup_driver='mc')
+        self.assertTrue(servicegroup.API()._driver is
+                        servicegroup.API()._driver)
+
+    def test_unknown_driver(self):
+        self.flags(servicegroup_driver='foo')
+        self.assertRaises(TypeError, servicegroup.API)
+
+
+class DbDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(DbDriverTestCase, self).setUp()
+        self.stubs.Set(api, '_drivers', {})
+        self.flags(servicegroup_driver='db', service_down_time=60)
+        self.now = datetime.datetime(2012, 11, 1, 12, 0, 0)
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+        self.context = context.get_admin_context()
+        self.servicegroup_api = servicegroup.API()
+
+    def _service(self, host, updated_at):
+        return db.service_create(self.context,
+                                 {'host': host,
+                                  'binary': 'nova-compute',
+                                  'topic': 'compute',
+                                  'report_count': 0,
+                                  'availability_zone': 'nova',
+                                  'updated_at': updated_at})
+
+    def test_report_state(self):
+        service_ref = self._service('host1', None)
+        service = FakeService('host1', 'compute')
+        service.service_id = service_ref['id']
+        self.servicegroup_api.report_state(service)
+        service_ref = db.service_get(self.context, service.service_id)
+        self.assertEqual(service_ref['report_count'], 1)
+
+    def test_get_up_services(self):
+        up = self._service('host1', self.now - datetime.timedelta(seconds=10))
+        down = self._service('host2',
+                             self.now - datetime.timedelta(seconds=100))
+        self.assertTrue(self.servicegroup_api.service_is_up(up))
+        self.assertFalse(self.servicegroup_api.service_is_up(down))
+        self.assertTrue(utils.service_is_up(up))
+        services = db.service_get_all_by_topic(self.context, 'compute')
+        self.assertEqual([s['host'] for s in
+                          self.servicegroup_api.get_up_services(services)],
+                         ['host1'])
+
+
+class MemcachedDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(MemcachedDriverTestCase, self).setUp()
+        self.stubs.Set(api, '_drivers', {})
+        self.flags(servicegroup_driver='mc', service_down_time=60,
+                   memcached_servers=None)
+        self.now = datetime.datetime(2012, 11, 1, 12, 0, 0)
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+        self.servicegroup_api = servicegroup.API()
+        self.services = [{'host': 'host1', 'topic': 'compute'},
+                         {'host': 'host2', 'topic': 'compute'},
+                         {'host': 'host1', 'topic': 'network'}]
+
+    def test_report_state_does_not_touch_the_db(self):
+        self.mox.StubOutWithMock(db, 'service_get')
+        self.mox.StubOutWithMock(db, 'service_update')
+        self.mox.ReplayAll()
+        self.servicegroup_api.report_state(FakeService('host1', 'compute'))
+        self.assertTrue(self.servicegroup_api.service_is_up(self.services[0]))
+        self.assertFalse(self.servicegroup_api.service_is_up(self.services[2]))
+
+    def test_heartbeats_expire(self):
+        self.servicegroup_api.report_state(FakeService('host1', 'compute'))
+        timeutils.advance_time_seconds(30)
+        self.servicegroup_api.report_state(FakeService('host2', 'compute'))
+        self.assertEqual(self.servicegroup_api.get_up_services(self.services),
+                         self.services[:2])
+
+        timeutils.advance_time_seconds(40)
+        self.assertEqual(self.servicegroup_api.get_up_services(self.services),
+                         self.services[1:2])
+        self.assertFalse(utils.service_is_up(self.services[0]))
+
+    def test_report_state_failure(self):
+        service = FakeService('host1', 'compute')
+        driver = self.servicegroup_api._driver
+        self.stubs.Set(driver.mc, 'set', lambda *args, **kwargs: False)
+        self.servicegroup_api.report_state(service)
+        self.assertTrue(service.model_disconnected)
@@ -774,3 +774,26 @@ class EnsureTree(test.TestCase):
             testdir = '%s/foo/bar/baz' % (tmpdir,)
             utils.ensure_tree(testdir)
             self.assertTrue(os.path.isdir(testdir))
+
+
+class FixedIntervalLoopingCallTestCase(test.TestCase):
+    def test_interval_includes_call_time(self):
+        calls = []
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+
+        def f():
+            calls.append(1)
+            if len(calls) == 2:
+                raise utils.LoopingCallDone(False)
+
+        self.stubs.Set(utils.greenthread, 'sleep', fake_sleep)
+        self.stubs.Set(utils.greenthread, 'spawn',
+                       lambda fn: fn())
+        timer = utils.FixedIntervalLoopingCall(f)
+        self.assertFalse(timer.start(interval=10).wait())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(sleeps), 1)
+        self.assertTrue(0 < sleeps[0] <= 10)
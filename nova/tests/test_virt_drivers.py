@@ -20,12 +20,14 @@ import sys
 import traceback
 
 from nova.compute.manager import ComputeManager
+from nova.compute import power_state
 from nova import exception
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova import test
 from nova.tests.image import fake as fake_image
 from nova.tests import utils as test_utils
+from nova.virt import event as virtevent
 
 LOG = logging.getLogger(__name__)
 
@@ -370,6 +372,22 @@ class _VirtDriverTestCase(_FakeDriverBackendTestCase):
         self.assertIn('num_cpu', info)
         self.assertIn('cpu_time', info)
 
+    @catch_notimplementederror
+    def test_list_instance_power_states(self):
+        instance_ref, network_info = self._get_running_instance()
+        states = self.connection.list_instance_power_states()
+        self.assertEqual(states[instance_ref['name']],
+                         self.connection.get_info(instance_ref)['state'])
+        self.assertEqual(states[instance_ref['name']], power_state.RUNNING)
+
+    def test_emit_event(self):
+        events = []
+        self.connection.register_event_listener(events.append)
+        event = virtevent.LifecycleEvent('fake-uuid',
+                                         virtevent.EVENT_LIFECYCLE_STARTED)
+        self.connection.emit_event(event)
+        self.assertEqual(events, [event])
+
     @catch_notimplementederror
     def test_get_info_for_unknown_instance(self):
         self.assertRaises(exception.NotFound,
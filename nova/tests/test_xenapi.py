@@ -41,6 +41,7 @@ from nova.tests import fake_network
 from nova.tests import fake_utils
 import nova.tests.image.fake as fake_image
 from nova.tests.xenapi import stubs
+from nova.virt import event as virtevent
 from nova.virt.xenapi import agent
 from nova.virt.xenapi import driver as xenapi_conn
 from nova.virt.xenapi import fake as xenapi_fake
@@ -413,6 +414,49 @@ class XenAPIVMTestCase(stubs.XenAPITestBase):
             name_label = vdi_rec["name_label"]
             self.assert_(not name_label.endswith('snapshot'))
 
+    def test_list_instance_power_states(self):
+        self.assertEquals(self.conn.list_instance_power_states(), {})
+        instance = self._create_instance()
+        self.assertEquals(self.conn.list_instance_power_states(),
+                          {instance['name']: power_state.RUNNING})
+
+    def test_lifecycle_events(self):
+
+        def vm_event(vm_ref, operation, state, control_domain=False):
+            snapshot = {'power_state': state,
+                        'is_a_template': False,
+                        'is_control_domain': control_domain,
+                        'other_config': {'nova_uuid': vm_ref + '-uuid'}}
+            return {'class': 'vm', 'ref': vm_ref, 'operation': operation,
+                    'snapshot': snapshot}
+
+        def transitions(*events):
+            return [(event.uuid, event.transition) for event in
+                    self.conn._get_lifecycle_events(list(events))]
+
+        self.assertEqual(transitions(vm_event('vm1', 'add', 'Halted'),
+                                     vm_event('dom0', 'add', 'Running',
+                                              control_domain=True)),
+                         [])
+        self.assertEqual(transitions(vm_event('vm1', 'mod', 'Running'),
+                                     vm_event('vm1', 'mod', 'Running'),
+                                     vm_event('vm1', 'mod', 'Paused'),
+                                     vm_event('vm1', 'mod', 'Running'),
+                                     vm_event('dom0', 'mod', 'Halted',
+                                              control_domain=True),
+                                     vm_event('vm1', 'mod', 'Halted')),
+                         [('vm1-uuid', virtevent.EVENT_LIFECYCLE_STARTED),
+                          ('vm1-uuid', virtevent.EVENT_LIFECYCLE_PAUSED),
+                          ('vm1-uuid', virtevent.EVENT_LIFECYCLE_RESUMED),
+                          ('vm1-uuid', virtevent.EVENT_LIFECYCLE_STOPPED)])
+        self.assertEqual(transitions(vm_event('vm1', 'del', 'Halted')), [])
+        self.assertEqual(self.conn._vm_power_states, {})
+
+    def test_lifecycle_events_unsupported(self):
+        # The fake XenAPI has no event.from
+        self.conn._lifecycle_event_thread()
+        self.assertFalse(self.conn.lifecycle_events_enabled())
+
     def create_vm_record(self, conn, os_type, name):
         instances = conn.list_instances()
         self.assertEquals(instances, [name])
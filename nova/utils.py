@@ -567,6 +567,46 @@ class LoopingCall(object):
         return self.done.wait()
 
 
+class FixedIntervalLoopingCall(LoopingCall):
+    """A LoopingCall which starts f every interval seconds, rather than
+    waiting interval seconds between the end of a call and the next one.
+
+    A call which takes longer than interval delays the next one, calls
+    never overlap.
+    """
+
+    def start(self, interval, initial_delay=None):
+        self._running = True
+        done = event.Event()
+
+        def _inner():
+            if initial_delay:
+                greenthread.sleep(initial_delay)
+
+            try:
+                while self._running:
+                    start = time.time()
+                    self.f(*self.args, **self.kw)
+                    if not self._running:
+                        break
+                    delay = interval - (time.time() - start)
+                    greenthread.sleep(max(delay, 0))
+            except LoopingCallDone, e:
+                self.stop()
+                done.send(e.retvalue)
+            except Exception:
+                LOG.exception(_('in fixed interval looping call'))
+                done.send_exception(*sys.exc_info())
+                return
+            else:
+                done.send(True)
+
+        self.done = done
+
+        greenthread.spawn(_inner)
+        return self.done
+
+
 def xhtml_escape(value):
     """Escapes a string so it is valid within XML or XHTML.
 
@@ -1193,10 +1233,9 @@ def temporary_mutation(obj, **kwargs):
 
 def service_is_up(service):
     """Check whether a service is up based on last heartbeat."""
-    last_heartbeat = service['updated_at'] or service['created_at']
-    # Timestamps in DB are UTC.
-    elapsed = total_seconds(timeutils.utcnow() - last_heartbeat)
-    return abs(elapsed) <= FLAGS.service_down_time
+    # NOTE: imported here, as the servicegroup drivers use this module.
+    from nova import servicegroup
+    return servicegroup.API().service_is_up(service)
 
 
 def generate_mac_address():
@@ -148,6 +148,54 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def list_instance_power_states(self):
+        """
+        Return the power states of all the instances known to the
+        virtualization layer, as a dict of power_state codes keyed by
+        instance name.
+
+        Drivers that can get all the states at once should implement
+        this, so that syncing the power states doesn't take a get_info()
+        call per instance.
+        """
+        raise NotImplementedError()
+
+    # The callback given to register_event_listener()
+    _compute_event_callback = None
+
+    def register_event_listener(self, callback):
+        """Register a callback to receive the events of the driver.
+
+        The callback is called with a nova.virt.event.Event each time the
+        hypervisor tells the driver about a change to one of its instances.
+        It is called from a greenthread of the driver, so it must not
+        block for long.
+        """
+        self._compute_event_callback = callback
+
+    def emit_event(self, event):
+        """Dispatch an event to the registered callback, if any."""
+        if not self._compute_event_callback:
+            LOG.debug(_("Discarding event %s"), event)
+            return
+
+        try:
+            LOG.debug(_("Emitting event %s"), event)
+            self._compute_event_callback(event)
+        except Exception:
+            LOG.exception(_("Exception dispatching event %s"), event)
+
+    def lifecycle_events_enabled(self):
+        """
+        Return whether the driver currently emits lifecycle events for
+        its instances as they start, stop, pause and resume.
+
+        While it does, the compute manager can rely on the events to keep
+        the power states of the instances up to date, and only needs to
+        poll the hypervisor once in a while as a safety net.
+        """
+        return False
+
     def spawn(self, context, instance, image_meta, injected_files,
               admin_password, network_info=None, block_device_info=None):
         """
@@ -0,0 +1,76 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Events emitted by the virt drivers.
+
+A driver that is told about changes to its instances by the hypervisor,
+rather than having to poll for them, passes them on to the callback given
+to ComputeDriver.register_event_listener() as one of these events.
+"""
+
+import time
+
+EVENT_LIFECYCLE_STARTED = 0
+EVENT_LIFECYCLE_STOPPED = 1
+EVENT_LIFECYCLE_PAUSED = 2
+EVENT_LIFECYCLE_RESUMED = 3
+
+NAMES = {
+    EVENT_LIFECYCLE_STARTED: _('Started'),
+    EVENT_LIFECYCLE_STOPPED: _('Stopped'),
+    EVENT_LIFECYCLE_PAUSED: _('Paused'),
+    EVENT_LIFECYCLE_RESUMED: _('Resumed'),
+}
+
+
+class Event(object):
+    """Base class for the events emitted by a hypervisor."""
+
+    def __init__(self, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.timestamp)
+
+
+class InstanceEvent(Event):
+    """An event about an instance, identified by its uuid."""
+
+    def __init__(self, uuid, timestamp=None):
+        super(InstanceEvent, self).__init__(timestamp)
+        self.uuid = uuid
+
+    def __repr__(self):
+        return '<%s: %s, %s>' % (self.__class__.__name__, self.timestamp,
+                                 self.uuid)
+
+
+class LifecycleEvent(InstanceEvent):
+    """An instance started, stopped, paused or resumed running."""
+
+    def __init__(self, uuid, transition, timestamp=None):
+        super(LifecycleEvent, self).__init__(uuid, timestamp)
+        self.transition = transition
+
+    def __repr__(self):
+        return '<%s: %s, %s => %s>' % (self.__class__.__name__,
+                                       self.timestamp, self.uuid,
+                                       NAMES.get(self.transition,
+                                                 self.transition))
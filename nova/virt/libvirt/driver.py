@@ -50,7 +50,9 @@ import sys
 import tempfile
 import uuid
 
+from eventlet import greenio
 from eventlet import greenthread
+from eventlet import patcher
 from eventlet import tpool
 from lxml import etree
 from xml.dom import minidom
@@ -74,6 +76,7 @@ from nova import utils
 from nova.virt import configdrive
 from nova.virt.disk import api as disk
 from nova.virt import driver
+from nova.virt import event as virtevent
 from nova.virt import firewall
 from nova.virt.libvirt import config
 from nova.virt.libvirt import firewall as libvirt_firewall
@@ -82,6 +85,9 @@ from nova.virt.libvirt import imagecache
 from nova.virt.libvirt import utils as libvirt_utils
 from nova.virt import netutils
 
+native_threading = patcher.original("threading")
+native_Queue = patcher.original("Queue")
+
 libvirt = None
 
 LOG = logging.getLogger(__name__)
@@ -268,6 +274,8 @@ class LibvirtDriver(driver.ComputeDriver):
         self._host_state = None
         self._initiator = None
         self._wrapped_conn = None
+        self._event_queue = None
+        self._lifecycle_events_registered = False
         self.read_only = read_only
         self.firewall_driver = firewall.load_driver(
             default=DEFAULT_FIREWALL_DRIVER,
@@ -326,7 +334,142 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return True
 
+    def _native_thread(self):
+        """Receives async events coming in from libvirtd.
+
+        This is a native thread which runs the default libvirt event loop
+        implementation.  It must not touch any eventlet state: the events
+        it receives are handed over to _dispatch_thread() through
+        _queue_event().
+        """
+        while True:
+            libvirt.virEventRunDefaultImpl()
+
+    def _dispatch_thread(self):
+        """Dispatches async events coming in from libvirtd.
+
+        This is a greenthread which waits for the events queued by the
+        native thread and emits them to the compute manager.
+        """
+        while True:
+            self._dispatch_events()
+
+    @staticmethod
+    def _event_lifecycle_callback(conn, dom, event, detail, opaque):
+        """Receives lifecycle events from libvirt.
+
+        NB: this method is executing in a native thread, not
+        an eventlet coroutine. It can only invoke other libvirt
+        APIs, or use self._queue_event(). Any use of logging APIs
+        in particular is forbidden.
+        """
+        self = opaque
+
+        uuid = dom.UUIDString()
+        transition = None
+        if event == libvirt.VIR_DOMAIN_EVENT_STOPPED:
+            transition = virtevent.EVENT_LIFECYCLE_STOPPED
+        elif event == libvirt.VIR_DOMAIN_EVENT_STARTED:
+            transition = virtevent.EVENT_LIFECYCLE_STARTED
+        elif event == libvirt.VIR_DOMAIN_EVENT_SUSPENDED:
+            transition = virtevent.EVENT_LIFECYCLE_PAUSED
+        elif event == libvirt.VIR_DOMAIN_EVENT_RESUMED:
+            transition = virtevent.EVENT_LIFECYCLE_RESUMED
+
+        if transition is not None:
+            self._queue_event(virtevent.LifecycleEvent(uuid, transition))
+
+    def _queue_event(self, event):
+        """Puts an event on the queue for dispatch.
+
+        This method is called by the native event thread to put events
+        on the queue for later dispatch by the green thread.
+        """
+        if self._event_queue is None:
+            return
+
+        # Queue the event...
+        self._event_queue.put(event)
+
+        # ...then wakeup the green thread to dispatch it
+        self._event_notify_send.write(' ')
+        self._event_notify_send.flush()
+
+    def _dispatch_events(self):
+        """Wait for & dispatch events from native thread
+
+        Blocks until native thread indicates some events
+        are ready. Then dispatches all queued events.
+        """
+
+        # Wait to be notified that there are some
+        # events pending
+        try:
+            self._event_notify_recv.read(1)
+        except ValueError:
+            return  # will be raised when pipe is closed
+
+        # Process as many events as possible without
+        # blocking
+        while not self._event_queue.empty():
+            try:
+                event = self._event_queue.get(block=False)
+                self.emit_event(event)
+            except native_Queue.Empty:
+                pass
+
+    def _init_events_pipe(self):
+        """Create the queue of events and the self-pipe the native thread
+        wakes up the dispatch greenthread with, as eventlet's tpool does.
+        """
+        self._event_queue = native_Queue.Queue()
+        rpipe, wpipe = os.pipe()
+        self._event_notify_send = greenio.GreenPipe(wpipe, 'wb', 0)
+        self._event_notify_recv = greenio.GreenPipe(rpipe, 'rb', 0)
+
+    def _init_events(self):
+        """Initializes the libvirt events subsystem.
+
+        This requires running a native thread to provide the
+        libvirt event loop integration. This forwards events
+        to a green thread which does the actual dispatching.
+        """
+        if not hasattr(libvirt, 'virEventRegisterDefaultImpl'):
+            LOG.debug(_("The libvirt bindings have no event loop support, "
+                        "lifecycle events are disabled"))
+            return
+
+        self._init_events_pipe()
+
+        LOG.debug(_("Starting native event thread"))
+        libvirt.virEventRegisterDefaultImpl()
+        event_thread = native_threading.Thread(target=self._native_thread)
+        event_thread.setDaemon(True)
+        event_thread.start()
+
+        LOG.debug(_("Starting green dispatch thread"))
+        greenthread.spawn(self._dispatch_thread)
+
+    def _register_lifecycle_events(self, conn):
+        """Subscribe to the lifecycle events of the domains of conn."""
+        try:
+            conn.domainEventRegisterAny(None,
+                                        libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                                        self._event_lifecycle_callback,
+                                        self)
+            self._lifecycle_events_registered = True
+        except Exception:
+            LOG.warn(_("URI %s does not support events"), self.uri)
+            self._lifecycle_events_registered = False
+
+    def lifecycle_events_enabled(self):
+        return self._lifecycle_events_registered
+
     def init_host(self, host):
+        # NOTE: the event loop has to be registered before the connection
+        #       to libvirt is opened for it to deliver events.
+        self._init_events()
+
         if not self.has_min_version(MIN_LIBVIRT_VERSION):
             major = MIN_LIBVIRT_VERSION[0]
             minor = MIN_LIBVIRT_VERSION[1]
@@ -345,6 +488,8 @@ class LibvirtDriver(driver.ComputeDriver):
                 self._wrapped_conn = tpool.proxy_call(
                     (libvirt.virDomain, libvirt.virConnect),
                     self._connect, self.uri, self.read_only)
+            if self._event_queue is not None:
+                self._register_lifecycle_events(self._wrapped_conn)
 
         return self._wrapped_conn
 
@@ -431,6 +576,22 @@ class LibvirtDriver(driver.ComputeDriver):
                 pass
         return names
 
+    def list_instance_power_states(self):
+        """Efficient override of base list_instance_power_states method."""
+        # NOTE: listAllDomains() is only available from libvirt 0.9.13,
+        #       without it this would cost as much as get_info() calls.
+        if not hasattr(self._conn, 'listAllDomains'):
+            raise NotImplementedError()
+
+        states = {}
+        for domain in self._conn.listAllDomains(0):
+            try:
+                states[domain.name()] = LIBVIRT_POWER_STATE[domain.info()[0]]
+            except libvirt.libvirtError:
+                # Instance was deleted while listing... ignore it
+                pass
+        return states
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         for (network, mapping) in network_info:
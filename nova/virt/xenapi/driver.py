@@ -43,6 +43,7 @@ import time
 import urlparse
 import xmlrpclib
 
+from eventlet import greenthread
 from eventlet import queue
 from eventlet import timeout
 
@@ -53,6 +54,7 @@ from nova import flags
 from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.virt import driver
+from nova.virt import event as virtevent
 from nova.virt.xenapi import host
 from nova.virt.xenapi import pool
 from nova.virt.xenapi import pool_states
@@ -123,6 +125,10 @@ xenapi_opts = [
     cfg.IntOpt('xenapi_login_timeout',
                default=10,
                help='Timeout in seconds for XenAPI login.'),
+    cfg.FloatOpt('xenapi_event_timeout',
+                 default=30.0,
+                 help='Timeout in seconds of each event.from call waiting '
+                      'for the lifecycle events of the VMs.'),
     ]
 
 FLAGS = flags.FLAGS
@@ -152,6 +158,8 @@ class XenAPIDriver(driver.ComputeDriver):
         self._initiator = None
         self._hypervisor_hostname = None
         self._pool = pool.ResourcePool(self._session)
+        self._lifecycle_events = False
+        self._vm_power_states = {}
 
     @property
     def host_state(self):
@@ -168,10 +176,93 @@ class XenAPIDriver(driver.ComputeDriver):
         except Exception:
             LOG.exception(_('Failure while cleaning up attached VDIs'))
 
+        greenthread.spawn(self._lifecycle_event_thread)
+
+    def _lifecycle_event_thread(self):
+        """Emit the lifecycle events of the VMs, as told by event.from.
+
+        event.from is only available from XenServer 6.0, if the first call
+        fails the events are disabled and the power states are polled.
+        """
+        token = ''
+        while True:
+            try:
+                result = self._session.wait_for_events(
+                        ['vm'], token, FLAGS.xenapi_event_timeout)
+            except Exception:
+                self._lifecycle_events = False
+                if not token:
+                    LOG.warn(_('Unable to wait for XenAPI events, '
+                               'lifecycle events are disabled'),
+                             exc_info=True)
+                    return
+                LOG.exception(_('Error waiting for XenAPI events'))
+                # Start over, as events may have been missed.
+                token = ''
+                self._vm_power_states = {}
+                greenthread.sleep(FLAGS.xenapi_event_timeout)
+                continue
+
+            token = result['token']
+            for event in self._get_lifecycle_events(result['events']):
+                self.emit_event(event)
+            self._lifecycle_events = True
+
+    def _get_lifecycle_events(self, events):
+        """Return the lifecycle events of the VMs from the events returned
+        by event.from.
+
+        The power state of each VM is remembered so that only the changes
+        are emitted: the first time a VM is seen, which for all VMs is the
+        first call with an empty token, it has no event.
+        """
+        lifecycle_events = []
+        for event in events:
+            if event['class'].lower() != 'vm':
+                continue
+            vm_ref = event['ref']
+            if event['operation'] == 'del':
+                self._vm_power_states.pop(vm_ref, None)
+                continue
+
+            vm_rec = event['snapshot']
+            instance_uuid = vm_rec['other_config'].get('nova_uuid')
+            if (vm_rec['is_a_template'] or vm_rec['is_control_domain'] or
+                    not instance_uuid):
+                continue
+
+            new_state = vm_rec['power_state']
+            old_state = self._vm_power_states.get(vm_ref)
+            self._vm_power_states[vm_ref] = new_state
+            if old_state is None or old_state == new_state:
+                continue
+
+            transition = None
+            if new_state == 'Running':
+                if old_state == 'Paused':
+                    transition = virtevent.EVENT_LIFECYCLE_RESUMED
+                else:
+                    transition = virtevent.EVENT_LIFECYCLE_STARTED
+            elif new_state == 'Paused':
+                transition = virtevent.EVENT_LIFECYCLE_PAUSED
+            elif new_state == 'Halted':
+                transition = virtevent.EVENT_LIFECYCLE_STOPPED
+            if transition is not None:
+                lifecycle_events.append(virtevent.LifecycleEvent(
+                        instance_uuid, transition))
+        return lifecycle_events
+
+    def lifecycle_events_enabled(self):
+        return self._lifecycle_events
+
     def list_instances(self):
         """List VM instances"""
         return self._vmops.list_instances()
 
+    def list_instance_power_states(self):
+        """List the power states of the VM instances, by name"""
+        return self._vmops.list_instance_power_states()
+
     def spawn(self, context, instance, image_meta, injected_files,
               admin_password, network_info=None, block_device_info=None):
         """Create VM instance"""
@@ -630,6 +721,10 @@ class XenAPISession(object):
                                           "(is the Dom0 disk full?)"))
         url = self._create_first_session(url, user, pw, exception)
         self._populate_session_pool(url, user, pw, exception)
+        self._url = url
+        self._user = user
+        self._pw = pw
+        self._event_session = None
         self.host_uuid = self._get_host_uuid()
         self.product_version, self.product_brand = \
             self._get_product_version_and_brand()
@@ -717,6 +812,26 @@ class XenAPISession(object):
         with self._get_session() as session:
             return session.xenapi_request(method, args)
 
+    def wait_for_events(self, classes, token, timeout_secs):
+        """Call event.from, which blocks until there are events or the
+        timeout expires, on a session of its own rather than one of the
+        pool."""
+        if self._event_session is None:
+            exception = self.XenAPI.Failure(_("Unable to log in to XenAPI "
+                                              "(is the Dom0 disk full?)"))
+            session = self._create_session(self._url)
+            with timeout.Timeout(FLAGS.xenapi_login_timeout, exception):
+                session.login_with_password(self._user, self._pw)
+            self._event_session = session
+        try:
+            return self._event_session.xenapi_request('event.from',
+                                                      (classes, token,
+                                                       timeout_secs))
+        except Exception:
+            # Log in again next time, in case the session is gone.
+            self._event_session = None
+            raise
+
     def call_plugin(self, plugin, fn, args):
         """Call host.call_plugin on a background thread."""
         # NOTE(johannes): Fetch host before we acquire a session. Since
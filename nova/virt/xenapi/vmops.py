@@ -166,6 +166,12 @@ class VMOps(object):
 
         return name_labels
 
+    def list_instance_power_states(self):
+        """List the power states of the VM instances, by name."""
+        return dict((vm_rec["name_label"],
+                     vm_utils.XENAPI_POWER_STATE[vm_rec["power_state"]])
+                    for vm_ref, vm_rec in vm_utils.list_vms(self._session))
+
     def confirm_migration(self, migration, instance, network_info):
         name_label = self._get_orig_vm_name_label(instance)
         vm_ref = vm_utils.lookup(self._session, name_label)
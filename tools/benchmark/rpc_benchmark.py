@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark the rpc layer.
+
+Starts a service consuming a topic the way nova services do, through an
+RpcDispatcher, and sends it --bench_messages messages of each of the
+--bench_patterns (call, multicall, cast and fanout_cast) and each of the
+--bench_payload_sizes, from --bench_concurrency green threads.
+
+--bench_backend picks the rpc backend:
+
+    fake   the in process fake driver, measuring the rpc code, the
+           dispatcher and the serialization checks without any transport.
+    zmq    the ZeroMQ driver, with the ZeroMQ receiver run in this process
+           and its sockets in a temporary directory, on --rpc_zmq_port.
+    kombu  the AMQP drivers, which need a broker, as configured by the
+    qpid   usual rabbit_* and qpid_* flags.
+
+For each pattern and payload size, the percentiles of the time each send
+took and the number of messages delivered per second are printed.  Calls
+and multicalls wait for their replies, casts only for the send, and the
+rate of casts is measured until the service received all of them.  The
+time spent serializing and deserializing messages, dispatching them and,
+with the AMQP drivers, waiting for a connection from the pool is printed
+next.  Run like:
+
+    ./tools/benchmark/rpc_benchmark.py --bench_backend=zmq \\
+        --bench_payload_sizes=0,4096 --rpc_envelope_version=2
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from eventlet import greenpool
+
+# If ../../nova/__init__.py exists, add ../../ to Python search path, so that
+# it will override what happens to be installed in /usr/(local/)lib/python...
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova import context
+from nova import flags
+from nova.openstack.common import cfg
+from nova.openstack.common import importutils
+from nova.openstack.common import log as logging
+from nova.openstack.common import rpc
+from nova.openstack.common.rpc import amqp
+from nova.openstack.common.rpc import common as rpc_common
+from nova.openstack.common.rpc import dispatcher
+
+bench_opts = [
+    cfg.StrOpt('bench_backend',
+               default='fake',
+               help='The rpc backend to benchmark: fake, zmq, kombu or '
+                    'qpid.'),
+    cfg.ListOpt('bench_patterns',
+                default=['call', 'multicall', 'cast', 'fanout_cast'],
+                help='The messaging patterns to benchmark.'),
+    cfg.ListOpt('bench_payload_sizes',
+                default=['0', '1024', '65536'],
+                help='The sizes in bytes of the payloads of the messages.'),
+    cfg.IntOpt('bench_messages',
+               default=1000,
+               help='Number of messages sent per pattern and payload size.'),
+    cfg.IntOpt('bench_concurrency',
+               default=10,
+               help='Number of green threads sending the messages.'),
+    cfg.IntOpt('bench_multicall_replies',
+               default=3,
+               help='Number of replies to each multicall.'),
+    cfg.StrOpt('bench_topic',
+               default='rpc_benchmark',
+               help='The topic consumed by the benchmarked service.'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_cli_opts(bench_opts)
+
+LOG = logging.getLogger(__name__)
+
+BACKENDS = {
+    'fake': 'nova.openstack.common.rpc.impl_fake',
+    'zmq': 'nova.openstack.common.rpc.impl_zmq',
+    'kombu': 'nova.openstack.common.rpc.impl_kombu',
+    'qpid': 'nova.openstack.common.rpc.impl_qpid',
+    }
+
+PERCENTILES = (50, 90, 99)
+
+
+class StageTimer(object):
+    """Accumulates the number of calls and the time spent per stage."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage, seconds, calls=1):
+        stats = self.stages.setdefault(stage, dict(calls=0, seconds=0.0))
+        stats['calls'] += calls
+        stats['seconds'] += seconds
+
+    def wrap(self, stage, fn):
+        """Return fn, timed as stage."""
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.time() - start)
+        return timed
+
+    def report(self):
+        lines = ['%-40s %8s %12s %12s' % ('stage', 'calls', 'total (s)',
+                                          'mean (ms)')]
+        for stage in sorted(self.stages):
+            stats = self.stages[stage]
+            mean = stats['seconds'] / max(stats['calls'], 1) * 1000
+            lines.append('%-40s %8d %12.3f %12.3f' %
+                         (stage, stats['calls'], stats['seconds'], mean))
+        return '\n'.join(lines)
+
+
+class BenchManager(object):
+    """The rpc methods of the benchmarked service."""
+
+    RPC_API_VERSION = '1.0'
+
+    def __init__(self):
+        self.received = 0
+
+    def echo(self, context, payload):
+        return payload
+
+    def stream(self, context, payload, replies):
+        for num in xrange(replies):
+            yield payload
+
+    def sink(self, context, payload):
+        self.received += 1
+
+
+def percentile(sorted_values, percent):
+    """Return the percent percentile of a sorted list of values."""
+    if not sorted_values:
+        return 0.0
+    index = int(round(percent / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def start_zmq_receiver():
+    """Run the ZeroMQ receiver, which nova-rpc-zmq-receiver runs on each
+    host, in this process.  Returns its reactor.
+    """
+    from eventlet.green import zmq
+    from nova.openstack.common.rpc import impl_zmq
+
+    reactor = impl_zmq.ZmqProxy(FLAGS)
+    consume_in = 'tcp://%s:%s' % (FLAGS.rpc_zmq_bind_address,
+                                  FLAGS.rpc_zmq_port)
+    reactor.register(impl_zmq.InternalContext(None), consume_in, zmq.PULL,
+                     out_bind=True)
+    reactor.consume_in_thread()
+    return reactor
+
+
+def instrument(timer, rpc_dispatcher):
+    """Time the serialization, the dispatch and the connection pool waits
+    of the rpc backend."""
+    impl = rpc._get_impl()
+    if FLAGS.bench_backend == 'fake':
+        impl.check_serialize = timer.wrap('serialize', impl.check_serialize)
+    elif FLAGS.bench_backend == 'zmq':
+        impl._serialize = timer.wrap('serialize', impl._serialize)
+        impl._deserialize = timer.wrap('deserialize', impl._deserialize)
+    else:
+        rpc_common.serialize_msg = timer.wrap('serialize',
+                                              rpc_common.serialize_msg)
+        rpc_common.deserialize_msg = timer.wrap('deserialize',
+                                                rpc_common.deserialize_msg)
+        amqp.Pool.get = timer.wrap('connection pool wait', amqp.Pool.get)
+    rpc_dispatcher.dispatch = timer.wrap('dispatch', rpc_dispatcher.dispatch)
+
+
+def build_msg(pattern, payload):
+    if pattern == 'call':
+        return {'method': 'echo', 'args': {'payload': payload}}
+    if pattern == 'multicall':
+        return {'method': 'stream',
+                'args': {'payload': payload,
+                         'replies': FLAGS.bench_multicall_replies}}
+    return {'method': 'sink', 'args': {'payload': payload}}
+
+
+def run(ctxt, manager, pattern, payload_size):
+    """Send the messages of a pattern, and return the time each send took
+    and the time all of them took to be delivered."""
+    send = getattr(rpc, pattern)
+    msg = build_msg(pattern, 'x' * payload_size)
+    latencies = []
+
+    def _send(num):
+        start = time.time()
+        result = send(ctxt, FLAGS.bench_topic, msg)
+        if pattern == 'multicall':
+            list(result)
+        latencies.append(time.time() - start)
+
+    manager.received = 0
+    pool = greenpool.GreenPool(FLAGS.bench_concurrency)
+    start = time.time()
+    for num in xrange(FLAGS.bench_messages):
+        pool.spawn_n(_send, num)
+    pool.waitall()
+    if pattern in ('cast', 'fanout_cast'):
+        deadline = start + FLAGS.rpc_response_timeout
+        while (manager.received < FLAGS.bench_messages and
+               time.time() < deadline):
+            eventlet.sleep(0.01)
+    elapsed = time.time() - start
+    return sorted(latencies), elapsed
+
+
+def main():
+    flags.parse_args(sys.argv)
+    logging.setup('nova')
+    try:
+        FLAGS.set_default('rpc_backend', BACKENDS[FLAGS.bench_backend])
+    except KeyError:
+        print 'Unknown backend %s' % FLAGS.bench_backend
+        return 1
+
+    ipc_dir = None
+    if FLAGS.bench_backend == 'zmq':
+        importutils.import_module(BACKENDS['zmq'])
+        ipc_dir = tempfile.mkdtemp()
+        FLAGS.set_default('rpc_zmq_ipc_dir', ipc_dir)
+        receiver = start_zmq_receiver()
+
+    ctxt = context.get_admin_context()
+    manager = BenchManager()
+    conn = rpc.create_connection(new=True)
+    rpc_dispatcher = dispatcher.RpcDispatcher([manager])
+    conn.create_consumer(FLAGS.bench_topic, rpc_dispatcher, fanout=False)
+    conn.create_consumer(FLAGS.bench_topic, rpc_dispatcher, fanout=True)
+    conn.consume_in_thread()
+
+    # Wait for the consumers to be ready.
+    rpc.call(ctxt, FLAGS.bench_topic, build_msg('call', ''))
+
+    timer = StageTimer()
+    instrument(timer, rpc_dispatcher)
+
+    print 'Sending %d messages from %d green threads through %s' % (
+            FLAGS.bench_messages, FLAGS.bench_concurrency, FLAGS.rpc_backend)
+    print
+    print '%-12s %8s %10s %10s %10s %10s %10s' % (
+            'pattern', 'bytes', 'msgs/s', 'p50 (ms)', 'p90 (ms)',
+            'p99 (ms)', 'max (ms)')
+    try:
+        for pattern in FLAGS.bench_patterns:
+            for payload_size in FLAGS.bench_payload_sizes:
+                latencies, elapsed = run(ctxt, manager, pattern,
+                                         int(payload_size))
+                rate = FLAGS.bench_messages / elapsed if elapsed else 0.0
+                print '%-12s %8s %10.1f %10.3f %10.3f %10.3f %10.3f' % (
+                        (pattern, payload_size, rate) +
+                        tuple(percentile(latencies, percent) * 1000
+                              for percent in PERCENTILES) +
+                        (latencies[-1] * 1000,))
+    finally:
+        conn.close()
+        if ipc_dir:
+            receiver.close()
+            shutil.rmtree(ipc_dir, ignore_errors=True)
+
+    print
+    print timer.report()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
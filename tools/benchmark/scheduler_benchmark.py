@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark the filter scheduler against a synthetic fleet.
+
+Builds a sqlite database with --bench_hosts compute nodes, sized from what
+the fake virt driver reports, and replays a trace of boot requests through
+the filter scheduler.  Each boot request is scheduled the way nova-scheduler
+would schedule it, including the db updates and the run_instance casts,
+which go to the fake rpc backend.
+
+The trace is a file with one JSON boot request per line:
+
+    {"instance_type": "m1.small", "num_instances": 2}
+
+Without --bench_trace, --bench_requests random single instance boot requests
+for the default instance types are replayed.
+
+When done, the time spent in each stage of scheduling is printed: loading
+the host states, each filter, each cost function and provisioning the
+instances.  The filters and cost functions are configured by the usual
+scheduler flags.  Run like:
+
+    ./tools/benchmark/scheduler_benchmark.py --bench_hosts=1000 \\
+        --scheduler_default_filters=RamFilter,ComputeFilter
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import functools
+import os
+import random
+import sys
+import time
+
+# If ../../nova/__init__.py exists, add ../../ to Python search path, so that
+# it will override what happens to be installed in /usr/(local/)lib/python...
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova.compute import instance_types
+from nova.compute import task_states
+from nova.compute import vm_states
+from nova import context
+from nova import db
+from nova.db import migration
+from nova import flags
+from nova.openstack.common import cfg
+from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
+from nova.scheduler import filter_scheduler
+from nova.virt import fake
+
+bench_opts = [
+    cfg.IntOpt('bench_hosts',
+               default=100,
+               help='Number of compute hosts in the synthetic fleet.'),
+    cfg.IntOpt('bench_requests',
+               default=1000,
+               help='Number of boot requests to replay when no trace is '
+                    'given.'),
+    cfg.StrOpt('bench_trace',
+               default=None,
+               help='File with the boot requests to replay, one JSON '
+                    'object per line.'),
+    cfg.IntOpt('bench_seed',
+               default=0,
+               help='Seed for the random fleet and trace.'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_cli_opts(bench_opts)
+
+LOG = logging.getLogger(__name__)
+
+# Hosts are made up of 1, 2 or 4 of what the fake driver reports.
+HOST_SIZES = (1, 2, 4)
+
+DEFAULT_INSTANCE_TYPES = ('m1.tiny', 'm1.small', 'm1.medium', 'm1.large')
+
+
+class StageTimer(object):
+    """Accumulates the number of calls and the time spent per stage."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage, seconds, calls=1):
+        stats = self.stages.setdefault(stage, dict(calls=0, seconds=0.0))
+        stats['calls'] += calls
+        stats['seconds'] += seconds
+
+    def wrap(self, stage, fn):
+        """Return fn, timed as stage."""
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.time() - start)
+        return timed
+
+    def report(self):
+        lines = ['%-40s %8s %12s %12s' % ('stage', 'calls', 'total (s)',
+                                          'mean (ms)')]
+        for stage in sorted(self.stages):
+            stats = self.stages[stage]
+            mean = stats['seconds'] / max(stats['calls'], 1) * 1000
+            lines.append('%-40s %8d %12.3f %12.3f' %
+                         (stage, stats['calls'], stats['seconds'], mean))
+        return '\n'.join(lines)
+
+
+def create_fleet(ctxt, num_hosts, host_manager):
+    """Create the services and compute nodes of the synthetic fleet and
+    report the capabilities of each host to host_manager.
+    """
+    driver = fake.FakeDriver()
+    capabilities = driver.get_host_stats()
+    for num in xrange(num_hosts):
+        host = 'host%05d' % num
+        service = db.service_create(ctxt, dict(host=host,
+                                               binary='nova-compute',
+                                               topic=FLAGS.compute_topic,
+                                               report_count=0,
+                                               disabled=False))
+        resources = driver.get_available_resource()
+        size = random.choice(HOST_SIZES)
+        for key in ('vcpus', 'memory_mb', 'local_gb'):
+            resources[key] *= size
+        resources.update(service_id=service['id'],
+                         free_ram_mb=resources['memory_mb'],
+                         free_disk_gb=resources['local_gb'],
+                         disk_available_least=resources['local_gb'],
+                         running_vms=0, current_workload=0)
+        db.compute_node_create(ctxt, resources)
+        host_manager.update_service_capabilities('compute', host,
+                                                 capabilities)
+
+
+def load_trace():
+    """Return the list of boot requests to replay."""
+    if FLAGS.bench_trace:
+        with open(FLAGS.bench_trace) as trace:
+            return [jsonutils.loads(line) for line in trace if line.strip()]
+    return [dict(instance_type=random.choice(DEFAULT_INSTANCE_TYPES),
+                 num_instances=1)
+            for num in xrange(FLAGS.bench_requests)]
+
+
+def build_request_spec(ctxt, boot_request):
+    """Create the instances of a boot request in the db, as the compute
+    API does, and return the request spec for scheduling them.
+    """
+    instance_type = instance_types.get_instance_type_by_name(
+            boot_request.get('instance_type'), ctxt=ctxt)
+    base_options = {'image_ref': boot_request.get('image_ref', ''),
+                    'vm_state': vm_states.BUILDING,
+                    'task_state': task_states.SCHEDULING,
+                    'user_id': ctxt.user_id,
+                    'project_id': boot_request.get('project_id',
+                                                   ctxt.project_id),
+                    'instance_type_id': instance_type['id'],
+                    'memory_mb': instance_type['memory_mb'],
+                    'vcpus': instance_type['vcpus'],
+                    'root_gb': instance_type['root_gb'],
+                    'ephemeral_gb': instance_type['ephemeral_gb'],
+                    'os_type': boot_request.get('os_type', 'linux'),
+                    'availability_zone': boot_request.get(
+                            'availability_zone')}
+    instance_uuids = []
+    for num in xrange(boot_request.get('num_instances', 1)):
+        instance = db.instance_create(ctxt, base_options)
+        instance_uuids.append(instance['uuid'])
+    return {'image': {},
+            'instance_properties': base_options,
+            'instance_type': instance_type,
+            'instance_uuids': instance_uuids,
+            'num_instances': len(instance_uuids),
+            'block_device_mapping': [],
+            'security_group': ['default']}
+
+
+def instrument(scheduler, timer):
+    """Time the stages of scheduler."""
+    host_manager = scheduler.host_manager
+    host_manager.get_all_host_states = timer.wrap('host state load',
+            host_manager.get_all_host_states)
+
+    orig_run_filter = host_manager._run_filter
+
+    def run_filter(filter_obj, hosts, filter_properties):
+        return timer.wrap('filter %s' % filter_obj.__class__.__name__,
+                          orig_run_filter)(filter_obj, hosts,
+                                           filter_properties)
+    host_manager._run_filter = run_filter
+
+    cost_functions = [(weight, timer.wrap('cost %s' % fn.__name__, fn))
+                      for weight, fn in scheduler.get_cost_functions()]
+    scheduler.cost_function_cache['compute'] = cost_functions
+
+    scheduler._schedule = timer.wrap('schedule', scheduler._schedule)
+    scheduler._provision_resources = timer.wrap('provisioning',
+            scheduler._provision_resources)
+    scheduler._provision_resources_by_host = timer.wrap('provisioning',
+            scheduler._provision_resources_by_host)
+
+
+def main():
+    flags.parse_args(sys.argv)
+    logging.setup('nova')
+    FLAGS.set_default('sql_connection', 'sqlite://')
+    FLAGS.set_default('rpc_backend', 'nova.openstack.common.rpc.impl_fake')
+    random.seed(FLAGS.bench_seed)
+
+    print 'Creating the db and %d compute hosts' % FLAGS.bench_hosts
+    migration.db_sync()
+    ctxt = context.get_admin_context()
+    scheduler = filter_scheduler.FilterScheduler()
+    create_fleet(ctxt, FLAGS.bench_hosts, scheduler.host_manager)
+    trace = load_trace()
+
+    timer = StageTimer()
+    instrument(scheduler, timer)
+
+    print 'Replaying %d boot requests' % len(trace)
+    scheduled = 0
+    failed = 0
+    elapsed = 0.0
+    for boot_request in trace:
+        request_spec = build_request_spec(ctxt, boot_request)
+        start = time.time()
+        scheduler.schedule_run_instance(ctxt, request_spec,
+                admin_password=None, injected_files=None,
+                requested_networks=None, is_first_time=True,
+                filter_properties={})
+        elapsed += time.time() - start
+        for instance_uuid in request_spec['instance_uuids']:
+            instance = db.instance_get_by_uuid(ctxt, instance_uuid)
+            if instance['host']:
+                scheduled += 1
+            else:
+                failed += 1
+
+    print
+    print timer.report()
+    print
+    print 'Scheduled %d instances, %d failed' % (scheduled, failed)
+    print '%.3f seconds, %.1f requests per second' % (
+            elapsed, len(trace) / elapsed if elapsed else 0.0)
+
+
+if __name__ == '__main__':
+    main()